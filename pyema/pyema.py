@@ -1,65 +1,66 @@
 # TODO: use pandas
 # TODO: 表機能
 # TODO: ワイオミング大のpdfをそのまま表示
-# TODO: 乾燥断熱線，湿潤断熱線, LCL
-import numpy as np
-import japanize_matplotlib
-import matplotlib.pyplot as plt
-from bs4 import BeautifulSoup
-import requests
-import pyema_util
-
-# ラジオゾンデ観測データ(Wyoming大学; text形式)の先頭スキップ数
-SKIP_LINE_SONDE_TXT    = 4
-# ラジオゾンデ観測データ(Wyoming大学; text形式)の1行のカラム数
-N_COLUMN_SONDE_TXT     = 11
-# ラジオゾンデ観測データ(Wyoming大学; text形式)の1カラムの文字数
-WORDS_COLUMN_SONDE_TXT = 7
-# ラジオゾンデ観測データ(tWyoming大学; ext形式)の1行の文字数
-WORDS_LINE_SONDE_TXT   = N_COLUMN_SONDE_TXT * WORDS_COLUMN_SONDE_TXT
-
-
-class SondeData:
-    """
-    @brief:
-      ラジオゾンデ観測データの構造体(structure of ndarrays)
-    """
-    pass
+# matplotlib(描画)・requests(取得)は使用する時に読み込みます (データ処理だけの利用や起動を速くするため)
+from pyema_climate import Climatology
+from pyema_cache import SondeCache, get_default_cache, obs_datetime
+from pyema_index import SondeIndex, get_default_index
+from pyema_sonde import SondeData, parse_sonde
+from pyema_trace import PipelineTrace, create_trace, trace_stage
 
 
-def __get_emagram_text(station: str, obs_time: str) -> tuple:
+def __get_emagram_text(station: str, obs_time: dict, cache: SondeCache = None, verbose: bool = True,
+                       trace: PipelineTrace = None, session=None, timeout=None) -> tuple:
     """
     @brief:
       ラジオゾンデ観測データを取得します(text形式)
+      応答のないサーバーで読み出しが止まらないよう，タイムアウトは常に設定します
+    @param session: セッション (Noneの場合は既定のセッション)
+    @param timeout: タイムアウト [s] (Noneの場合はpyema_fetch.DEFAULT_TIMEOUT)
     """
-    # エマグラムのtextデータ(ワイオミング大学)
-    url_emagram = 'http://weather.uwyo.edu/cgi-bin/sounding?region=seasia&TYPE=TEXT%3ALIST&YEAR=' \
-                  + obs_time['year'] + '&MONTH=' + obs_time['month'] + '&FROM=' + obs_time['time'] \
-                  + '&TO=' + obs_time['time'] + '&STNM=' + station
+    import pyema_fetch
 
-    # エコー
-    print('[URL        ] ' + url_emagram)
+    if session is None:
+        session = pyema_fetch.get_default_session()
+    if timeout is None:
+        timeout = pyema_fetch.DEFAULT_TIMEOUT
 
-    # Webサイトにgetリクエストで送信し情報を取得
-    r = requests.get(url_emagram)
+    # HTTPレスポンスボディを取得 (キャッシュ優先)
+    html = pyema_fetch.fetch_emagram_html(station, obs_time, cache, session, timeout, verbose, trace)
 
-    # HTTPレスポンスボディを取得
-    html = r.text
+    # タイトル・ラジオゾンデ観測データ抽出(最初の<h2>タグ・<pre>タグ)
+    with trace_stage(trace, 'extract', chars=len(html)) as info:
+        blocks = pyema_fetch.split_emagram_html(html)
+        info['blocks'] = len(blocks)
+    if len(blocks) <= 0:
+        raise ValueError('no sounding data: ' + station)
+    title, sonde_txt = blocks[0]
 
-    # BeautifulSoupオブジェクトの生成
-    soup = BeautifulSoup(html, 'html.parser')
+    # エコー
+    if verbose:
+        print('[Title      ] ' + title)
+        print('\n'.join(sonde_txt))
+
+    return title, sonde_txt
 
-    # タイトル抽出
-    title = soup.find(name='h2').get_text()
 
-    # ラジオゾンデ観測データ取得(最初の<pre>タグ取得)
-    data = soup.find(name='pre').get_text()
+def __load_local_sonde(station: str, obs_time: dict, index: SondeIndex, verbose: bool = True):
+    """
+    @brief:
+      ローカルのアーカイブからラジオゾンデ観測データを読み出します
+    @return: SondeData (索引にない場合はNone)
+    """
+    try:
+        sonde_data = index.load(station, obs_datetime(obs_time['year'], obs_time['month'], obs_time['time']))
+    except (OSError, IndexError, ValueError):
+        # アーカイブが削除・移動・破損した場合は取得し直す
+        sonde_data = None
 
     # エコー
-    print('[Title      ] ' + title)
-    print(data)
+    if verbose and sonde_data is not None:
+        print('[Archive    ] ' + sonde_data.title)
 
-    return title, data.splitlines()
+    return sonde_data
 
 
 def __parse_emagram_text(title: str, sonde_txt: list) -> SondeData:
@@ -67,200 +68,193 @@ def __parse_emagram_text(title: str, sonde_txt: list) -> SondeData:
     @brief:
       ラジオゾンデ観測データ(text形式)をパースしてndarray形式で保存します
     """
-    pres_lst    = []  # 気圧 [hPa]
-    height_lst  = []  # ジオポテンシャル高度 [m]
-    temp_lst    = []  # 温度 [C]
-    dewtemp_lst = []  # 露点温度 [C]
-    mixr_lst    = []  # 混合比 [g/kg]
-    theta_lst   = []  # 温位 [K]
-    theta_e_lst = []  # 相当温位 [K]
-    vtheta_lst  = []  # 仮温位 [K]
-
-    for i_line, s_line in enumerate(sonde_txt):
-        # 先頭行スキップ
-        if i_line <= SKIP_LINE_SONDE_TXT:
-            continue
-        # 空行スキップ
-        if len(s_line) <= 0:
-            continue
-        # 文字数が異なる場合はエラー
-        if len(s_line) != WORDS_LINE_SONDE_TXT:
-            raise
-
-        # パース
-        idx_st = 0
-        work = []
-        for i in range(N_COLUMN_SONDE_TXT):
-            idx_en = idx_st + WORDS_COLUMN_SONDE_TXT
-            work.append(s_line[idx_st:idx_en])
-            idx_st += WORDS_COLUMN_SONDE_TXT
-
-        # 気温が記録されていない高度はスキップ
-        if len(work[2].strip()) <= 0:
-            continue
-
-        # リストに追加
-        if len(work[0].strip()) > 0:
-            pres_lst.append(float(work[0]))
-        if len(work[1].strip()) > 0:
-            height_lst.append(float(work[1]))
-        if len(work[2].strip()) > 0:
-            temp_lst.append(float(work[2]))
-        if len(work[3].strip()) > 0:
-            dewtemp_lst.append(float(work[3]))
-        if len(work[5].strip()) > 0:
-            mixr_lst.append(float(work[5]))
-        if len(work[8].strip()) > 0:
-            theta_lst.append(float(work[8]))
-        if len(work[9].strip()) > 0:
-            theta_e_lst.append(float(work[9]))
-        if len(work[10].strip()) > 0:
-            vtheta_lst.append(float(work[10]))
-
-    # python list => numpy ndarray
-    sonde_data = SondeData()
-    sonde_data.title   = title.strip()
-    sonde_data.pres    = np.array(pres_lst   , dtype=np.float64)
-    sonde_data.height  = np.array(height_lst , dtype=np.float64)
-    sonde_data.temp    = np.array(temp_lst   , dtype=np.float64)
-    sonde_data.dewtemp = np.array(dewtemp_lst, dtype=np.float64)
-    sonde_data.mixr    = np.array(mixr_lst   , dtype=np.float64)
-    sonde_data.theta   = np.array(theta_lst  , dtype=np.float64)
-    sonde_data.theta_e = np.array(theta_e_lst, dtype=np.float64)
-    sonde_data.vtheta  = np.array(vtheta_lst , dtype=np.float64)
-
-    return sonde_data
+    return parse_sonde(title, sonde_txt)
 
 
-def __plot_emagram(sonde_data: SondeData, param: dict) -> None:
+def __plot_emagram(sonde_data: SondeData, param: dict, trace: PipelineTrace = None) -> None:
     """
     @brief:
       ラジオゾンデ観測データ(ndarray形式)からエマグラムを図化します
     """
-    if   param['axis_h']['type'] == 't':
-        # 図化
-        __plot_emagram_temperature(sonde_data, param)
-    elif param['axis_h']['type'] == 'pt':
-        # 飽和相当温位算出
-        __calc_theta_es(sonde_data)
+    import matplotlib.pyplot as plt
+    import pyema_plot
+
+    with trace_stage(trace, 'render', rows=len(sonde_data)):
+        fig, ax = plt.subplots()
+
         # 図化
-        __plot_emagram_theta(sonde_data, param)
-    else:
-        raise
+        pyema_plot.draw_emagram(ax, sonde_data, param)
 
+        # 計測時は表示の待ち時間を含めないよう，ここで描画まで済ませる
+        if trace is not None:
+            fig.canvas.draw()
+
+    plt.show()
 
-def __plot_emagram_temperature(sonde_data: SondeData, param: dict) -> None:
+
+def __get_climatology_profile(clim, obs_time: dict) -> dict:
     """
     @brief:
-      ラジオゾンデ観測データ(ndarray形式)からエマグラムを図化します
+      観測月の気候値の鉛直分布を求めます
     """
-    fig, ax = plt.subplots()
-
-    if   param['axis_v']['type'] == 'p':
-        ax.plot(sonde_data.temp   , sonde_data.pres[0:len(sonde_data.temp)   ],
-                color='k', linestyle='solid' , linewidth=2, label='気温'    )
-        ax.plot(sonde_data.dewtemp, sonde_data.pres[0:len(sonde_data.dewtemp)],
-                color='b', linestyle='dashed', linewidth=2, label='露点温度')
-        plt.ylabel('気圧 [hPa]', fontsize=12)
-        ax.invert_yaxis()
-    elif param['axis_v']['type'] == 'z':
-        ax.plot(sonde_data.temp   , sonde_data.height[0:len(sonde_data.temp)   ],
-                color='k', linestyle='solid' , linewidth=2, label='気温'    )
-        ax.plot(sonde_data.dewtemp, sonde_data.height[0:len(sonde_data.dewtemp)],
-                color='b', linestyle='dashed', linewidth=2, label='露点温度')
-        plt.ylabel('高度 [m]', fontsize=12)
-    else:
-        raise
-
-    plt.title(sonde_data.title  , fontsize=12)
-    plt.xlabel('気温 [C]', fontsize=12)
-
-    ax.set_xlim(param['axis_h']['limit'])
-    ax.set_ylim(param['axis_v']['limit'])
-
-    plt.grid(color='gray', ls=':')
-    plt.legend(loc='best')
-    plt.show()
+    if isinstance(clim, str):
+        clim = Climatology.load(clim)
+    return clim.profile(int(obs_time['month']))
 
 
-def __plot_emagram_theta(sonde_data: SondeData, param: dict) -> None:
+def load_sonde(param: dict, progress=None, trace: PipelineTrace = None) -> SondeData:
     """
     @brief:
-      ラジオゾンデ観測データ(ndarray形式)から温位エマグラムを図化します
+      ラジオゾンデ観測データを読み出します (ローカルのアーカイブ => キャッシュ => 取得の順)
+      GUIのワーカースレッドからも呼び出せるよう，描画は行いません
+    @param param: run_pyemaと同じ
+                  (取得時のparam['session'](requests.Session), param['timeout'](タイムアウト [s])も指定できます;
+                   既定はpyema_fetch.get_default_session(), pyema_fetch.DEFAULT_TIMEOUT)
+    @param progress: 進捗の通知先 progress(進捗 [%], メッセージ) (例外を送出すると処理を中断します)
+    @param trace: 処理段階の計測 (source, archive, cache, http, extract, parse; Noneの場合は計測しない)
+    @return: ラジオゾンデ観測データ
     """
-    fig, ax = plt.subplots()
+    verbose = param.get('verbose', True)
+
+    # 取得元の指定 (param['source']: pyema_source.SondeSource; 指定した場合はアーカイブ・キャッシュ・取得を使わない)
+    source = param.get('source')
+    if source is not None:
+        __notify(progress, 10, '観測データを読み出し中')
+        with trace_stage(trace, 'source', source=type(source).__name__) as info:
+            sonde_data = source.load(param['station'], obs_datetime(param['obs_time']['year'],
+                                                                    param['obs_time']['month'],
+                                                                    param['obs_time']['time']))
+            info['rows'] = 0 if sonde_data is None else len(sonde_data)
+        if sonde_data is None:
+            raise ValueError('no sounding data: ' + param['station'])
+        __notify(progress, 100, '完了')
+        return sonde_data
+
+    # ローカルのアーカイブの索引 (既定で有効; 索引にある観測は取得・パースを省略)
+    sonde_data = None
+    if param.get('archive', True):
+        __notify(progress, 0, 'アーカイブを検索中')
+        with trace_stage(trace, 'archive') as info:
+            sonde_data = __load_local_sonde(param['station'], param['obs_time'], get_default_index(), verbose)
+            info['hit'] = sonde_data is not None
+
+    if sonde_data is None:
+        # ラジオゾンデ観測データのキャッシュ (既定で有効)
+        cache = get_default_cache() if param.get('cache', True) else None
 
-    if   param['axis_v']['type'] == 'p':
-        ax.plot(sonde_data.theta   , sonde_data.pres[0:len(sonde_data.temp)    ],
-                color='k', linestyle='solid' , linewidth=2, label='温位'        )
-        ax.plot(sonde_data.theta_e , sonde_data.pres[0:len(sonde_data.theta_e) ],
-                color='b', linestyle='dashed', linewidth=2, label='相当温位'    )
-        ax.plot(sonde_data.theta_es, sonde_data.pres[0:len(sonde_data.theta_es)],
-                color='r', linestyle='dotted', linewidth=2, label='飽和相当温位')
-        plt.ylabel('気圧 [hPa]', fontsize=12)
-        ax.invert_yaxis()
-    elif param['axis_v']['type'] == 'z':
-        ax.plot(sonde_data.theta   , sonde_data.height[0:len(sonde_data.temp)    ],
-                color='k', linestyle='solid' , linewidth=2, label='温位'        )
-        ax.plot(sonde_data.theta_e , sonde_data.height[0:len(sonde_data.theta_e) ],
-                color='b', linestyle='dashed', linewidth=2, label='相当温位'    )
-        ax.plot(sonde_data.theta_es, sonde_data.height[0:len(sonde_data.theta_es)],
-                color='r', linestyle='dotted', linewidth=2, label='飽和相当温位')
-        plt.ylabel('高度 [m]', fontsize=12)
-    else:
-        raise
-
-    plt.title(sonde_data.title, fontsize=12)
-    plt.xlabel('温位 [K]', fontsize=12)
-
-    ax.set_xlim(param['axis_h']['limit'])
-    ax.set_ylim(param['axis_v']['limit'])
-
-    plt.grid(color='gray', ls=':')
-    plt.legend(loc='best')
-    plt.show()
+        # ラジオゾンデ観測データ取得(text形式)
+        __notify(progress, 10, '観測データを取得中')
+        title, sonde_txt = __get_emagram_text(param['station'], param['obs_time'], cache, verbose, trace,
+                                              param.get('session'), param.get('timeout'))
+
+        # ラジオゾンデ観測データ(text形式)をパースしてndarray形式で保存
+        __notify(progress, 70, '観測データをパース中')
+        with trace_stage(trace, 'parse') as info:
+            sonde_data = __parse_emagram_text(title, sonde_txt)
+            info['rows'] = len(sonde_data)
 
+    __notify(progress, 100, '完了')
 
-def __calc_theta_es(sonde_data: SondeData):
+    return sonde_data
+
+
+def __notify(progress, percent: int, message: str) -> None:
+    # 進捗の通知
+    if progress is not None:
+        progress(percent, message)
+
+
+def plot_emagram(sonde_data: SondeData, param: dict, trace: PipelineTrace = None) -> None:
     """
     @brief:
-      飽和相当温位θe*(t,p)[K]を求めます
+      読み出し済みのラジオゾンデ観測データからエマグラムを図化します
+    @param trace: 処理段階の計測 (derive, render; Noneの場合は計測しない)
     """
-    # 絶対温度 [K]
-    t = sonde_data.temp[0:len(sonde_data.theta_e)] + 273.15
+    # 気候値の重ね描き (param['climatology']: Climatology.saveで保存したファイル または Climatology)
+    if isinstance(param.get('climatology'), (str, Climatology)):
+        with trace_stage(trace, 'derive', quantity='climatology'):
+            param = dict(param, climatology=__get_climatology_profile(param['climatology'], param['obs_time']))
 
-    # 気圧 [hPa]
-    p = sonde_data.pres[0:len(sonde_data.theta_e)]
+    # 飽和相当温位算出 (横軸が温位の場合; 計算済みならSondeDataのキャッシュを使う)
+    if param['axis_h']['type'] == 'pt' and not sonde_data.is_cached('theta_es'):
+        with trace_stage(trace, 'derive', quantity='theta_es', rows=len(sonde_data)):
+            sonde_data.theta_es
 
-    # 混合比 [g/kg]
-    mixr = sonde_data.mixr[0:len(sonde_data.theta_e)]
-    mixr = mixr / 1000.0  # 単位換算 [g/kg] -> [kg/kg]
+    # ラジオゾンデ観測データ(ndarray形式)からエマグラムを図化
+    __plot_emagram(sonde_data, param, trace)
 
-    # 水蒸気圧 [hPa]
-    e = pyema_util.calc_e(mixr, p)
 
-    # 飽和相当温位 [K]
-    sonde_data.theta_es = pyema_util.calc_theta_es(t, p, e)
+def __echo_trace(trace: PipelineTrace) -> None:
+    # 処理段階毎の所要時間のエコー
+    for name, elapsed in trace.summary().items():
+        print('[Trace      ] ' + name.ljust(8) + ': ' + '{:8.1f}'.format(elapsed * 1000.0) + ' ms')
 
 
 def run_pyema(param: dict):
     """
     @brief:
       main関数
+      param['trace'](フック関数), param['trace_log'](JSON Lines), param['profile'](cProfile)を指定すると
+      処理段階(取得・パース・派生量の算出・描画)毎の所要時間・データ量を記録します (pyema_trace)
     """
-    try:
-        # ラジオゾンデ観測データ取得(text形式)
-        title, sonde_txt = __get_emagram_text(param['station'], param['obs_time'])
+    trace = create_trace(param)
 
-        # ラジオゾンデ観測データ(text形式)をパースしてndarray形式で保存
-        sonde_data = __parse_emagram_text(title, sonde_txt)
+    try:
+        # ラジオゾンデ観測データ取得・パース
+        sonde_data = load_sonde(param, trace=trace)
 
         # ラジオゾンデ観測データ(ndarray形式)からエマグラムを図化
-        __plot_emagram(sonde_data, param)
+        plot_emagram(sonde_data, param, trace)
 
     except Exception as e:
         raise e
 
+    finally:
+        if trace is not None:
+            trace.close()
+            if param.get('verbose', True):
+                __echo_trace(trace)
+
+
+def __plot_section(section: dict, param: dict) -> None:
+    """
+    @brief:
+      時間高度断面を図化します
+    """
+    import matplotlib.pyplot as plt
+    import pyema_section
+
+    fig, ax = plt.subplots()
+
+    # 図化
+    pyema_section.draw_section(ax, section, param.get('var', 'theta_e'), param.get('kind', 'pcolormesh'))
+    ax.set_title(param['station'])
+
+    plt.show()
+
+
+def run_section(param: dict):
+    """
+    @brief:
+      時間高度断面図のmain関数
+      param['time_from'], param['time_to']の観測時刻はrun_pyemaのparam['obs_time']と同じ形式です
+    """
+    import pyema_section
+
+    time_from = obs_datetime(param['time_from']['year'], param['time_from']['month'], param['time_from']['time'])
+    time_to   = obs_datetime(param['time_to'  ]['year'], param['time_to'  ]['month'], param['time_to'  ]['time'])
+
+    # 時間高度断面 (取得元の指定がなければ，索引にある観測はアーカイブから読み出し)
+    index   = get_default_index() if param.get('archive', True) and param.get('source') is None else None
+    section = pyema_section.load_section(param['station'], time_from, time_to, param['axis_v']['type'],
+                                         param['axis_v'].get('levels'), index=index, source=param.get('source'),
+                                         verbose=param.get('verbose', True))
+    if section['time'].size <= 0:
+        raise ValueError('no sounding data: ' + param['station'])
+
+    # 時間高度断面を図化
+    __plot_section(section, param)
+
 
 if __name__ == '__main__':
     print("++++++++++ pyema (Emagram tools for python) ++++++++++")
@@ -0,0 +1,355 @@
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime, timezone
+import numpy as np
+import pyema_parser
+from pyema_sonde import SondeData, parse_title
+
+# アーカイブの形式のバージョン (1: セグメントなし(ディレクトリ直下に1組のファイル), 2: セグメントの追記)
+ARCHIVE_VERSION = 2
+# 観測データのカラム名 (pyema_parserのカラム番号順; ファイル名にもなります)
+COLUMN_NAME = ('pres', 'height', 'temp', 'dewtemp', 'relh', 'mixr', 'drct', 'sknt', 'theta', 'theta_e', 'vtheta')
+# 観測毎の索引の名前 (観測地点番号, 観測時刻, タイトル, 観測データの開始位置)
+INDEX_NAME = ('station', 'time', 'title', 'offset')
+# メタデータのファイル名
+META_FILE = 'meta.json'
+# セグメントのディレクトリ名の接頭辞
+SEGMENT_PREFIX = 'seg-'
+
+
+def to_datetime64(dt: datetime) -> np.datetime64:
+    """
+    @brief:
+      datetimeをnumpyのdatetime64(UTC; 秒単位)に変換します (タイムゾーンなしはUTCとみなします)
+    """
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return np.datetime64(dt, 's')
+
+
+def __read_meta(path: str):
+    # メタデータ (アーカイブがない場合はNone)
+    try:
+        with open(os.path.join(path, META_FILE), encoding='utf-8') as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    if meta['version'] not in (1, ARCHIVE_VERSION):
+        raise ValueError('unsupported archive version: ' + str(meta['version']))
+    # バージョン1はディレクトリ直下を1つのセグメントとみなす
+    meta.setdefault('segments', [''])
+    return meta
+
+
+def __write_meta(path: str, meta: dict) -> None:
+    # 一時ファイルに書き込んでから置き換え (アーカイブの切り替えはこの1回のrenameだけで行う)
+    tmp = os.path.join(path, META_FILE + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(path, META_FILE))
+
+
+def __write_segment(path: str, sonde_list) -> tuple:
+    # 1つのセグメント(カラム毎・索引毎の.npyファイル)を書き込み (観測地点・観測時刻順; 同じ観測は後勝ち)
+    records = {}
+    for sonde_data in sonde_list:
+        station, dt = parse_title(sonde_data.title)
+        records[(station, to_datetime64(dt))] = sonde_data
+
+    keys      = sorted(records)
+    sonde_all = [records[key] for key in keys]
+
+    # 索引
+    n_level = np.array([len(sonde_data) for sonde_data in sonde_all], dtype=np.int64)
+    index = {
+        'station': np.array([key[0] for key in keys], dtype=np.str_),
+        'time'   : np.array([key[1] for key in keys], dtype='datetime64[s]'),
+        'title'  : np.array([sonde_data.title for sonde_data in sonde_all], dtype=np.str_),
+        'offset' : np.concatenate([[0], np.cumsum(n_level)]).astype(np.int64)
+    }
+
+    # 観測データ [カラム, 全観測の高度] (カラム毎に連続)
+    if len(sonde_all) > 0:
+        data = np.concatenate([sonde_data.data for sonde_data in sonde_all], axis=1)
+    else:
+        data = np.empty((pyema_parser.N_COLUMN_SONDE_TXT, 0), dtype=np.float64)
+
+    os.makedirs(path)
+    for name in INDEX_NAME:
+        np.save(os.path.join(path, name + '.npy'), index[name], allow_pickle=False)
+    for i_col, name in enumerate(COLUMN_NAME):
+        np.save(os.path.join(path, name + '.npy'), data[i_col], allow_pickle=False)
+
+    return len(sonde_all), int(data.shape[1])
+
+
+def __remove_segment(path: str, segment: str) -> None:
+    # セグメントを削除 (バージョン1のディレクトリ直下のファイルを含む; 読み出し中で削除できない場合は残す)
+    if len(segment) > 0:
+        shutil.rmtree(os.path.join(path, segment), ignore_errors=True)
+        return
+    for name in INDEX_NAME + COLUMN_NAME:
+        try:
+            os.remove(os.path.join(path, name + '.npy'))
+        except OSError:
+            pass
+
+
+def write_archive(path: str, sonde_list, append: bool = True, index=None) -> int:
+    """
+    @brief:
+      パース済みのラジオゾンデ観測データをカラム指向のアーカイブに保存します
+      アーカイブはディレクトリで，保存の度に1つのセグメント(サブディレクトリ)を追加します
+        - セグメントはカラム毎・索引毎に1つの.npyファイルからなり，作成後は変更しません
+          観測データ: 全観測の高度を連結した1次元配列 (カラム毎)
+          索引: 観測地点番号, 観測時刻, タイトル, 観測データの開始位置 (観測毎; 観測地点・観測時刻順)
+        - meta.jsonがセグメントの一覧を持ち，新しいセグメントを書き終えてからmeta.jsonを1回のrenameで置き換えます
+          (途中で中断しても，読み出し側には保存前か保存後のどちらかのアーカイブが見えます)
+      追加の所要時間は追加する観測の量だけに比例し，既存の観測の番号は変わりません
+      同じ観測地点・観測時刻の観測は後から保存したもので置き換えます (古い観測は番号を残したまま参照されなくなります)
+      セグメントが増えた場合はcompact_archiveで1つにまとめられます
+      書き込みは1つのプロセスから行ってください (同時に追加すると一方のセグメントが失われます)
+    @param path: アーカイブのディレクトリ
+    @param sonde_list: SondeDataのイテラブル (観測地点・観測時刻はタイトルから取得)
+    @param append: 既存のアーカイブに追加するか (Falseの場合は置き換え; 観測の番号が変わります)
+    @param index: 保存後に登録し直す索引(pyema_index.SondeIndex; Noneの場合は登録しない)
+    @return: 保存した観測数
+    """
+    os.makedirs(path, exist_ok=True)
+    meta = __read_meta(path)
+
+    # 新しいセグメント (一覧に加えるまでは読み出し側から見えない)
+    segment = SEGMENT_PREFIX + uuid.uuid4().hex
+    n_sonde, n_level = __write_segment(os.path.join(path, segment), sonde_list)
+
+    old = [] if meta is None else meta['segments']
+    if append and meta is not None:
+        segments = old + [segment]
+        n_sonde_all, n_level_all = meta['n_sonde'] + n_sonde, meta['n_level'] + n_level
+    else:
+        segments = [segment]
+        n_sonde_all, n_level_all = n_sonde, n_level
+
+    __write_meta(path, {
+        'version' : ARCHIVE_VERSION,
+        'columns' : list(COLUMN_NAME),
+        'segments': segments,
+        'n_sonde' : n_sonde_all,
+        'n_level' : n_level_all
+    })
+
+    # 置き換えた場合は古いセグメントを削除
+    if not append:
+        for name in old:
+            __remove_segment(path, name)
+
+    if index is not None:
+        index.add_archive(path)
+
+    return n_sonde
+
+
+def compact_archive(path: str, index=None) -> int:
+    """
+    @brief:
+      アーカイブのセグメントを1つにまとめます (置き換えられた古い観測は削除; 観測の番号が変わります)
+    @param path: アーカイブのディレクトリ
+    @param index: まとめた後に登録し直す索引(pyema_index.SondeIndex; Noneの場合は登録しない)
+    @return: 観測数
+    """
+    archive = SondeArchive(path, mmap=False)
+    return write_archive(path, list(archive.iter_sonde()), append=False, index=index)
+
+
+class SondeArchive:
+    """
+    @brief:
+      カラム指向のアーカイブの読み出し
+      各ファイルはメモリマップで開き，必要なカラム・観測の範囲だけを読み出します
+      観測の番号はセグメントの順に通しで付け，アーカイブに追加しても既存の観測の番号は変わりません
+      (セグメント内は観測地点毎に観測時刻順に並んでいるので，観測地点・期間で選んだ観測のデータは
+       セグメント毎に連続した範囲になります)
+    """
+    def __init__(self, path: str, mmap: bool = True):
+        """
+        @param path: アーカイブのディレクトリ
+        @param mmap: メモリマップで開くか (Falseの場合はメモリに読み込み)
+        """
+        # クラス内では__read_metaが名前修飾されるため，モジュールの関数を直接参照
+        meta = globals()['__read_meta'](path)
+        if meta is None:
+            raise FileNotFoundError('archive not found: ' + path)
+
+        self.meta      = meta
+        self.path      = path
+        self.mmap_mode = 'r' if mmap else None
+
+        # セグメント毎の索引 {'path', 'station', 'time', 'title', 'offset'} とカラム (初回参照時に開く)
+        self.__segments = []
+        for name in meta['segments']:
+            seg_path = os.path.join(path, name)
+            segment  = {key: self.__load(seg_path, key) for key in INDEX_NAME}
+            segment['path']   = seg_path
+            segment['column'] = {}
+            self.__segments.append(segment)
+
+        # セグメント毎の観測・高度の開始位置 (通しの番号)
+        n_sonde = [segment['station'].shape[0] for segment in self.__segments]
+        n_level = [int(segment['offset'][-1]) for segment in self.__segments]
+        self.__sonde_start = np.concatenate([[0], np.cumsum(n_sonde)]).astype(np.int64)
+        self.__level_start = np.concatenate([[0], np.cumsum(n_level)]).astype(np.int64)
+
+        # 通しの索引 (セグメントが1つならメモリマップのまま)
+        if len(self.__segments) == 1:
+            segment = self.__segments[0]
+            self.station, self.time, self.title, self.offset = (segment[key] for key in INDEX_NAME)
+        else:
+            self.station = self.__concat('station', np.str_)
+            self.time    = self.__concat('time', 'datetime64[s]')
+            self.title   = self.__concat('title', np.str_)
+            self.offset  = np.concatenate([[0]] + [segment['offset'][1:] + start for segment, start
+                                                   in zip(self.__segments, self.__level_start)]).astype(np.int64)
+
+        # 後のセグメントで置き換えられていない観測 (Noneの場合は全て)
+        self.__live = self.__calc_live()
+
+    def __load(self, seg_path: str, name: str) -> np.ndarray:
+        return np.load(os.path.join(seg_path, name + '.npy'), mmap_mode=self.mmap_mode, allow_pickle=False)
+
+    def __concat(self, name: str, dtype) -> np.ndarray:
+        arrays = [segment[name] for segment in self.__segments]
+        return np.concatenate(arrays) if len(arrays) > 0 else np.empty(0, dtype=dtype)
+
+    def __calc_live(self):
+        # 同じ観測地点・観測時刻の観測が複数のセグメントにある場合は最後のものだけを参照
+        if len(self.__segments) <= 1:
+            return None
+        _, station = np.unique(self.station, return_inverse=True)
+        time = self.time.astype(np.int64)
+        key  = station.astype(np.int64) * (np.int64(1) << 40) + (time - time.min() if time.size > 0 else time)
+
+        # 逆順で最初に現れるもの = 最後のもの
+        _, last = np.unique(key[::-1], return_index=True)
+        live = np.zeros(len(self), dtype=bool)
+        live[len(self) - 1 - last] = True
+        return live if not np.all(live) else None
+
+    def __len__(self) -> int:
+        return int(self.__sonde_start[-1])
+
+    def __segment_of(self, indices: np.ndarray) -> np.ndarray:
+        # 観測の番号 => セグメントの番号
+        return np.searchsorted(self.__sonde_start, indices, side='right') - 1
+
+    def __segment_column(self, i_seg: int, name: str) -> np.ndarray:
+        segment = self.__segments[i_seg]
+        if name not in segment['column']:
+            segment['column'][name] = self.__load(segment['path'], name)
+        return segment['column'][name]
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        @brief:
+          全観測の高度を連結したカラムの配列
+          (セグメントが1つの場合はメモリマップ(読み取り専用)，複数の場合は連結した複製)
+        @param name: カラム名 (COLUMN_NAME)
+        """
+        if name not in COLUMN_NAME:
+            raise ValueError('invalid column name: ' + str(name))
+        columns = [self.__segment_column(i_seg, name) for i_seg in range(len(self.__segments))]
+        if len(columns) == 1:
+            return columns[0]
+        return np.concatenate(columns) if len(columns) > 0 else np.empty(0, dtype=np.float64)
+
+    def select(self, station: str = None, time_from: datetime = None, time_to: datetime = None,
+               hours: tuple = None) -> np.ndarray:
+        """
+        @brief:
+          条件に合う観測の番号を求めます (置き換えられた古い観測は除きます)
+        @param station: 観測地点番号 (Noneの場合は全地点)
+        @param time_from: 観測時刻の開始 (この時刻を含む; Noneの場合は制限なし)
+        @param time_to: 観測時刻の終了 (この時刻を含む; Noneの場合は制限なし)
+        @param hours: 観測時(UTC)の組 (例: (0, 12); Noneの場合は全て)
+        @return: 観測の番号 (昇順)
+        """
+        mask = np.ones(len(self), dtype=bool) if self.__live is None else self.__live.copy()
+        if station is not None:
+            mask &= self.station == station
+        if time_from is not None:
+            mask &= self.time >= to_datetime64(time_from)
+        if time_to is not None:
+            mask &= self.time <= to_datetime64(time_to)
+        if hours is not None:
+            hour  = (self.time - self.time.astype('datetime64[D]')).astype('timedelta64[h]').astype(np.int64)
+            mask &= np.isin(hour, hours)
+        return np.flatnonzero(mask)
+
+    def read_column(self, name: str, indices: np.ndarray) -> tuple:
+        """
+        @brief:
+          選んだ観測のカラムを読み出します
+          観測の番号が1つのセグメント内で連続している場合はメモリマップのビュー(コピーなし)を返します
+        @param name: カラム名 (COLUMN_NAME)
+        @param indices: 観測の番号 (昇順)
+        @return: (連結したカラムの値, 観測毎の開始位置 (shape=(n_sonde+1,)))
+        """
+        if name not in COLUMN_NAME:
+            raise ValueError('invalid column name: ' + str(name))
+
+        indices = np.asarray(indices, dtype=np.int64)
+        begin   = self.offset[indices]
+        end     = self.offset[indices + 1]
+
+        # 観測毎の開始位置
+        offset = np.zeros(indices.size + 1, dtype=np.int64)
+        np.cumsum(end - begin, out=offset[1:])
+
+        if indices.size <= 0:
+            return np.empty(0, dtype=np.float64), offset
+
+        # 同じセグメント内で番号が連続する範囲毎に読み出し
+        i_seg  = self.__segment_of(indices)
+        breaks = np.flatnonzero((np.diff(indices) != 1) | (np.diff(i_seg) != 0)) + 1
+        first  = np.concatenate([[0], breaks])
+        last   = np.concatenate([breaks, [indices.size]]) - 1
+
+        parts = []
+        for i_first, i_last in zip(first, last):
+            seg   = int(i_seg[i_first])
+            start = self.__level_start[seg]
+            parts.append(self.__segment_column(seg, name)[begin[i_first] - start:end[i_last] - start])
+
+        return (parts[0] if len(parts) == 1 else np.concatenate(parts)), offset
+
+    def get(self, i: int) -> SondeData:
+        """
+        @brief:
+          1つの観測をSondeDataとして読み出します
+        @param i: 観測の番号
+        """
+        if not 0 <= i < len(self):
+            raise IndexError('sounding index out of range: ' + str(i))
+        seg   = int(self.__segment_of(i))
+        start = self.__level_start[seg]
+        begin, end = int(self.offset[i] - start), int(self.offset[i + 1] - start)
+
+        table = np.empty((end - begin, len(COLUMN_NAME)), dtype=np.float64)
+        for i_col, name in enumerate(COLUMN_NAME):
+            table[:, i_col] = self.__segment_column(seg, name)[begin:end]
+        return SondeData(str(self.title[i]), table)
+
+    def iter_sonde(self, indices: np.ndarray = None):
+        """
+        @brief:
+          観測をSondeDataとして順に読み出します
+        @param indices: 観測の番号 (Noneの場合は置き換えられていない全ての観測)
+        @return: SondeDataのジェネレータ
+        """
+        if indices is None:
+            indices = self.select()
+        for i in indices:
+            yield self.get(int(i))
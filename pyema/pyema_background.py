@@ -0,0 +1,214 @@
+import functools
+import hashlib
+import os
+import tempfile
+import zipfile
+import numpy as np
+import pyema_util
+
+# 基準気圧 [hPa]
+P0    = 1000.0
+# rd/cpd
+KAPPA = 0.286
+# 乾燥空気の定圧比熱 [J/kg/K]
+CPD   = 1004.0
+# 乾燥空気の気体定数 [J/kg/K]
+RD    = KAPPA * CPD
+# 蒸発の潜熱 [J/kg]
+LV    = 2.50e6
+# 水の分子量Mv/乾燥大気の平均分子量Md [-]
+EPS   = 0.622
+
+# 背景線を計算する気圧の範囲 [hPa] と分割数
+P_BOTTOM = 1050.0
+P_TOP    = 100.0
+N_P      = 120
+
+# ディスクキャッシュの既定の保存先
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.pyema', 'background')
+
+# 乾燥断熱線の温位 [K]
+THETA_DRY   = np.arange(200.0, 501.0, 10.0)
+# 湿潤断熱線の湿球温位(1000hPaでの気温) [C]
+THETA_W     = np.arange(-40.0, 41.0, 4.0)
+# 等飽和混合比線の混合比 [g/kg]
+MIXR_LINES  = np.array([0.1, 0.2, 0.4, 1.0, 2.0, 4.0, 7.0, 10.0, 16.0, 24.0, 32.0])
+
+
+def calc_p_grid(p_bottom: float = P_BOTTOM, p_top: float = P_TOP, n_p: int = N_P) -> np.ndarray:
+    """
+    @brief:
+      背景線を計算する気圧の格子(対数等間隔; 地表側から上空へ降順)を求めます
+      湿潤断熱線の積分の起点とするため，基準気圧P0を必ず含みます
+    @return: 気圧 [hPa]
+    """
+    p = np.geomspace(p_bottom, p_top, n_p)
+    return np.unique(np.append(p, P0))[::-1]
+
+
+def calc_height_std(p: np.ndarray) -> np.ndarray:
+    """
+    @brief:
+      標準大気で気圧p[hPa]に対応する高度z[m]を求めます
+    @reference: ICAO標準大気 (対流圏)
+    """
+    return 44330.8 * (1.0 - np.power(p / 1013.25, 0.190263))
+
+
+def calc_dry_adiabats(theta: np.ndarray, p: np.ndarray) -> np.ndarray:
+    """
+    @brief:
+      乾燥断熱線T(θ,p)[K]を求めます
+    @param theta: 温位 [K] (shape=(n_line,))
+    @param p: 気圧 [hPa] (shape=(n_p,))
+    @return: 絶対温度 [K] (shape=(n_line, n_p))
+    """
+    return theta[:, np.newaxis] * np.power(p[np.newaxis, :] / P0, KAPPA)
+
+
+def __dtdp_moist(t: np.ndarray, p: float, table: bool) -> np.ndarray:
+    # 偽断熱過程における気温の気圧変化率 dT/dp [K/hPa]
+    qs = pyema_util.calc_qs_fast(t, p, table=table)
+    return (RD * t + LV * qs) / (CPD + (LV * LV * qs * EPS) / (RD * t * t)) / p
+
+
+def calc_moist_adiabats(theta_w: np.ndarray, p: np.ndarray, table: bool = False) -> np.ndarray:
+    """
+    @brief:
+      湿潤(偽)断熱線T(θw,p)[K]を求めます
+      基準気圧P0を起点に，全ての線を同時にRunge-Kutta法(4次)で上下に積分します
+    @param theta_w: 湿球温位 [K] (shape=(n_line,))
+    @param p: 気圧 [hPa] (shape=(n_p,); 降順でP0を含むこと)
+    @param table: 飽和水蒸気圧に数表版(pyema_util.calc_es_table)を使用するか
+    @return: 絶対温度 [K] (shape=(n_line, n_p))
+    """
+    t = np.empty((theta_w.size, p.size), dtype=np.float64)
+
+    i0 = int(np.argmin(np.abs(p - P0)))
+    t[:, i0] = theta_w
+
+    # 上空側(i0 -> n_p-1)と地表側(i0 -> 0)へ積分
+    for indices in (range(i0 + 1, p.size), range(i0 - 1, -1, -1)):
+        step = 1 if indices.step > 0 else -1
+        for i in indices:
+            p1 = p[i - step]
+            h  = p[i] - p1
+            t1 = t[:, i - step]
+            k1 = __dtdp_moist(t1             , p1          , table)
+            k2 = __dtdp_moist(t1 + 0.5*h*k1  , p1 + 0.5*h  , table)
+            k3 = __dtdp_moist(t1 + 0.5*h*k2  , p1 + 0.5*h  , table)
+            k4 = __dtdp_moist(t1 + h*k3      , p1 + h      , table)
+            t[:, i] = t1 + (h/6.0) * (k1 + 2.0*k2 + 2.0*k3 + k4)
+
+    return t
+
+
+def calc_mixing_ratio_lines(mixr: np.ndarray, p: np.ndarray) -> np.ndarray:
+    """
+    @brief:
+      等飽和混合比線T(w,p)[K]を求めます (混合比wで飽和する気温=露点温度)
+    @param mixr: 混合比 [g/kg] (shape=(n_line,))
+    @param p: 気圧 [hPa] (shape=(n_p,))
+    @return: 絶対温度 [K] (shape=(n_line, n_p))
+    @reference: Bolton, MWR, 1980, EQ.11
+    """
+    # 水蒸気圧 [hPa]
+    e = pyema_util.calc_e(mixr[:, np.newaxis] / 1000.0, p[np.newaxis, :])
+
+    # 露点温度 [C]
+    x  = np.log(e / 6.112)
+    td = 243.5 * x / (17.67 - x)
+
+    return td + 273.15
+
+
+def __calc_background_core(axis_h_type: str, axis_v_type: str, p_bottom: float, p_top: float, n_p: int,
+                           table: bool) -> dict:
+    # 気圧の格子
+    p = calc_p_grid(p_bottom, p_top, n_p)
+
+    # 背景線 [K]
+    lines = {
+        'dry'  : calc_dry_adiabats(THETA_DRY, p),
+        'moist': calc_moist_adiabats(THETA_W + 273.15, p, table),
+        'mixr' : calc_mixing_ratio_lines(MIXR_LINES, p)
+    }
+
+    # 横軸: 気温 [C] または 温位 [K]
+    for name, t in lines.items():
+        if   axis_h_type == 't':
+            lines[name] = t - 273.15
+        elif axis_h_type == 'pt':
+            lines[name] = t * np.power(P0 / p[np.newaxis, :], KAPPA)
+        else:
+            raise ValueError('invalid axis_h type: ' + str(axis_h_type))
+
+    # 縦軸: 気圧 [hPa] または 高度 [m]
+    if   axis_v_type == 'p':
+        y = p
+    elif axis_v_type == 'z':
+        y = calc_height_std(p)
+    else:
+        raise ValueError('invalid axis_v type: ' + str(axis_v_type))
+
+    lines['y'] = y
+
+    return lines
+
+
+def __load_npz(path: str):
+    # ディスクキャッシュの読み込み (ない場合・壊れている場合はNone)
+    try:
+        with np.load(path) as npz:
+            return {name: npz[name] for name in npz.files}
+    except (OSError, ValueError, EOFError, zipfile.BadZipFile):
+        return None
+
+
+def __save_npz(cache_dir: str, path: str, lines: dict) -> None:
+    # プロセス毎の一時ファイルに書き込んでから置き換え (並列のワーカーに書き込み途中のファイルを読ませない)
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(suffix='.npz.tmp', dir=cache_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **lines)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+@functools.lru_cache(maxsize=None)
+def calc_background(axis_h_type: str, axis_v_type: str, p_bottom: float = P_BOTTOM, p_top: float = P_TOP,
+                    n_p: int = N_P, cache_dir: str = None, table: bool = False) -> dict:
+    """
+    @brief:
+      エマグラムの背景線(乾燥断熱線，湿潤断熱線，等飽和混合比線)を求めます
+      結果は軸設定毎にメモリ上にキャッシュし，cache_dirを指定した場合はディスクにも保存します
+    @param axis_h_type: 横軸種別 (t: 気温, pt: 温位)
+    @param axis_v_type: 縦軸種別 (p: 気圧, z: 高度)
+    @param p_bottom: 気圧の下端 [hPa]
+    @param p_top: 気圧の上端 [hPa]
+    @param n_p: 気圧の分割数
+    @param cache_dir: ディスクキャッシュの保存先 (Noneの場合は保存しない; 既定の保存先はDEFAULT_CACHE_DIR)
+    @param table: 湿潤断熱線の飽和水蒸気圧に数表版(pyema_util.calc_es_table)を使用するか
+                  (相対誤差pyema_util.ES_TABLE_MAX_ERROR以下; 線の本数・気圧の分割数が多い場合に速くなります)
+    @return: {'dry', 'moist', 'mixr': 横軸の値 (shape=(n_line, n_p)), 'y': 縦軸の値 (shape=(n_p,))}
+    """
+    if cache_dir is None:
+        lines = __calc_background_core(axis_h_type, axis_v_type, p_bottom, p_top, n_p, table)
+    else:
+        # ディスクキャッシュ (軸設定と線の定義からファイル名を決定)
+        key  = repr((axis_h_type, axis_v_type, p_bottom, p_top, n_p,
+                     THETA_DRY.tolist(), THETA_W.tolist(), MIXR_LINES.tolist()) + ((True,) if table else ()))
+        path = os.path.join(cache_dir, 'background_' + hashlib.sha1(key.encode('utf-8')).hexdigest() + '.npz')
+        lines = __load_npz(path)
+        if lines is None:
+            lines = __calc_background_core(axis_h_type, axis_v_type, p_bottom, p_top, n_p, table)
+            __save_npz(cache_dir, path, lines)
+
+    # キャッシュを共有するため読み取り専用
+    for arr in lines.values():
+        arr.setflags(write=False)
+
+    return lines
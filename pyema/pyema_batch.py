@@ -0,0 +1,165 @@
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+
+# 画面のないサーバーでも動作するよう非対話バックエンドを使用
+matplotlib.use('Agg')
+
+# 出力形式
+OUTPUT_FORMAT = ('png', 'svg', 'pdf')
+
+# ワーカープロセス毎の描画状態 (図・描画器・キャッシュはワーカー内で使い回す)
+__worker = {}
+
+
+def parse_obs_time(s_time: str) -> dict:
+    """
+    @brief:
+      観測時刻(yyyymmddhh)をrun_pyemaの観測時刻形式に変換します
+    """
+    if len(s_time) != 10 or not s_time.isdigit():
+        raise ValueError('invalid observation time (yyyymmddhh): ' + s_time)
+
+    return {
+        'year' : s_time[0:4],
+        'month': str(int(s_time[4:6])),
+        'time' : str(int(s_time[6:8])) + s_time[8:10]
+    }
+
+
+def __init_worker(dpi: float, use_cache: bool) -> None:
+    """
+    @brief:
+      ワーカープロセスの初期化 (図の生成・セッションの作成はワーカー毎に1回だけ行います)
+    """
+    import matplotlib.pyplot as plt
+    import pyema_background
+    import pyema_fetch
+    import pyema_plot
+
+    fig, ax = plt.subplots()
+    __worker['fig']       = fig
+    # 背景線はディスクキャッシュを共有 (最初に計算したワーカーの結果を他のワーカー・次回の実行で使う)
+    __worker['renderer']  = pyema_plot.EmagramRenderer(
+        ax, background_cache_dir=pyema_background.DEFAULT_CACHE_DIR if use_cache else None)
+    __worker['dpi']       = dpi
+    __worker['use_cache'] = use_cache
+    # ワーカー毎のセッション (コネクションを使い回し，リトライ付き; プロセス間では共有できない)
+    __worker['session']   = pyema_fetch.create_session(pool_size=1)
+
+
+def __render(job: tuple) -> str:
+    """
+    @brief:
+      1つの観測(地点, 時刻)のエマグラムをファイルに出力します
+      観測データはpyema.load_sondeで読み出します (アーカイブ => キャッシュ => 取得; 取得元の指定・計測も同じ)
+    """
+    import pyema
+    from pyema_trace import create_trace, trace_stage
+
+    station, s_time, param, out_dir, formats = job
+
+    # ラジオゾンデ観測データ取得・パース (取得はタイムアウト付き; 応答のないサーバーでワーカーが止まらないように)
+    param = dict(param, station=station, obs_time=parse_obs_time(s_time), verbose=False,
+                 cache=__worker['use_cache'] and param.get('cache', True), session=__worker['session'])
+    trace = create_trace(param)
+    try:
+        sonde_data = pyema.load_sonde(param, trace=trace)
+
+        # 描画・ファイル出力 (図・線は使い回し，データだけ更新する)
+        fig  = __worker['fig']
+        base = os.path.join(out_dir, station + '_' + s_time + '_' + param['axis_h']['type'] + param['axis_v']['type'])
+        with trace_stage(trace, 'render', rows=len(sonde_data)):
+            __worker['renderer'].update(sonde_data, param)
+            for fmt in formats:
+                fig.savefig(base + '.' + fmt, format=fmt, dpi=__worker['dpi'])
+    finally:
+        if trace is not None:
+            trace.close()
+
+    return base
+
+
+def run_batch(stations: list, times: list, param: dict, out_dir: str, formats: list,
+              max_workers: int = None, dpi: float = 100.0, use_cache: bool = True) -> int:
+    """
+    @brief:
+      複数の観測地点・観測時刻のエマグラムをプロセスプールで並列にファイル出力します
+    @param stations: 観測地点番号のリスト
+    @param times: 観測時刻(yyyymmddhh)のリスト
+    @param param: 軸設定 {'axis_h', 'axis_v'} (pyema.load_sondeの設定(archive, source, timeout, trace_logなど)も指定できます)
+    @param out_dir: 出力先ディレクトリ
+    @param formats: 出力形式のリスト (png, svg, pdf)
+    @param max_workers: ワーカープロセス数 (Noneの場合はCPU数)
+    @param dpi: 解像度 [dpi]
+    @param use_cache: ラジオゾンデ観測データ・背景線のキャッシュを使用するか
+    @return: 失敗した件数
+    """
+    for fmt in formats:
+        if fmt not in OUTPUT_FORMAT:
+            raise ValueError('invalid output format: ' + fmt)
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    jobs = [(station, s_time, param, out_dir, formats) for station in stations for s_time in times]
+
+    n_error = 0
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=__init_worker,
+                             initargs=(dpi, use_cache)) as executor:
+        futures = [(job, executor.submit(__render, job)) for job in jobs]
+        for job, future in futures:
+            try:
+                print('[Output     ] ' + future.result())
+            except Exception as e:
+                n_error += 1
+                print('[Error      ] ' + job[0] + ' ' + job[1] + ': ' + str(e))
+
+    return n_error
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description='pyema batch: エマグラムを一括でファイル出力します')
+    parser.add_argument('-s', '--station', nargs='+', required=True, help='観測地点番号')
+    parser.add_argument('-t', '--time', nargs='+', required=True, help='観測時刻(UTC; yyyymmddhh)')
+    parser.add_argument('-o', '--out-dir', default='.', help='出力先ディレクトリ')
+    parser.add_argument('-f', '--format', nargs='+', default=['png'], choices=OUTPUT_FORMAT, help='出力形式')
+    parser.add_argument('--axis-h', default='t', choices=('t', 'pt'), help='横軸種別 (t: 気温, pt: 温位)')
+    parser.add_argument('--axis-v', default='p', choices=('p', 'z'), help='縦軸種別 (p: 気圧, z: 高度)')
+    parser.add_argument('--xlim', nargs=2, type=float, default=None, help='横軸の境界値')
+    parser.add_argument('--ylim', nargs=2, type=float, default=None, help='縦軸の境界値')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='ワーカープロセス数')
+    parser.add_argument('--dpi', type=float, default=100.0, help='解像度 [dpi]')
+    parser.add_argument('--no-cache', action='store_true', help='キャッシュ(観測データ・背景線)を使用しない')
+    parser.add_argument('--no-background', action='store_true', help='背景線(乾燥断熱線など)を描画しない')
+    parser.add_argument('--no-archive', action='store_true', help='ローカルのアーカイブを使用しない')
+    parser.add_argument('--timeout', type=float, default=None, help='HTTPリクエストのタイムアウト [s]')
+    args = parser.parse_args(argv)
+
+    param = {
+        'axis_h': {
+            'type' : args.axis_h,
+            'limit': args.xlim
+        },
+        'axis_v': {
+            'type' : args.axis_v,
+            'limit': args.ylim
+        },
+        'background': not args.no_background,
+        'archive'   : not args.no_archive,
+        'timeout'   : args.timeout
+    }
+
+    # 観測時刻の形式を事前に検査
+    for s_time in args.time:
+        parse_obs_time(s_time)
+
+    n_error = run_batch(args.station, args.time, param, args.out_dir, args.format,
+                        args.workers, args.dpi, not args.no_cache)
+
+    return 1 if n_error > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,454 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pyema_parser
+import pyema_util
+from pyema_sonde import format_title, parse_title
+
+# 観測データの高度数 (通常の観測〜高分解能の観測)
+BENCH_LEVEL = (100, 1000, 5000)
+# 熱力学関数の要素数
+BENCH_KERNEL_SIZE = (1000, 100000, 1000000)
+# 期間指定の取得で1か月に含める観測数 (00Z, 12Z)
+BENCH_MONTH_HOURS = (0, 12)
+# 1回の計測の最小時間 [s] (短い処理は繰り返して計測)
+BENCH_MIN_TIME = 0.05
+# 計測の繰り返し回数 (最小値を採用)
+BENCH_REPEAT = 5
+# 合成する観測データの観測地点番号
+BENCH_STATION = '47646'
+
+# ラジオゾンデ観測データ(text形式)のヘッダ (<pre>ブロックの先頭)
+__SONDE_HEADER = [
+    '',
+    '-' * pyema_parser.WORDS_LINE_SONDE_TXT,
+    '   PRES   HGHT   TEMP   DWPT   RELH   MIXR   DRCT   SKNT   THTA   THTE   THTV',
+    '    hPa     m      C      C      %    g/kg    deg   knot     K      K      K ',
+    '-' * pyema_parser.WORDS_LINE_SONDE_TXT
+]
+# カラム毎の書式 (小数点以下の桁数)
+__SONDE_DIGITS = (1, 0, 1, 1, 0, 2, 0, 0, 1, 1, 1)
+
+
+def make_sonde_text(n_level: int, seed: int = 0) -> list:
+    """
+    @brief:
+      Wyoming大学のtext形式を模した合成のラジオゾンデ観測データ(<pre>ブロックの各行)を作成します
+      実際の観測の記録ではありません (標準大気に乱数の擾乱を加えた鉛直分布; 露点温度などは一部を欠測にします)
+    @param n_level: 高度数
+    @param seed: 乱数の種
+    @return: <pre>ブロックの各行
+    """
+    rng = np.random.RandomState(seed)
+
+    p = np.geomspace(1013.0, 10.0, n_level)
+    z = 44330.8 * (1.0 - np.power(p / 1013.25, 0.190263))
+    t = np.maximum(15.0 - 0.0065 * z, -56.5) + rng.normal(0.0, 0.5, n_level)
+    td = t - rng.uniform(0.5, 15.0, n_level)
+
+    es   = 6.112 * np.exp(17.67 * t / (t + 243.5))
+    e    = 6.112 * np.exp(17.67 * td / (td + 243.5))
+    relh = 100.0 * e / es
+    mixr = 622.0 * e / (p - e)
+    drct = rng.uniform(0.0, 360.0, n_level)
+    sknt = rng.uniform(0.0, 120.0, n_level)
+
+    theta   = (t + 273.15) * np.power(1000.0 / p, 0.286)
+    theta_e = theta * np.exp(2.5e6 * mixr / 1000.0 / (1004.0 * (t + 273.15)))
+    vtheta  = theta * (1.0 + 0.61 * mixr / 1000.0)
+
+    table = np.column_stack([p, z, t, td, relh, mixr, drct, sknt, theta, theta_e, vtheta])
+
+    # 露点温度・湿度の欠測 (上空ほど多い)
+    missing = rng.uniform(0.0, 1.0, n_level) < np.linspace(0.0, 0.5, n_level)
+    table[missing, 3:6] = np.nan
+
+    lines = list(__SONDE_HEADER)
+    for row in table:
+        cells = [' ' * pyema_parser.WORDS_COLUMN_SONDE_TXT if np.isnan(value) else
+                 '{:7.{}f}'.format(value, digits) for value, digits in zip(row, __SONDE_DIGITS)]
+        lines.append(''.join(cells))
+
+    return lines
+
+
+def make_title(station: str, obs_time: datetime) -> str:
+    """
+    @brief:
+      観測のタイトル(<h2>タグ; 例: 47646 Tateno Observations at 00Z 17 Feb 2020)を作成します
+      (月名はロケールによらず英語の略称; parse_titleで読み取れます)
+    """
+    return format_title(station, 'Tateno', obs_time)
+
+
+def make_html(blocks: list) -> str:
+    """
+    @brief:
+      (タイトル, <pre>ブロックの各行)の組を並べたHTTPレスポンスボディを作成します
+    """
+    body = ['<HTML>\n<TITLE>University of Wyoming - Radiosonde Data</TITLE>\n<BODY BGCOLOR="white">\n']
+    for title, sonde_txt in blocks:
+        body.append('<H2>' + title + '</H2>\n<PRE>' + '\n'.join(sonde_txt) + '\n</PRE>'
+                    '<H3>Station information and sounding indices</H3><PRE>\n'
+                    '  Station number: ' + title.split()[0] + '\n</PRE>\n')
+    body.append('</BODY></HTML>\n')
+    return ''.join(body)
+
+
+def make_month_blocks(station: str, year: int, month: int, n_level: int) -> dict:
+    """
+    @brief:
+      1か月分(BENCH_MONTH_HOURSの観測時)の合成の観測データを作成します
+    @return: {(観測地点番号, 観測時刻): (タイトル, <pre>ブロックの各行)}
+    """
+    blocks   = {}
+    obs_time = datetime(year, month, 1, tzinfo=timezone.utc)
+    while obs_time.month == month:
+        if obs_time.hour in BENCH_MONTH_HOURS:
+            blocks[(station, obs_time)] = (make_title(station, obs_time),
+                                           make_sonde_text(n_level, seed=int(obs_time.timestamp()) % 2**31))
+        obs_time += timedelta(hours=1)
+    return blocks
+
+
+def load_fixture_dir(path: str) -> dict:
+    """
+    @brief:
+      記録したHTTPレスポンスボディ(*.html)を読み込みます
+    @param path: HTMLファイルのディレクトリ
+    @return: {(観測地点番号, 観測時刻): (タイトル, <pre>ブロックの各行)}
+    """
+    blocks = {}
+    for file_name in sorted(glob.glob(os.path.join(path, '*.html'))):
+        with open(file_name, encoding='utf-8', errors='replace') as f:
+            for title, sonde_txt in pyema_parser.iter_sonde_blocks([f.read()]):
+                blocks[parse_title(title)] = (title, sonde_txt)
+    return blocks
+
+
+class ReplayServer:
+    """
+    @brief:
+      Wyoming大学のサーバーの代わりに観測データを応答するローカルのHTTPサーバー
+      クエリ(STNM, YEAR, MONTH, FROM, TO)の期間の観測をまとめて1つのHTMLで返します
+      withブロックの間はpyema_fetch.URL_SONDE_TXTをこのサーバーに向けます
+    """
+    def __init__(self, blocks: dict):
+        """
+        @param blocks: {(観測地点番号, 観測時刻): (タイトル, <pre>ブロックの各行)}
+        """
+        self.blocks   = blocks
+        self.__server = None
+        self.__url    = None
+
+    def __response(self, query: dict) -> str:
+        station = query['STNM'][0]
+        year, month = int(query['YEAR'][0]), int(query['MONTH'][0])
+
+        def to_datetime(ddhh: str) -> datetime:
+            # 日はゼロ埋めされない場合がある (例: 112 => 1日12Z)
+            return datetime(year, month, int(ddhh[:-2]), int(ddhh[-2:]), tzinfo=timezone.utc)
+
+        time_from, time_to = to_datetime(query['FROM'][0]), to_datetime(query['TO'][0])
+        return make_html([self.blocks[key] for key in sorted(self.blocks)
+                          if key[0] == station and time_from <= key[1] <= time_to])
+
+    def __enter__(self):
+        import pyema_fetch
+
+        response = self.__response
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+                body  = response(query).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.__server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.__server.serve_forever, daemon=True).start()
+
+        self.__url = pyema_fetch.URL_SONDE_TXT
+        pyema_fetch.URL_SONDE_TXT = 'http://127.0.0.1:' + str(self.__server.server_port) + '/cgi-bin/sounding'
+
+        return self
+
+    def __exit__(self, *args):
+        import pyema_fetch
+
+        pyema_fetch.URL_SONDE_TXT = self.__url
+        self.__server.shutdown()
+        self.__server.server_close()
+
+
+def measure(func, min_time: float = BENCH_MIN_TIME, repeat: int = BENCH_REPEAT) -> float:
+    """
+    @brief:
+      処理の所要時間を計測します (1回がmin_time未満の処理は繰り返して平均; repeat回の最小値)
+    @return: 1回あたりの所要時間 [s]
+    """
+    func()  # 初回の準備(キャッシュ・JITコンパイルなど)は計測しない
+
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 10 if elapsed <= 0.0 else max(2, int(min_time / elapsed) + 1)
+
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+
+    return best
+
+
+def __result(name: str, size: int, elapsed: float, amount: float, unit: str) -> dict:
+    return {'name': name, 'size': size, 'time': elapsed, 'throughput': amount / elapsed, 'unit': unit}
+
+
+def bench_parse(levels: tuple = BENCH_LEVEL) -> list:
+    """
+    @brief:
+      HTTPレスポンスボディからの抽出(<h2>・<pre>タグ)とパース(pyema.__parse_emagram_text)を計測します
+    """
+    import pyema
+
+    parse   = getattr(pyema, '__parse_emagram_text')
+    results = []
+    for n_level in levels:
+        title = make_title(BENCH_STATION, datetime(2020, 2, 17, tzinfo=timezone.utc))
+        html  = make_html([(title, make_sonde_text(n_level))])
+        title, sonde_txt = next(pyema_parser.iter_sonde_blocks([html]))
+
+        elapsed = measure(lambda: next(pyema_parser.iter_sonde_blocks([html])))
+        results.append(__result('extract', n_level, elapsed, len(html) / 1.0e6, 'MB/s'))
+
+        elapsed = measure(lambda: parse(title, sonde_txt))
+        results.append(__result('parse', n_level, elapsed, n_level, 'rows/s'))
+
+    return results
+
+
+def bench_kernel(sizes: tuple = BENCH_KERNEL_SIZE) -> list:
+    """
+    @brief:
+      pyema_utilの熱力学関数(参照実装・高速版・数表版・JIT版)を計測します
+    """
+    kernels = [
+        ('calc_es'                , lambda t, p, e, out: pyema_util.calc_es(t)),
+        ('calc_es_fast'           , lambda t, p, e, out: pyema_util.calc_es_fast(t, out)),
+        ('calc_es_fast(table)'    , lambda t, p, e, out: pyema_util.calc_es_fast(t, out, table=True)),
+        ('calc_qs'                , lambda t, p, e, out: pyema_util.calc_qs(t, p)),
+        ('calc_qs_fast'           , lambda t, p, e, out: pyema_util.calc_qs_fast(t, p, out)),
+        ('calc_theta_es'          , lambda t, p, e, out: pyema_util.calc_theta_es(t, p, e)),
+        ('calc_theta_es_fast'     , lambda t, p, e, out: pyema_util.calc_theta_es_fast(t, p, e, out))
+    ]
+    if pyema_util.HAS_JIT:
+        kernels += [
+            ('calc_es_fast(jit)'      , lambda t, p, e, out: pyema_util.calc_es_fast(t, out, jit=True)),
+            ('calc_theta_es_fast(jit)', lambda t, p, e, out: pyema_util.calc_theta_es_fast(t, p, e, out, jit=True))
+        ]
+
+    rng     = np.random.RandomState(0)
+    results = []
+    for size in sizes:
+        t   = rng.uniform(200.0, 310.0, size)
+        p   = rng.uniform(100.0, 1050.0, size)
+        e   = pyema_util.calc_es(t) * rng.uniform(0.1, 1.0, size)
+        out = np.empty(size, dtype=np.float64)
+        for name, kernel in kernels:
+            elapsed = measure(lambda: kernel(t, p, e, out))
+            results.append(__result(name, size, elapsed, size / 1.0e6, 'Melem/s'))
+
+    return results
+
+
+def bench_fetch(levels: tuple = BENCH_LEVEL, blocks: dict = None) -> list:
+    """
+    @brief:
+      ReplayServer経由で取得からパースまで(pyema.load_sonde; アーカイブ・キャッシュなし)と，
+      1か月分の期間指定の取得(pyema_fetch.iter_sonde_period)を計測します
+    @param blocks: 応答する観測 (Noneの場合は合成の観測データ)
+    """
+    import pyema
+    import pyema_fetch
+
+    results = []
+    for n_level in levels:
+        if blocks is None:
+            replay_blocks = make_month_blocks(BENCH_STATION, 2020, 2, n_level)
+        else:
+            replay_blocks = blocks
+        station, obs_time = min(replay_blocks)
+        time_from, time_to = obs_time, max(key[1] for key in replay_blocks if key[0] == station)
+        n_sonde = sum(1 for key in replay_blocks if key[0] == station)
+        size    = n_level if blocks is None else \
+                  len(replay_blocks[(station, obs_time)][1]) - (pyema_parser.SKIP_LINE_SONDE_TXT + 1)
+
+        param = {
+            'station' : station,
+            'obs_time': {'year': str(obs_time.year), 'month': str(obs_time.month),
+                         'time': '%02d%02d' % (obs_time.day, obs_time.hour)},
+            'archive' : False,
+            'cache'   : False,
+            'verbose' : False
+        }
+
+        with ReplayServer(replay_blocks):
+            elapsed = measure(lambda: pyema.load_sonde(param))
+            results.append(__result('load_sonde', size, elapsed, size, 'rows/s'))
+
+            elapsed = measure(lambda: list(pyema_fetch.iter_sonde_period(station, time_from, time_to, verbose=False)),
+                              repeat=1)
+            results.append(__result('iter_sonde_period(' + str(n_sonde) + ')', size, elapsed, n_sonde,
+                                    'soundings/s'))
+
+        if blocks is not None:
+            break
+
+    return results
+
+
+def bench_plot(levels: tuple = BENCH_LEVEL) -> list:
+    """
+    @brief:
+      エマグラムの描画(横軸: 気温・温位)を計測します (Aggで描画; 初回の描画と観測データのみの更新)
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    import pyema_plot
+    from pyema_sonde import SondeData, parse_sonde
+
+    results = []
+    for axis_h_type in ('t', 'pt'):
+        param = {
+            'axis_h': {'type': axis_h_type, 'limit': None},
+            'axis_v': {'type': 'p', 'limit': None}
+        }
+        for n_level in levels:
+            # パースは計測に含めない (派生量の算出は含めるよう，計測の度にキャッシュのないSondeDataを作成)
+            title = make_title(BENCH_STATION, datetime(2020, 2, 17, tzinfo=timezone.utc))
+            table = parse_sonde(title, make_sonde_text(n_level)).data.T.copy()
+
+            def draw():
+                fig = Figure()
+                FigureCanvasAgg(fig)
+                pyema_plot.draw_emagram(fig.add_subplot(1, 1, 1), SondeData(title, table), param)
+                fig.canvas.draw()
+
+            elapsed = measure(draw, min_time=0.0, repeat=3)
+            results.append(__result('draw_emagram(' + axis_h_type + ')', n_level, elapsed, 1.0, 'fig/s'))
+
+            fig = Figure()
+            FigureCanvasAgg(fig)
+            renderer = pyema_plot.EmagramRenderer(fig.add_subplot(1, 1, 1))
+
+            def update():
+                renderer.update(SondeData(title, table), param)
+                fig.canvas.draw()
+
+            elapsed = measure(update, min_time=0.0, repeat=3)
+            results.append(__result('EmagramRenderer.update(' + axis_h_type + ')', n_level, elapsed, 1.0, 'fig/s'))
+
+    return results
+
+
+def run_bench(groups: tuple, fixture_dir: str = None, verbose: bool = True) -> dict:
+    """
+    @brief:
+      ベンチマークを実行します
+    @param groups: 実行するベンチマーク (parse, kernel, fetch, plot)
+    @param fixture_dir: 記録したHTTPレスポンスボディのディレクトリ (fetchで使用; Noneの場合は合成の観測データ)
+    @return: {'environment': 実行環境, 'results': [{'name', 'size', 'time', 'throughput', 'unit'}, ...]}
+    """
+    bench = {
+        'parse' : bench_parse,
+        'kernel': bench_kernel,
+        'fetch' : lambda: bench_fetch(blocks=None if fixture_dir is None else load_fixture_dir(fixture_dir)),
+        'plot'  : bench_plot
+    }
+
+    results = []
+    for group in groups:
+        for result in bench[group]():
+            results.append(result)
+
+            # エコー
+            if verbose:
+                print('[Bench      ] ' + __format(result))
+
+    return {
+        'environment': {
+            'python'  : platform.python_version(),
+            'numpy'   : np.__version__,
+            'platform': platform.platform(),
+            'jit'     : pyema_util.HAS_JIT
+        },
+        'results': results
+    }
+
+
+def __format(result: dict, base: dict = None) -> str:
+    s = '{:<36s}{:>9d}{:>12.3f} ms{:>14.3f} {}'.format(result['name'], result['size'], result['time'] * 1000.0,
+                                                       result['throughput'], result['unit'])
+    if base is not None:
+        s += '  (x{:.2f})'.format(result['throughput'] / base['throughput'])
+    return s
+
+
+def compare_bench(bench: dict, base: dict) -> None:
+    """
+    @brief:
+      別のバージョンの結果と比較して，スループットの比(今回/基準)をエコーします
+    """
+    base_results = {(result['name'], result['size']): result for result in base['results']}
+    for result in bench['results']:
+        print('[Compare    ] ' + __format(result, base_results.get((result['name'], result['size']))))
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description='pyema bench: 取得・パース・熱力学関数・描画の性能を計測します')
+    parser.add_argument('-g', '--group', nargs='+', default=['parse', 'kernel', 'fetch', 'plot'],
+                        choices=('parse', 'kernel', 'fetch', 'plot'), help='実行するベンチマーク')
+    parser.add_argument('--fixture-dir', default=None, help='記録したHTTPレスポンスボディ(*.html)のディレクトリ')
+    parser.add_argument('-o', '--output', default=None, help='結果の出力先(JSON)')
+    parser.add_argument('-c', '--compare', default=None, help='比較する結果(JSON)')
+    args = parser.parse_args(argv)
+
+    bench = run_bench(tuple(args.group), args.fixture_dir)
+
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(bench, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare, encoding='utf-8') as f:
+            compare_bench(bench, json.load(f))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
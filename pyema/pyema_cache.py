@@ -0,0 +1,172 @@
+import contextlib
+import os
+import sqlite3
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+
+# キャッシュファイルの既定パス
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.pyema', 'sonde_cache.sqlite3')
+# キャッシュの既定容量上限 [byte]
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# 最新観測時刻のデータの有効期限 [s]
+DEFAULT_TTL_LATEST = 10 * 60
+# 観測時刻からデータが確定するまでの時間 (これより新しい観測は有効期限付きで保存)
+FINAL_DELAY = timedelta(hours=12)
+
+
+def obs_datetime(year: str, month: str, time_: str) -> datetime:
+    """
+    @brief:
+      観測時刻(年, 月, ddhh)をdatetime(UTC)に変換します
+    """
+    return datetime(int(year), int(month), int(time_[:-2]), int(time_[-2:]), tzinfo=timezone.utc)
+
+
+class SondeCache:
+    """
+    @brief:
+      ラジオゾンデ観測データ(HTML)のディスクキャッシュ
+      キーは(観測地点番号, 年, 月, ddhh)で，観測時刻に正規化して保存します (月'2'と'02'などは同じ観測)
+      キャッシュファイルは最初に保存する時に作成します (参照だけの場合はファイルを作りません)
+      確定済みの過去の観測は無期限，最新の観測は短い有効期限で保存し，
+      容量上限を超えた場合は最終参照時刻が古いものから削除します(LRU)
+    """
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttl_latest: float = DEFAULT_TTL_LATEST):
+        self.path       = path
+        self.max_bytes  = max_bytes
+        self.ttl_latest = ttl_latest
+
+        # キャッシュファイル・テーブルを作成済みか
+        self.__created = False
+
+    @contextlib.contextmanager
+    def __connect(self):
+        # スレッド・プロセス間で共有できるよう操作毎に接続します
+        conn = sqlite3.connect(self.path, timeout=30.0)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def __create(self) -> None:
+        # キャッシュファイル・テーブルを作成 (初回の保存時)
+        if self.__created:
+            return
+
+        dir_name = os.path.dirname(self.path)
+        if len(dir_name) > 0:
+            os.makedirs(dir_name, exist_ok=True)
+
+        with self.__connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS sonde ('
+                         ' key      TEXT PRIMARY KEY,'
+                         ' body     BLOB NOT NULL,'
+                         ' size     INTEGER NOT NULL,'
+                         ' expires  REAL,'
+                         ' accessed REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS sonde_accessed ON sonde (accessed)')
+        self.__created = True
+
+    def __exists(self) -> bool:
+        # 参照できるキャッシュファイルがあるか (ない場合は作成しない)
+        if not self.__created and os.path.isfile(self.path):
+            self.__create()
+        return self.__created
+
+    @staticmethod
+    def __key_str(key: tuple) -> str:
+        # 観測地点番号/観測時刻(YYYYMMDDHH) (表記の揺れを吸収)
+        return key[0] + '/' + obs_datetime(*key[1:]).strftime('%Y%m%d%H')
+
+    def get(self, key: tuple):
+        """
+        @brief:
+          キャッシュからHTMLを取得します
+        @param key: (観測地点番号, 年, 月, ddhh)
+        @return: HTML (キャッシュにない，または有効期限切れの場合はNone)
+        """
+        if not self.__exists():
+            return None
+
+        now = time.time()
+        with self.__connect() as conn:
+            row = conn.execute('SELECT body, expires FROM sonde WHERE key = ?',
+                               (self.__key_str(key),)).fetchone()
+            if row is None:
+                return None
+
+            body, expires = row
+            if expires is not None and expires < now:
+                conn.execute('DELETE FROM sonde WHERE key = ?', (self.__key_str(key),))
+                return None
+
+            conn.execute('UPDATE sonde SET accessed = ? WHERE key = ?', (now, self.__key_str(key)))
+
+        return zlib.decompress(body).decode('utf-8')
+
+    def put(self, key: tuple, html: str) -> None:
+        """
+        @brief:
+          HTMLをキャッシュに保存します
+          観測データ(<pre>タグ)を含まない応答は保存しません
+        @param key: (観測地点番号, 年, 月, ddhh)
+        @param html: HTML
+        """
+        if '<pre>' not in html.lower():
+            return
+
+        now  = time.time()
+        body = zlib.compress(html.encode('utf-8'))
+
+        # 確定前の観測は有効期限付き
+        expires = None
+        if obs_datetime(*key[1:]) + FINAL_DELAY > datetime.now(timezone.utc):
+            expires = now + self.ttl_latest
+
+        self.__create()
+        with self.__connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO sonde (key, body, size, expires, accessed) VALUES (?, ?, ?, ?, ?)',
+                         (self.__key_str(key), body, len(body), expires, now))
+            self.__evict(conn)
+
+    def __evict(self, conn: sqlite3.Connection) -> None:
+        # 容量上限を超えた分を最終参照時刻が古い順に削除(LRU)
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM sonde').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        keys = []
+        for key, size in conn.execute('SELECT key, size FROM sonde ORDER BY accessed'):
+            if total <= self.max_bytes:
+                break
+            keys.append((key,))
+            total -= size
+        conn.executemany('DELETE FROM sonde WHERE key = ?', keys)
+
+    def clear(self) -> None:
+        """
+        @brief:
+          キャッシュを全て削除します
+        """
+        if not self.__exists():
+            return
+        with self.__connect() as conn:
+            conn.execute('DELETE FROM sonde')
+
+
+# 既定のキャッシュ(初回参照時に生成)
+__default_cache = None
+
+
+def get_default_cache() -> SondeCache:
+    """
+    @brief:
+      既定のキャッシュを取得します
+    """
+    global __default_cache
+    if __default_cache is None:
+        __default_cache = SondeCache()
+    return __default_cache
@@ -0,0 +1,275 @@
+from datetime import datetime
+import numpy as np
+import pyema_regrid
+import pyema_source
+from pyema_archive import SondeArchive
+from pyema_sonde import parse_title
+
+# 気候値を求める変数と近似分位点用のヒストグラムの範囲・階級幅 (下限, 上限, 階級幅)
+CLIM_VAR = {
+    'height' : (-500.0, 20000.0, 10.0),  # ジオポテンシャル高度 [m]
+    'temp'   : (-100.0,    50.0,  0.1),  # 気温 [C]
+    'dewtemp': (-120.0,    40.0,  0.1),  # 露点温度 [C]
+    'theta'  : ( 200.0,   600.0,  0.1),  # 温位 [K]
+    'theta_e': ( 200.0,   600.0,  0.1)   # 相当温位 [K]
+}
+# 月の数
+N_MONTH = 12
+# 一度に補間・集計する観測数
+DEFAULT_CHUNK_SIZE = 1000
+
+
+class Climatology:
+    """
+    @brief:
+      観測地点の月別気候値(平均, 分散, 近似分位点)を逐次更新で求めます
+      観測は指定気圧面に補間してから集計し，全観測をメモリに保持しません
+        - 平均・分散: Welford法 (チャンク単位の統計量を並列版の式で合成)
+        - 分位点: 固定階級幅のヒストグラムの累積度数を線形補間 (誤差は階級幅以下; 範囲外の値は端の階級に数えます)
+      統計量の配列は [月, 気圧面] です
+    """
+    def __init__(self, levels: np.ndarray = pyema_regrid.STANDARD_LEVEL_P):
+        """
+        @param levels: 集計する気圧面 [hPa]
+        """
+        self.levels = np.asarray(levels, dtype=np.float64)
+
+        shape = (N_MONTH, self.levels.size)
+        self.count = {var: np.zeros(shape, dtype=np.int64  ) for var in CLIM_VAR}
+        self.mean  = {var: np.zeros(shape, dtype=np.float64) for var in CLIM_VAR}
+        self.m2    = {var: np.zeros(shape, dtype=np.float64) for var in CLIM_VAR}
+        self.hist  = {var: np.zeros(shape + (self.__n_bin(var),), dtype=np.int64) for var in CLIM_VAR}
+
+    @staticmethod
+    def __n_bin(var: str) -> int:
+        lo, hi, step = CLIM_VAR[var]
+        return int(round((hi - lo) / step))
+
+    def update(self, values: dict, month: np.ndarray) -> None:
+        """
+        @brief:
+          気圧面に補間した観測で統計量を更新します (欠測値(NaN)は数えません)
+        @param values: {変数名: 補間値 (shape=(n_sonde, n_level))}
+        @param month: 観測月 (1-12; shape=(n_sonde,))
+        """
+        month = np.asarray(month, dtype=np.int64) - 1
+
+        for var in CLIM_VAR:
+            x     = values[var]
+            valid = np.isfinite(x)
+            x0    = np.where(valid, x, 0.0)
+
+            # 月毎のチャンクの統計量 (観測数, 平均, 偏差平方和)
+            n_b = np.zeros((N_MONTH, self.levels.size), dtype=np.int64)
+            s_b = np.zeros((N_MONTH, self.levels.size), dtype=np.float64)
+            np.add.at(n_b, month, valid)
+            np.add.at(s_b, month, x0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                mean_b = np.where(n_b > 0, s_b / n_b, 0.0)
+            d     = np.where(valid, x0 - mean_b[month], 0.0)
+            m2_b  = np.zeros((N_MONTH, self.levels.size), dtype=np.float64)
+            np.add.at(m2_b, month, d*d)
+
+            # 既存の統計量と合成 (Chan et al.の並列版Welford法)
+            n_a   = self.count[var]
+            n     = n_a + n_b
+            delta = mean_b - self.mean[var]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratio = np.where(n > 0, n_b / n, 0.0)
+            self.mean[var] += delta * ratio
+            self.m2[var]   += m2_b + delta*delta * n_a * ratio
+            self.count[var] = n
+
+            # ヒストグラム (月, 気圧面, 階級)を1次元の番号にして一括で数える
+            lo, hi, step = CLIM_VAR[var]
+            n_bin = self.__n_bin(var)
+            i_bin = np.clip(((x0 - lo) / step).astype(np.int64), 0, n_bin - 1)
+            i_lev = np.broadcast_to(np.arange(self.levels.size), x.shape)
+            flat  = (month[:, np.newaxis]*self.levels.size + i_lev)*n_bin + i_bin
+            self.hist[var] += np.bincount(flat[valid], minlength=self.hist[var].size).reshape(self.hist[var].shape)
+
+    def merge(self, other: 'Climatology') -> None:
+        """
+        @brief:
+          別に集計した統計量を合成します (同じ気圧面であること)
+        """
+        if not np.array_equal(self.levels, other.levels):
+            raise ValueError('levels mismatch')
+
+        for var in CLIM_VAR:
+            n_a, n_b = self.count[var], other.count[var]
+            n     = n_a + n_b
+            delta = other.mean[var] - self.mean[var]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratio = np.where(n > 0, n_b / n, 0.0)
+            self.mean[var] += delta * ratio
+            self.m2[var]   += other.m2[var] + delta*delta * n_a * ratio
+            self.count[var] = n
+            self.hist[var] += other.hist[var]
+
+    def get_mean(self, var: str) -> np.ndarray:
+        """
+        @brief:
+          平均 [月, 気圧面] (観測がない場合はNaN)
+        """
+        return np.where(self.count[var] > 0, self.mean[var], np.nan)
+
+    def get_std(self, var: str) -> np.ndarray:
+        """
+        @brief:
+          標準偏差(不偏) [月, 気圧面] (観測数が2未満の場合はNaN)
+        """
+        n = self.count[var]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(n > 1, np.sqrt(self.m2[var] / (n - 1)), np.nan)
+
+    def get_quantile(self, var: str, q: float) -> np.ndarray:
+        """
+        @brief:
+          近似分位点 [月, 気圧面] (観測がない場合はNaN)
+        @param q: 分位 (0-1)
+        """
+        lo, hi, step = CLIM_VAR[var]
+        hist = self.hist[var]
+        cum  = np.cumsum(hist, axis=-1)
+        n    = cum[..., -1]
+        rank = q * n
+
+        # 累積度数がrankに達する階級と，階級内の位置
+        i_bin = np.minimum(np.sum(cum < rank[..., np.newaxis], axis=-1), hist.shape[-1] - 1)
+        below = np.take_along_axis(cum, i_bin[..., np.newaxis], axis=-1)[..., 0] - \
+                np.take_along_axis(hist, i_bin[..., np.newaxis], axis=-1)[..., 0]
+        count = np.take_along_axis(hist, i_bin[..., np.newaxis], axis=-1)[..., 0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            frac = np.where(count > 0, (rank - below) / count, 0.0)
+
+        return np.where(n > 0, lo + (i_bin + frac)*step, np.nan)
+
+    def profile(self, month: int, q: tuple = (0.1, 0.9)) -> dict:
+        """
+        @brief:
+          1か月分の気候値の鉛直分布を求めます (エマグラムへの重ね描き用)
+        @param month: 月 (1-12)
+        @param q: 幅を示す分位 (下側, 上側)
+        @return: {'pres': 気圧面 [hPa], 'height': 平均高度 [m],
+                  'mean': {変数名: 平均}, 'lower': {変数名: 下側分位点}, 'upper': {変数名: 上側分位点}}
+        """
+        i = month - 1
+        return {
+            'pres'  : self.levels,
+            'height': self.get_mean('height')[i],
+            'mean'  : {var: self.get_mean(var)[i] for var in CLIM_VAR},
+            'lower' : {var: self.get_quantile(var, q[0])[i] for var in CLIM_VAR},
+            'upper' : {var: self.get_quantile(var, q[1])[i] for var in CLIM_VAR}
+        }
+
+    def save(self, path: str) -> None:
+        """
+        @brief:
+          統計量をnpz形式で保存します
+        """
+        arrays = {'levels': self.levels}
+        for var in CLIM_VAR:
+            arrays['count_' + var] = self.count[var]
+            arrays['mean_'  + var] = self.mean[var]
+            arrays['m2_'    + var] = self.m2[var]
+            arrays['hist_'  + var] = self.hist[var]
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> 'Climatology':
+        """
+        @brief:
+          saveで保存した統計量を読み込みます
+        """
+        with np.load(path) as npz:
+            clim = cls(npz['levels'])
+            for var in CLIM_VAR:
+                clim.count[var] = npz['count_' + var]
+                clim.mean[var]  = npz['mean_'  + var]
+                clim.m2[var]    = npz['m2_'    + var]
+                clim.hist[var]  = npz['hist_'  + var]
+        return clim
+
+
+def __add_theta(values: dict, levels: np.ndarray) -> dict:
+    # 気圧面の気温から温位 [K] を求めます
+    values['theta'] = (values['temp'] + 273.15) * np.power(1000.0 / levels, 0.286)
+    return values
+
+
+def update_sonde(clim: Climatology, sonde_list: list) -> None:
+    """
+    @brief:
+      ラジオゾンデ観測データ(1チャンク分)で気候値を更新します
+    @param sonde_list: [SondeData, ...] (観測月はタイトルから取得)
+    """
+    if len(sonde_list) <= 0:
+        return
+    month  = [parse_title(sonde_data.title)[1].month for sonde_data in sonde_list]
+    values = pyema_regrid.regrid(sonde_list, clim.levels, 'p', ('height', 'temp', 'dewtemp', 'theta_e'))
+    clim.update(__add_theta(values, clim.levels), month)
+
+
+def update_archive(clim: Climatology, archive: SondeArchive, indices: np.ndarray,
+                   chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+    """
+    @brief:
+      アーカイブの観測で気候値を更新します (chunk_size毎に必要なカラムだけを読み出します)
+    @param indices: 観測の番号 (昇順)
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    for i in range(0, indices.size, chunk_size):
+        chunk  = indices[i:i + chunk_size]
+        month  = archive.time[chunk].astype('datetime64[M]').astype(np.int64) % 12 + 1
+        values = pyema_regrid.regrid_archive(archive, chunk, clim.levels, 'p', ('height', 'temp', 'dewtemp', 'theta_e'))
+        clim.update(__add_theta(values, clim.levels), month)
+
+
+def build_climatology(station: str, time_from: datetime, time_to: datetime,
+                      levels: np.ndarray = pyema_regrid.STANDARD_LEVEL_P, index=None, source=None,
+                      chunk_size: int = DEFAULT_CHUNK_SIZE, verbose: bool = True) -> Climatology:
+    """
+    @brief:
+      観測地点の月別気候値を求めます
+      索引(pyema_index.SondeIndex)にある観測はアーカイブから読み出し，索引にない定時観測(00Z・12Z)の期間だけを
+      取得元から読み出しながら集計します
+    @param station: 観測地点番号
+    @param time_from: 観測時刻の開始 (UTC; この時刻を含む)
+    @param time_to: 観測時刻の終了 (UTC; この時刻を含む)
+    @param levels: 集計する気圧面 [hPa]
+    @param index: ローカルのアーカイブの索引 (Noneの場合は常に取得元から)
+    @param source: 取得元(pyema_source.SondeSource; Noneの場合はWyoming大学から月毎に取得)
+    @param chunk_size: 一度に補間・集計する観測数
+    @param verbose: エコーの有無
+    @return: 気候値
+    """
+    clim = Climatology(levels)
+    if index is None:
+        entries, periods = [], [(time_from, time_to)]
+    else:
+        entries = index.query(station, time_from, time_to)
+        periods = index.missing_periods(station, time_from, time_to, entries=entries)
+
+    for archive_path in sorted(set(entry[2] for entry in entries)):
+        indices = np.sort([entry[3] for entry in entries if entry[2] == archive_path])
+        update_archive(clim, SondeArchive(archive_path), indices, chunk_size)
+
+    # 索引にない期間は取得元から (索引にある観測は除く)
+    n_fetch = 0
+    chunk   = []
+    for sonde_data in pyema_source.iter_sonde_periods(station, periods, source, [entry[1] for entry in entries],
+                                                      verbose):
+        n_fetch += 1
+        chunk.append(sonde_data)
+        if len(chunk) >= chunk_size:
+            update_sonde(clim, chunk)
+            chunk = []
+    update_sonde(clim, chunk)
+
+    # エコー
+    if verbose and index is not None:
+        print('[Archive    ] ' + station + ': ' + str(len(entries)) + ' soundings in archive, '
+              + str(n_fetch) + ' fetched (' + str(len(periods)) + ' missing periods)')
+
+    return clim
@@ -0,0 +1,323 @@
+import calendar
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import pyema_parser
+from pyema_sonde import parse_sonde, parse_title
+from pyema_trace import trace_stage
+
+# ラジオゾンデ観測データ(Wyoming大学; text形式)のURL
+URL_SONDE_TXT = 'http://weather.uwyo.edu/cgi-bin/sounding'
+# HTTPリクエストのタイムアウト(接続, 読込) [s]
+DEFAULT_TIMEOUT = (10.0, 60.0)
+# HTTPリクエストのリトライ回数
+DEFAULT_RETRIES = 3
+# リトライ間隔の係数 [s] (backoff * 2^(n-1) 秒待機)
+DEFAULT_BACKOFF = 0.5
+# 同時リクエスト数
+DEFAULT_MAX_WORKERS = 8
+# ストリーミング受信の1回の読込サイズ [byte]
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def build_url(station: str, year: str, month: str, time_from: str, time_to: str) -> str:
+    """
+    @brief:
+      ラジオゾンデ観測データ(text形式)のURLを作成します
+    @param station: 観測地点番号
+    @param year: 観測年(yyyy)
+    @param month: 観測月(m)
+    @param time_from: 観測時刻(開始; ddhh)
+    @param time_to: 観測時刻(終了; ddhh)
+    @return: URL
+    """
+    return URL_SONDE_TXT + '?region=seasia&TYPE=TEXT%3ALIST&YEAR=' \
+           + year + '&MONTH=' + month + '&FROM=' + time_from \
+           + '&TO=' + time_to + '&STNM=' + station
+
+
+def create_session(pool_size: int = DEFAULT_MAX_WORKERS, retries: int = DEFAULT_RETRIES,
+                   backoff: float = DEFAULT_BACKOFF) -> requests.Session:
+    """
+    @brief:
+      コネクションプーリングと指数バックオフ付きリトライを設定したセッションを作成します
+    @param pool_size: コネクションプールの大きさ
+    @param retries: リトライ回数
+    @param backoff: リトライ間隔の係数 [s]
+    @return: セッション
+    """
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=(429, 500, 502, 503, 504))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+
+# 既定のセッション(初回参照時に生成)
+__default_session = None
+
+
+def get_default_session() -> requests.Session:
+    """
+    @brief:
+      既定のセッションを取得します (コネクションを使い回し，リトライを設定済み; スレッド間で共有できます)
+    """
+    global __default_session
+    if __default_session is None:
+        __default_session = create_session()
+    return __default_session
+
+
+def fetch_html(url: str, session: requests.Session = None, timeout=None, info: dict = None) -> str:
+    """
+    @brief:
+      Webサイトにgetリクエストで送信してHTTPレスポンスボディを取得します
+    @param url: URL
+    @param session: セッション (Noneの場合はセッションを使わずにリクエスト)
+    @param timeout: タイムアウト [s] (Noneの場合は無制限)
+    @param info: 応答の情報の格納先 (status: ステータスコード, latency: 応答ヘッダまでの時間 [s], bytes: 受信バイト数)
+    """
+    if session is None:
+        r = requests.get(url, timeout=timeout)
+    else:
+        r = session.get(url, timeout=timeout)
+
+    if info is not None:
+        info['status']  = r.status_code
+        info['latency'] = r.elapsed.total_seconds()
+        info['bytes']   = len(r.content)
+
+    r.raise_for_status()
+
+    return r.text
+
+
+def fetch_emagram_html(station: str, obs_time: dict, cache=None, session: requests.Session = None,
+                       timeout=None, verbose: bool = True, trace=None) -> str:
+    """
+    @brief:
+      ラジオゾンデ観測データ(text形式)のHTMLを取得します
+      キャッシュが指定された場合は，キャッシュにあればネットワークにアクセスしません
+    @param station: 観測地点番号
+    @param obs_time: 観測時刻 {'year', 'month', 'time'}
+    @param cache: ラジオゾンデ観測データのキャッシュ(pyema_cache.SondeCache)
+    @param session: セッション
+    @param timeout: タイムアウト [s]
+    @param verbose: エコーの有無
+    @param trace: 処理段階の計測(pyema_trace.PipelineTrace; cache, http)
+    @return: HTTPレスポンスボディ
+    """
+    key = (station, obs_time['year'], obs_time['month'], obs_time['time'])
+
+    # キャッシュ参照
+    if cache is not None:
+        with trace_stage(trace, 'cache') as info:
+            html = cache.get(key)
+            info['hit'] = html is not None
+        if html is not None:
+            if verbose:
+                print('[Cache      ] ' + '/'.join(key))
+            return html
+
+    # エマグラムのtextデータ(ワイオミング大学)
+    url_emagram = build_url(station, obs_time['year'], obs_time['month'], obs_time['time'], obs_time['time'])
+
+    # エコー
+    if verbose:
+        print('[URL        ] ' + url_emagram)
+
+    # Webサイトにgetリクエストで送信し情報を取得
+    with trace_stage(trace, 'http', url=url_emagram) as info:
+        html = fetch_html(url_emagram, session, timeout, info)
+
+    # キャッシュに保存
+    if cache is not None:
+        cache.put(key, html)
+
+    return html
+
+
+def split_emagram_html(html: str) -> list:
+    """
+    @brief:
+      HTMLを観測毎の(タイトル, 観測データ)に分割します
+      期間指定の応答は<h2>タグ(タイトル)と直後の<pre>タグ(観測データ)の組が観測の数だけ並びます
+    @param html: HTTPレスポンスボディ
+    @return: [(タイトル, <pre>ブロックの各行), ...]
+    """
+    return list(pyema_parser.iter_sonde_blocks([html]))
+
+
+def stream_emagram_blocks(url: str, session: requests.Session = None, timeout=None):
+    """
+    @brief:
+      HTTPレスポンスボディをストリーミング受信しながら，観測毎の(タイトル, 観測データ)を逐次取り出します
+      レスポンス全体をメモリに保持せず，受信済みの観測から順に返します
+    @param url: URL
+    @param session: セッション
+    @param timeout: タイムアウト [s]
+    @return: (タイトル, <pre>ブロックの各行) のジェネレータ
+    """
+    if session is None:
+        r = requests.get(url, timeout=timeout, stream=True)
+    else:
+        r = session.get(url, timeout=timeout, stream=True)
+
+    with r:
+        r.raise_for_status()
+
+        # 文字コード指定がない場合の既定値
+        if r.encoding is None:
+            r.encoding = 'iso-8859-1'
+
+        yield from pyema_parser.iter_sonde_blocks(r.iter_content(chunk_size=STREAM_CHUNK_SIZE, decode_unicode=True))
+
+
+def iter_sonde_range(station: str, year: str, month: str, time_from: str, time_to: str,
+                     session: requests.Session = None, timeout=None, verbose: bool = True):
+    """
+    @brief:
+      期間内のラジオゾンデ観測データを1回のリクエストで取得し，受信した観測から順にパースして返します
+    @param station: 観測地点番号
+    @param year: 観測年(yyyy)
+    @param month: 観測月(m)
+    @param time_from: 観測時刻(開始; ddhh)
+    @param time_to: 観測時刻(終了; ddhh)
+    @param session: セッション
+    @param timeout: タイムアウト [s]
+    @param verbose: エコーの有無
+    @return: SondeDataのジェネレータ (観測時刻順)
+    """
+    # エマグラムのtextデータ(ワイオミング大学)
+    url_emagram = build_url(station, year, month, time_from, time_to)
+
+    # エコー
+    if verbose:
+        print('[URL        ] ' + url_emagram)
+
+    for title, sonde_txt in stream_emagram_blocks(url_emagram, session, timeout):
+        yield parse_sonde(title, sonde_txt)
+
+
+def fetch_sonde_range(station: str, year: str, month: str, time_from: str, time_to: str,
+                      session: requests.Session = None, timeout=None, verbose: bool = True) -> list:
+    """
+    @brief:
+      期間内のラジオゾンデ観測データを1回のリクエストで一括取得します
+    @param station: 観測地点番号
+    @param year: 観測年(yyyy)
+    @param month: 観測月(m)
+    @param time_from: 観測時刻(開始; ddhh)
+    @param time_to: 観測時刻(終了; ddhh)
+    @param session: セッション
+    @param timeout: タイムアウト [s]
+    @param verbose: エコーの有無
+    @return: [SondeData, ...] (観測時刻順)
+    """
+    return list(iter_sonde_range(station, year, month, time_from, time_to, session, timeout, verbose))
+
+
+def fetch_sonde_day(station: str, year: str, month: str, day: str, verbose: bool = True) -> list:
+    """
+    @brief:
+      1日分(00Z-23Z)のラジオゾンデ観測データを一括取得します
+    """
+    dd = '%02d' % int(day)
+    return fetch_sonde_range(station, year, month, dd + '00', dd + '23', verbose=verbose)
+
+
+def fetch_sonde_month(station: str, year: str, month: str, verbose: bool = True) -> list:
+    """
+    @brief:
+      1か月分のラジオゾンデ観測データを一括取得します
+    """
+    n_day = calendar.monthrange(int(year), int(month))[1]
+    return fetch_sonde_range(station, year, month, '0100', '%02d23' % n_day, verbose=verbose)
+
+
+def iter_sonde_period(station: str, time_from: datetime, time_to: datetime, session: requests.Session = None,
+                      timeout=None, verbose: bool = True):
+    """
+    @brief:
+      月をまたぐ期間のラジオゾンデ観測データを月毎に1回のリクエストで取得し，受信した観測から順に返します
+    @param station: 観測地点番号
+    @param time_from: 観測時刻の開始 (UTC; この時刻を含む)
+    @param time_to: 観測時刻の終了 (UTC; この時刻を含む)
+    @param session: セッション
+    @param timeout: タイムアウト [s]
+    @param verbose: エコーの有無
+    @return: SondeDataのジェネレータ (観測時刻順)
+    """
+    if time_from.tzinfo is None:
+        time_from = time_from.replace(tzinfo=timezone.utc)
+    if time_to.tzinfo is None:
+        time_to = time_to.replace(tzinfo=timezone.utc)
+
+    # 返した観測の観測時刻 (重複して返さない)
+    seen = set()
+
+    year, month = time_from.year, time_from.month
+    while (year, month) <= (time_to.year, time_to.month):
+        # 月内の期間 (ddhh)
+        n_day  = calendar.monthrange(year, month)[1]
+        s_from = '%02d%02d' % (time_from.day, time_from.hour) if (year, month) == (time_from.year, time_from.month) \
+                 else '0100'
+        s_to   = '%02d%02d' % (time_to.day, time_to.hour) if (year, month) == (time_to.year, time_to.month) \
+                 else '%02d23' % n_day
+
+        for sonde_data in iter_sonde_range(station, str(year), str(month), s_from, s_to, session, timeout, verbose):
+            # 応答に期間外・返却済みの観測が含まれていても除外
+            obs_time = parse_title(sonde_data.title)[1]
+            if time_from <= obs_time <= time_to and obs_time not in seen:
+                seen.add(obs_time)
+                yield sonde_data
+
+        year, month = (year + 1, 1) if month >= 12 else (year, month + 1)
+
+
+def fetch_stations(stations: list, obs_time: dict, cache=None, max_workers: int = DEFAULT_MAX_WORKERS,
+                   timeout=DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES,
+                   backoff: float = DEFAULT_BACKOFF, verbose: bool = True, errors: dict = None) -> dict:
+    """
+    @brief:
+      複数地点のラジオゾンデ観測データを並列に取得します
+      同時リクエスト数はmax_workersで制限し，コネクションは1つのセッションで共有します
+    @param stations: 観測地点番号のリスト
+    @param obs_time: 観測時刻 {'year', 'month', 'time'}
+    @param cache: ラジオゾンデ観測データのキャッシュ(pyema_cache.SondeCache)
+    @param max_workers: 同時リクエスト数
+    @param timeout: タイムアウト [s]
+    @param retries: リトライ回数
+    @param backoff: リトライ間隔の係数 [s]
+    @param verbose: エコーの有無
+    @param errors: 取得に失敗した地点の例外の格納先 {観測地点番号: 例外} (報告の仕方は呼び出し側で決めます)
+    @return: {観測地点番号: SondeData} (取得に失敗した地点は含まない)
+    """
+    def fetch(station: str):
+        html = fetch_emagram_html(station, obs_time, cache, session, timeout, verbose)
+        blocks = split_emagram_html(html)
+        if len(blocks) <= 0:
+            raise ValueError('no sounding data: ' + station)
+        return parse_sonde(*blocks[0])
+
+    results = {}
+    with create_session(max_workers, retries, backoff) as session, \
+         ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [(station, executor.submit(fetch, station)) for station in stations]
+        for station, future in futures:
+            try:
+                results[station] = future.result()
+            except Exception as e:
+                if errors is not None:
+                    errors[station] = e
+
+                # エコー
+                if verbose:
+                    print('[Error      ] ' + station + ': ' + str(e))
+
+    return results
@@ -1,10 +1,19 @@
 from pytz import timezone
 from datetime import datetime, timedelta
 import sys
-from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QGridLayout, QMessageBox, \
-                            QLabel, QLineEdit, QPushButton, QAction, QComboBox, QFrame
-from PyQt5.QtCore import pyqtSlot
+import threading
+import traceback
+from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QGridLayout, QHBoxLayout, QMessageBox, \
+                            QLabel, QLineEdit, QPushButton, QAction, QComboBox, QFrame, QProgressBar
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal, pyqtSlot
+# matplotlib(図)・requests(先読み)はウィンドウの表示後に読み込みます (起動を速くするため)
 import pyema
+from pyema_cache import get_default_cache
+
+# 最新観測の先読みの同時リクエスト数
+PREFETCH_MAX_WORKERS = 4
+# 最新観測時刻の確認・取得に失敗した地点の再取得の間隔 [ms]
+PREFETCH_INTERVAL = 5 * 60 * 1000
 
 
 class MainWindow(QMainWindow):
@@ -36,6 +45,99 @@ class MainWindow(QMainWindow):
 
         # ウインドウ
         self.setWindowTitle(self.title)
+        self.resize(1100, 760)
+
+
+class LoadCancelled(Exception):
+    """
+    @brief:
+      観測データの読み出しが中断されたことを示す例外
+    """
+    pass
+
+
+class SondeLoaderSignals(QObject):
+    """
+    @brief:
+      SondeLoaderの通知 (GUIスレッドのスロットへキュー経由で届きます)
+    """
+    progress  = pyqtSignal(int, str)  # 進捗 [%], メッセージ
+    finished  = pyqtSignal(object)    # ラジオゾンデ観測データ(SondeData)
+    failed    = pyqtSignal(str)       # エラー内容
+    cancelled = pyqtSignal()
+
+
+class SondeLoader(QRunnable):
+    """
+    @brief:
+      ラジオゾンデ観測データの取得・パースをワーカースレッドで行います
+      中断は処理の区切り(取得の前後・パースの前後)で受け付けます
+    """
+    def __init__(self, param: dict):
+        super().__init__()
+        self.param   = param
+        self.signals = SondeLoaderSignals()
+
+        self.__cancel = threading.Event()
+
+        # GUIが参照を保持するので，実行後にQt側で破棄させない
+        self.setAutoDelete(False)
+
+    def cancel(self) -> None:
+        self.__cancel.set()
+
+    def is_cancelled(self) -> bool:
+        return self.__cancel.is_set()
+
+    def __progress(self, percent: int, message: str) -> None:
+        if self.__cancel.is_set():
+            raise LoadCancelled()
+        self.signals.progress.emit(percent, message)
+
+    def run(self) -> None:
+        try:
+            sonde_data = pyema.load_sonde(self.param, self.__progress)
+            if self.__cancel.is_set():
+                raise LoadCancelled()
+            self.signals.finished.emit(sonde_data)
+        except LoadCancelled:
+            self.signals.cancelled.emit()
+        except Exception:
+            self.signals.failed.emit(traceback.format_exc())
+
+
+class SondePrefetcherSignals(QObject):
+    """
+    @brief:
+      SondePrefetcherの通知 (GUIスレッドのスロットへキュー経由で届きます)
+    """
+    finished = pyqtSignal(object, object, object)  # 観測時刻(run_pyemaの形式), {観測地点番号: SondeData},
+                                                   # {観測地点番号: 例外}
+
+
+class SondePrefetcher(QRunnable):
+    """
+    @brief:
+      複数地点の最新観測をワーカースレッドで先読みします
+      同時リクエスト数を制限して並列に取得し(pyema_fetch.fetch_stations)，HTMLはキャッシュにも保存します
+      取得に失敗した地点はエコーせずに例外を通知します (報告はGUI側で地点毎に1回だけ行います)
+    """
+    def __init__(self, stations: list, obs_time: dict):
+        super().__init__()
+        self.stations = stations
+        self.obs_time = obs_time
+        self.signals  = SondePrefetcherSignals()
+
+        # GUIが参照を保持するので，実行後にQt側で破棄させない
+        self.setAutoDelete(False)
+
+    def run(self) -> None:
+        import pyema_fetch
+
+        errors  = {}
+        results = pyema_fetch.fetch_stations(self.stations, self.obs_time, get_default_cache(),
+                                             max_workers=PREFETCH_MAX_WORKERS, verbose=False, errors=errors)
+        self.signals.finished.emit(self.obs_time, results, errors)
 
 
 class PyemaGUI(QWidget):
@@ -62,12 +164,36 @@ class PyemaGUI(QWidget):
     def __init__(self):
         super().__init__()
 
+        # 観測データの読み出し (ワーカースレッド; 実行中の読み出しと，その間に要求された最新の設定)
+        self.__pool    = QThreadPool(self)
+        self.__loader  = None
+        self.__pending = None
+
+        # 読み出し済みの観測データ (観測地点・観測時刻が同じなら軸設定の変更は再取得せずに描き直す)
+        self.__sonde_data = None
+        self.__sonde_key  = None
+
+        # 最新観測の先読み (先読み中の処理, 先読みした観測時刻, {観測データのキー: SondeData}, 失敗を報告した地点)
+        self.__prefetcher        = None
+        self.__prefetched_time   = None
+        self.__prefetched        = {}
+        self.__prefetch_reported = set()
+
         # ウィジェット設定
         self.__set_widget()
 
         # グリッド設定
         self.__set_grid()
 
+        # 図の生成 (ウィンドウの表示後)
+        QTimer.singleShot(0, self.__init_canvas)
+
+        # 最新観測の先読み (起動直後と，その後は定期的に新しい観測時刻・取得に失敗した地点を確認)
+        self.__prefetch_timer = QTimer(self)
+        self.__prefetch_timer.timeout.connect(self.__on_prefetch_timer)
+        self.__prefetch_timer.start(PREFETCH_INTERVAL)
+        QTimer.singleShot(0, self.__on_prefetch_timer)
+
     def __set_widget(self) -> None:
         # 観測地点
         self.__set_widget_station()
@@ -84,6 +210,9 @@ class PyemaGUI(QWidget):
         # 結果表示
         self.__set_widget_output()
 
+        # 図 (埋め込み; 全ての描画で使い回す)
+        self.__set_widget_canvas()
+
     def __set_widget_station(self) -> None:
         # 観測地点名
         self.combo_station = QComboBox(self)
@@ -183,6 +312,51 @@ class PyemaGUI(QWidget):
         self.button_plot = QPushButton('plot (matplotlib)', self)
         self.button_plot.clicked.connect(self.__on_click_plot)
 
+        # 進捗
+        self.progress_bar = QProgressBar(self)
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setValue(0)
+        self.label_progress = QLabel('', self)
+
+        # 中止
+        self.button_cancel = QPushButton('中止', self)
+        self.button_cancel.setDisabled(True)
+        self.button_cancel.clicked.connect(self.__on_click_cancel)
+
+    def __set_widget_canvas(self) -> None:
+        # 図の場所だけを確保 (図・描画器は__init_canvasでウィンドウの表示後に1回だけ生成)
+        self.figure   = None
+        self.renderer = None
+        self.canvas   = QWidget(self)
+        self.canvas.setMinimumSize(480, 480)
+
+        # 軸設定の変更は読み出し済みの観測データで描き直す
+        self.combo_axis_h_type.activated[str].connect(self.__on_change_axis)
+        self.combo_axis_v_type.activated[str].connect(self.__on_change_axis)
+        self.combo_axis_h_limit.activated[str].connect(self.__on_change_axis)
+        self.combo_axis_v_limit.activated[str].connect(self.__on_change_axis)
+        for text in (self.text_axis_h1, self.text_axis_h2, self.text_axis_v1, self.text_axis_v2):
+            text.editingFinished.connect(self.__on_change_axis)
+
+    @pyqtSlot()
+    def __init_canvas(self) -> None:
+        # 図・描画器を生成して確保した場所と置き換え (matplotlibはここで初めて読み込む)
+        if self.renderer is not None:
+            return
+
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
+        import pyema_plot
+
+        self.figure = Figure(figsize=(6.4, 6.4))
+        canvas      = FigureCanvasQTAgg(self.figure)
+        canvas.setMinimumSize(480, 480)
+        self.layout().replaceWidget(self.canvas, canvas)
+        self.canvas.deleteLater()
+        self.canvas = canvas
+
+        self.renderer = pyema_plot.EmagramRenderer(self.figure.add_subplot(1, 1, 1), blit=True)
+
     def __set_grid(self) -> None:
         # ウィジェット配置方法: 格子状
         grid = QGridLayout()
@@ -272,7 +446,21 @@ class PyemaGUI(QWidget):
         grid.addWidget(QLabel('プロット図表示'), irow, 0)
         grid.addWidget(self.button_plot        , irow, 1, 1, 2)
 
-        self.setLayout(grid)
+        irow += 1
+        grid.addWidget(QLabel('進捗')          , irow, 0)
+        grid.addWidget(self.progress_bar       , irow, 1)
+        grid.addWidget(self.button_cancel      , irow, 2)
+
+        irow += 1
+        grid.addWidget(self.label_progress     , irow, 1, 1, 2)
+        grid.setRowStretch(irow + 1, 1)
+
+        # 左: 設定, 右: 図
+        layout = QHBoxLayout()
+        layout.addLayout(grid)
+        layout.addWidget(self.canvas, 1)
+
+        self.setLayout(layout)
 
     @pyqtSlot()
     def __activated_combo_station(self) -> None:
@@ -299,76 +487,254 @@ class PyemaGUI(QWidget):
             self.text_axis_v1.setDisabled(False)
             self.text_axis_v2.setDisabled(False)
 
+    def __get_param(self) -> dict:
+        """
+        @brief:
+          ウィジェットの設定からrun_pyemaのパラメータを作成します
+        """
+        # 観測地点設定
+        if self.combo_station.currentText() == '...地点番号で指定':
+            station = self.text_station.text()
+        else:
+            station = self.SONDE_STATION[self.combo_station.currentText()]
+
+        # 観測時刻設定
+        year  = self.text_obs_time_y.text()
+        month = self.text_obs_time_m.text().lstrip('0')
+        time  = self.text_obs_time_d.text().lstrip('0') \
+              + self.combo_obs_time_h.currentText().rstrip('Z')
+
+        # 横軸設定
+        if   self.combo_axis_h_type.currentText() == '気温[C]':
+            axis_h_type = 't'
+        elif self.combo_axis_h_type.currentText() == '温位[K]':
+            axis_h_type = 'pt'
+        else:
+            raise
+
+        if   self.combo_axis_h_limit.currentText() == '自動':
+            axis_h_limit = None
+        else:
+            h1 = float(self.text_axis_h1.text())
+            h2 = float(self.text_axis_h2.text())
+            axis_h_limit = [h1, h2]
+
+        # 縦軸設定
+        if   self.combo_axis_v_type.currentText() == '気圧[hPa]':
+            axis_v_type = 'p'
+        elif self.combo_axis_v_type.currentText() == '高度[m]':
+            axis_v_type = 'z'
+        else:
+            raise
+
+        if   self.combo_axis_v_limit.currentText() == '自動':
+            axis_v_limit = None
+        else:
+            v1 = float(self.text_axis_v1.text())
+            v2 = float(self.text_axis_v2.text())
+            axis_v_limit = [v1, v2]
+
+        # パラメータ設定
+        param = {
+            'station' : station,
+            'obs_time': {
+                'year' : year,
+                'month': month,
+                'time' : time
+            },
+            'axis_h' : {
+                'type' : axis_h_type,
+                'limit': axis_h_limit
+            },
+            'axis_v' : {
+                'type' : axis_v_type,
+                'limit': axis_v_limit
+            }
+        }
+
+        return param
+
     @pyqtSlot()
     def __on_click_plot(self):
         try:
-            # 観測地点設定
-            if self.combo_station.currentText() == '...地点番号で指定':
-                station = self.text_station.text()
-            else:
-                station = self.SONDE_STATION[self.combo_station.currentText()]
-
-            # 観測時刻設定
-            year  = self.text_obs_time_y.text()
-            month = self.text_obs_time_m.text().lstrip('0')
-            time  = self.text_obs_time_d.text().lstrip('0') \
-                  + self.combo_obs_time_h.currentText().rstrip('Z')
-
-            # 横軸設定
-            if   self.combo_axis_h_type.currentText() == '気温[C]':
-                axis_h_type = 't'
-            elif self.combo_axis_h_type.currentText() == '温位[K]':
-                axis_h_type = 'pt'
-            else:
-                raise
-
-            if   self.combo_axis_h_limit.currentText() == '自動':
-                axis_h_limit = None
-            else:
-                h1 = float(self.text_axis_h1.text())
-                h2 = float(self.text_axis_h2.text())
-                axis_h_limit = [h1, h2]
-
-            # 縦軸設定
-            if   self.combo_axis_v_type.currentText() == '気圧[hPa]':
-                axis_v_type = 'p'
-            elif self.combo_axis_v_type.currentText() == '高度[m]':
-                axis_v_type = 'z'
-            else:
-                raise
-
-            if   self.combo_axis_v_limit.currentText() == '自動':
-                axis_v_limit = None
-            else:
-                v1 = float(self.text_axis_v1.text())
-                v2 = float(self.text_axis_v2.text())
-                axis_v_limit = [v1, v2]
-
-            # パラメータ設定
-            param = {
-                'station' : station,
-                'obs_time': {
-                    'year' : year,
-                    'month': month,
-                    'time' : time
-                },
-                'axis_h' : {
-                    'type' : axis_h_type,
-                    'limit': axis_h_limit
-                },
-                'axis_v' : {
-                    'type' : axis_v_type,
-                    'limit': axis_v_limit
-                }
-            }
+            param = self.__get_param()
+        except Exception as e:
+            except_str = traceback.format_exc()
+            QMessageBox.critical(self, "Error", except_str, QMessageBox.Yes)
+            return
+
+        # 読み出し済みの観測なら再取得せずに描き直す
+        key = self.__get_sonde_key(param)
+        if self.__loader is None and key == self.__sonde_key:
+            self.__draw(param)
+            return
+
+        # 先読み済みの観測なら取得せずに描画
+        if key in self.__prefetched:
+            if self.__loader is not None:
+                self.__pending = None
+                self.__loader.cancel()
+            self.__sonde_data = self.__prefetched[key]
+            self.__sonde_key  = key
+            self.__draw(param)
+            return
+
+        # 読み出し中の観測と同じなら中断せず，描画に使う設定だけを差し替え
+        if self.__loader is not None and not self.__loader.is_cancelled() \
+                and key == self.__get_sonde_key(self.__loader.param):
+            self.__loader.param = param
+            return
+
+        # 読み出し中の場合は中断して最新の設定だけを保留 (連続したクリックはまとめて1回だけ処理)
+        if self.__loader is not None:
+            self.__loader.cancel()
+            self.__pending = param
+            self.label_progress.setText('前回の処理を中止中')
+            return
+
+        self.__start_loader(param)
+
+    @staticmethod
+    def __get_sonde_key(param: dict) -> tuple:
+        # 観測データを識別するキー (観測地点番号, 年, 月, ddhh)
+        obs_time = param['obs_time']
+        return param['station'], obs_time['year'], obs_time['month'], obs_time['time']
+
+    @pyqtSlot()
+    def __on_prefetch_timer(self):
+        # 新しい観測時刻になった場合は全地点，同じ観測時刻の場合は取得できていない地点を先読み
+        if self.__prefetcher is not None:
+            return
+
+        year, month, day, hour = PyemaGUI.get_latest_obs_time(verbose=False)
+        obs_time = {
+            'year' : year,
+            'month': month.lstrip('0'),
+            'time' : day.lstrip('0') + hour.rstrip('Z')
+        }
+
+        if obs_time != self.__prefetched_time:
+            self.__prefetched_time   = obs_time
+            self.__prefetched        = {}
+            self.__prefetch_reported = set()
+
+        stations = [station for station in self.SONDE_STATION.values()
+                    if self.__get_sonde_key({'station': station, 'obs_time': obs_time}) not in self.__prefetched]
+        if len(stations) <= 0:
+            return
+
+        self.__prefetcher = SondePrefetcher(stations, obs_time)
+        self.__prefetcher.signals.finished.connect(self.__on_prefetch_finished)
+        self.__pool.start(self.__prefetcher)
+
+    @pyqtSlot(object, object, object)
+    def __on_prefetch_finished(self, obs_time: dict, results: dict, errors: dict):
+        self.__prefetcher = None
+
+        # 先読み中に観測時刻が変わった場合は破棄
+        if obs_time != self.__prefetched_time:
+            return
+
+        for station, sonde_data in results.items():
+            self.__prefetched[self.__get_sonde_key({'station': station, 'obs_time': obs_time})] = sonde_data
+
+        # 失敗した地点は観測時刻毎に1回だけ報告 (再取得の度には報告しない; 未発表の観測もあるためダイアログは出さない)
+        for station, e in errors.items():
+            if station not in self.__prefetch_reported:
+                self.__prefetch_reported.add(station)
+                print('[Prefetch   ] ' + station + ': ' + str(e))
+
+    @pyqtSlot()
+    def __on_change_axis(self):
+        # 軸設定のみの変更 (観測データの読み出し中・未読み出しの場合は何もしない)
+        if self.__sonde_data is None or self.__loader is not None:
+            return
 
-            pyema.run_pyema(param)
+        try:
+            param = self.__get_param()
+        except Exception:
+            # 入力途中の境界値などは無視
+            return
 
+        if self.__get_sonde_key(param) == self.__sonde_key:
+            self.__draw(param)
+
+    def __draw(self, param: dict) -> None:
+        # 読み出し済みの観測データを埋め込みの図に描画 (GUIスレッド)
+        try:
+            self.__init_canvas()
+            self.renderer.update(self.__sonde_data, param)
         except Exception as e:
-            import traceback
             except_str = traceback.format_exc()
             QMessageBox.critical(self, "Error", except_str, QMessageBox.Yes)
 
+    @pyqtSlot()
+    def __on_click_cancel(self):
+        self.__pending = None
+        if self.__loader is not None:
+            self.__loader.cancel()
+            self.label_progress.setText('中止中')
+
+    def __start_loader(self, param: dict) -> None:
+        # 観測データの読み出しをワーカースレッドで開始
+        loader = SondeLoader(param)
+        loader.signals.progress.connect(self.__on_loader_progress)
+        loader.signals.finished.connect(self.__on_loader_finished)
+        loader.signals.failed.connect(self.__on_loader_failed)
+        loader.signals.cancelled.connect(self.__on_loader_cancelled)
+
+        self.__loader = loader
+        self.button_cancel.setDisabled(False)
+        self.progress_bar.setValue(0)
+        self.label_progress.setText('')
+
+        self.__pool.start(loader)
+
+    def __end_loader(self) -> bool:
+        # 読み出しの終了処理 (保留中の設定があれば読み出しを開始してTrueを返す)
+        self.__loader = None
+        self.button_cancel.setDisabled(True)
+
+        if self.__pending is not None:
+            param, self.__pending = self.__pending, None
+            self.__start_loader(param)
+            return True
+
+        return False
+
+    @pyqtSlot(int, str)
+    def __on_loader_progress(self, percent: int, message: str):
+        self.progress_bar.setValue(percent)
+        self.label_progress.setText(message)
+
+    @pyqtSlot(object)
+    def __on_loader_finished(self, sonde_data):
+        param     = self.__loader.param
+        cancelled = self.__loader.is_cancelled()
+        if self.__end_loader() or cancelled:
+            return
+
+        # 描画はGUIスレッドで行う
+        self.__sonde_data = sonde_data
+        self.__sonde_key  = self.__get_sonde_key(param)
+        self.__draw(param)
+
+    @pyqtSlot(str)
+    def __on_loader_failed(self, except_str: str):
+        if self.__end_loader():
+            return
+
+        self.label_progress.setText('エラー')
+        QMessageBox.critical(self, "Error", except_str, QMessageBox.Yes)
+
+    @pyqtSlot()
+    def __on_loader_cancelled(self):
+        if self.__end_loader():
+            return
+
+        self.progress_bar.setValue(0)
+        self.label_progress.setText('中止しました')
+
     @pyqtSlot()
     def __on_click_obs_time_now(self):
         year, month, day, hour = PyemaGUI.get_latest_obs_time()
@@ -378,7 +744,7 @@ class PyemaGUI(QWidget):
         self.combo_obs_time_h.setCurrentText(hour)
 
     @staticmethod
-    def get_latest_obs_time() -> tuple:
+    def get_latest_obs_time(verbose: bool = True) -> tuple:
         """
         @brief:
           最新データの観測時刻(UTC)を取得します
@@ -403,8 +769,9 @@ class PyemaGUI(QWidget):
         hour  = utc_obs.strftime("%H") + 'Z'  # 観測時
 
         # エコー
-        print('[UTC(   now)] ' + str(utc_now))
-        print('[UTC(latest)] ' + str(utc_obs))
+        if verbose:
+            print('[UTC(   now)] ' + str(utc_now))
+            print('[UTC(latest)] ' + str(utc_obs))
 
         return year, month, day, hour
 
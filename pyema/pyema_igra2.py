@@ -0,0 +1,284 @@
+import glob
+import os
+from datetime import datetime, timezone
+import numpy as np
+import pyema_parser
+import pyema_util
+from pyema_sonde import SondeData, format_title
+
+# IGRA2(NOAA Integrated Global Radiosonde Archive v2)の観測データファイルの接尾辞
+IGRA2_SUFFIX = '-data.txt'
+# ヘッダ行の桁位置 (開始, 終了) (0始まり; 終了は含まない)
+HEADER_FIELD = {
+    'id'     : ( 1, 12),  # 観測地点ID (例: JAM00047646)
+    'year'   : (13, 17),  # 観測年
+    'month'  : (18, 20),  # 観測月
+    'day'    : (21, 23),  # 観測日
+    'hour'   : (24, 26),  # 観測時 (UTC; 99は欠測)
+    'reltime': (27, 31),  # 放球時刻 (HHMM; 9999は欠測)
+    'numlev' : (32, 36),  # 高度数
+    'lat'    : (55, 62),  # 緯度 [1e-4 deg]
+    'lon'    : (63, 71)   # 経度 [1e-4 deg]
+}
+# データ行の桁位置 (開始, 終了) (0始まり; 終了は含まない)
+DATA_FIELD = {
+    'press': ( 9, 15),  # 気圧 [Pa]
+    'gph'  : (16, 21),  # ジオポテンシャル高度 [m]
+    'temp' : (22, 27),  # 気温 [0.1 C]
+    'rh'   : (28, 33),  # 相対湿度 [0.1 %]
+    'dpdp' : (34, 39),  # 湿数 [0.1 C]
+    'wdir' : (40, 45),  # 風向 [deg]
+    'wspd' : (46, 51)   # 風速 [0.1 m/s]
+}
+# 欠測値 (-8888: 品質管理で除去, -9999: 欠測)
+MISSING_VALUE = (-8888.0, -9999.0)
+# 風速の単位換算 [m/s] -> [knot]
+MPS_TO_KNOT = 1.0 / 0.514444
+# 日付範囲の探索で二分探索をやめて順に読む範囲 [byte]
+SEEK_LINEAR_BYTES = 64 * 1024
+# データ行をまとめてデコードする観測数
+DECODE_BATCH = 256
+
+
+def __field(lines: np.ndarray, field: tuple) -> np.ndarray:
+    # 固定長の桁位置の数値を一括でデコード (欠測値はNaN)
+    begin, end = field
+    cells  = np.ascontiguousarray(lines[:, begin:end]).view('S' + str(end - begin)).ravel()
+    values = cells.astype(np.float64)
+    values[(values == MISSING_VALUE[0]) | (values == MISSING_VALUE[1])] = np.nan
+    return values
+
+
+def decode_levels(lines: np.ndarray) -> np.ndarray:
+    """
+    @brief:
+      IGRA2のデータ行を一括でデコードしてWyoming大学のtext形式と同じカラムの2次元配列に変換します
+      混合比・温位・相当温位・仮温位は気温・湿数・気圧から求めます (相当温位はpyema_util.calc_theta_esと同じ式)
+    @param lines: データ行 (uint8; shape=(n_level, 1行のバイト数))
+    @return: 観測データ [高度, カラム] (shape=(n_level, N_COLUMN_SONDE_TXT))
+    """
+    pres = __field(lines, DATA_FIELD['press']) / 100.0
+    temp = __field(lines, DATA_FIELD['temp' ]) / 10.0
+    dewtemp = temp - __field(lines, DATA_FIELD['dpdp']) / 10.0
+
+    # 水蒸気圧 [hPa] => 混合比 [kg/kg]
+    t = temp + 273.15
+    e = pyema_util.calc_es_fast(dewtemp + 273.15)
+    q = 0.622 * e / (pres - e)
+
+    # 相対湿度 [%] (記録がない場合は気温・露点温度から)
+    relh    = __field(lines, DATA_FIELD['rh']) / 10.0
+    missing = np.isnan(relh)
+    relh[missing] = (100.0 * e / pyema_util.calc_es_fast(t))[missing]
+
+    theta = t * np.power(1000.0 / pres, 0.286)
+
+    table = np.empty((lines.shape[0], pyema_parser.N_COLUMN_SONDE_TXT), dtype=np.float64)
+    table[:, pyema_parser.COL_PRES   ] = pres
+    table[:, pyema_parser.COL_HEIGHT ] = __field(lines, DATA_FIELD['gph'])
+    table[:, pyema_parser.COL_TEMP   ] = temp
+    table[:, pyema_parser.COL_DEWTEMP] = dewtemp
+    table[:, pyema_parser.COL_RELH   ] = relh
+    table[:, pyema_parser.COL_MIXR   ] = q * 1000.0
+    table[:, pyema_parser.COL_DRCT   ] = __field(lines, DATA_FIELD['wdir'])
+    table[:, pyema_parser.COL_SKNT   ] = __field(lines, DATA_FIELD['wspd']) / 10.0 * MPS_TO_KNOT
+    table[:, pyema_parser.COL_THETA  ] = theta
+    table[:, pyema_parser.COL_THETA_E] = t * np.power(1000.0 / (pres - e), 0.286) * np.exp((2.50e6 / 1004.0) * (q / t))
+    table[:, pyema_parser.COL_VTHETA ] = theta * (1.0 + 0.61 * q)
+
+    return table
+
+
+class Igra2Reader:
+    """
+    @brief:
+      IGRA2の観測地点毎の観測データファイル(固定長のtext形式; 例: JAM00047646-data.txt)を先頭から逐次読み出します
+        - ヘッダ行だけを読んでデータ行は読み飛ばせるので，観測の一覧はファイル全体をデコードせずに作れます
+        - データ行は観測毎にまとめて読み込み，複数の観測を連結して一括でデコードします
+        - 観測は観測時刻順に並んでいるので，期間の先頭へは二分探索でシークします
+      zip圧縮のファイルはシークできないので，展開してから指定してください
+    """
+    def __init__(self, path: str):
+        """
+        @param path: 観測データファイル
+        """
+        self.path = path
+
+    @staticmethod
+    def __decode_header(line: bytes) -> dict:
+        def field(name: str) -> str:
+            begin, end = HEADER_FIELD[name]
+            return line[begin:end].decode('ascii')
+
+        # 観測時が欠測の場合は放球時刻の時
+        # (どちらも欠測の場合は観測時刻が分からないので読み出さない; シークの比較用に観測日の00Zとする)
+        hour         = int(field('hour'))
+        reltime      = int(field('reltime'))
+        time_missing = hour == 99 and reltime == 9999
+        if hour == 99:
+            hour = 0 if time_missing else reltime // 100
+
+        igra_id = field('id').strip()
+        return {
+            'id'     : igra_id,
+            'station': igra_id[-5:] if igra_id[2] == 'M' else igra_id,  # WMOの観測地点番号(5桁)
+            'time'   : datetime(int(field('year')), int(field('month')), int(field('day')), hour,
+                                tzinfo=timezone.utc),
+            'numlev' : int(field('numlev')),
+            'lat'    : int(field('lat')) / 10000.0,
+            'lon'    : int(field('lon')) / 10000.0,
+            'time_missing': time_missing
+        }
+
+    @staticmethod
+    def __read_lines(f, numlev: int) -> np.ndarray:
+        # データ行をまとめて読み込み [行, 桁] (行の長さが揃っていない場合は1行ずつ読み直す)
+        if numlev <= 0:
+            return np.empty((0, max(field[1] for field in DATA_FIELD.values())), dtype=np.uint8)
+        offset = f.tell()
+        first  = f.readline()
+        width  = len(first)
+        buf    = first + f.read(width * (numlev - 1)) if numlev > 1 else first
+        if len(buf) == width * numlev and buf[width - 1::width].count(b'\n') == numlev:
+            return np.frombuffer(buf, dtype=np.uint8).reshape(numlev, width)
+
+        f.seek(offset)
+        lines = [f.readline().rstrip(b'\r\n') for _ in range(numlev)]
+        width = max(max(len(line) for line in lines), max(field[1] for field in DATA_FIELD.values()))
+        return np.frombuffer(b''.join(line.ljust(width) for line in lines), dtype=np.uint8).reshape(numlev, width)
+
+    @staticmethod
+    def __skip_lines(f, numlev: int) -> None:
+        # データ行を読み飛ばし (1行目の長さで一括シークし，次の行がヘッダでなければ1行ずつ読み直す)
+        if numlev <= 0:
+            return
+        offset = f.tell()
+        width  = len(f.readline())
+        f.seek(offset + width * numlev)
+        head = f.read(1)
+        if head in (b'#', b''):
+            f.seek(-len(head), os.SEEK_CUR)
+            return
+
+        f.seek(offset)
+        for _ in range(numlev):
+            f.readline()
+
+    def __header_at(self, f, pos: int):
+        # pos以降の最初のヘッダ行 (位置, ヘッダ) (ない場合はNone)
+        if pos > 0:
+            f.seek(pos - 1)
+            f.readline()  # 行の途中から読み始めた場合は行末まで読み捨て
+        else:
+            f.seek(0)
+        while True:
+            offset = f.tell()
+            line   = f.readline()
+            if len(line) <= 0:
+                return None
+            if line[:1] == b'#':
+                return offset, self.__decode_header(line)
+
+    def __seek(self, f, time_from: datetime) -> None:
+        # 観測時刻がtime_from以降の最初のヘッダ行の直前へシーク (二分探索)
+        lo, hi = 0, os.fstat(f.fileno()).st_size
+        while hi - lo > SEEK_LINEAR_BYTES:
+            mid   = (lo + hi) // 2
+            found = self.__header_at(f, mid)
+            if found is None or found[1]['time'] >= time_from:
+                hi = mid
+            else:
+                lo = found[0] + 1
+        found = self.__header_at(f, lo)
+        f.seek(found[0] if found is not None else hi)
+
+    def iter_header(self, time_from: datetime = None, time_to: datetime = None, read_levels: bool = False):
+        """
+        @brief:
+          観測のヘッダを順に読み出します (データ行は読み飛ばします)
+          観測時・放球時刻がともに欠測の観測は観測時刻が分からないので除きます
+        @param time_from: 観測時刻の開始 (UTC; この時刻を含む; Noneの場合は先頭から)
+        @param time_to: 観測時刻の終了 (UTC; この時刻を含む; Noneの場合は末尾まで)
+        @param read_levels: データ行も読み込むか (Trueの場合はヘッダの'lines'にデータ行 [行, 桁] を格納)
+        @return: ヘッダ {'id', 'station', 'time', 'numlev', 'lat', 'lon', 'time_missing'} のジェネレータ
+        """
+        if time_from is not None and time_from.tzinfo is None:
+            time_from = time_from.replace(tzinfo=timezone.utc)
+        if time_to is not None and time_to.tzinfo is None:
+            time_to = time_to.replace(tzinfo=timezone.utc)
+
+        with open(self.path, 'rb') as f:
+            if time_from is not None:
+                self.__seek(f, time_from)
+
+            for line in iter(f.readline, b''):
+                if line[:1] != b'#':
+                    continue
+                header = self.__decode_header(line)
+                if time_to is not None and header['time'] > time_to:
+                    return
+                if header['time_missing'] or (time_from is not None and header['time'] < time_from):
+                    self.__skip_lines(f, header['numlev'])
+                    continue
+
+                if read_levels:
+                    header['lines'] = self.__read_lines(f, header['numlev'])
+                else:
+                    self.__skip_lines(f, header['numlev'])
+                yield header
+
+    def iter_sonde(self, time_from: datetime = None, time_to: datetime = None):
+        """
+        @brief:
+          観測をSondeDataとして順に読み出します (気圧・気温が欠測の高度は除きます)
+        @param time_from: 観測時刻の開始 (UTC; この時刻を含む; Noneの場合は先頭から)
+        @param time_to: 観測時刻の終了 (UTC; この時刻を含む; Noneの場合は末尾まで)
+        @return: SondeDataのジェネレータ (タイトルは pyema_sonde.parse_title で読み取れる形式)
+        """
+        batch = []
+        for header in self.iter_header(time_from, time_to, read_levels=True):
+            if header['numlev'] <= 0:
+                continue
+            # 行の長さが同じ観測はDECODE_BATCH個までまとめてデコード
+            if len(batch) > 0 and batch[0]['lines'].shape[1] != header['lines'].shape[1]:
+                yield from self.__decode_batch(batch)
+                batch = []
+            batch.append(header)
+            if len(batch) >= DECODE_BATCH:
+                yield from self.__decode_batch(batch)
+                batch = []
+        yield from self.__decode_batch(batch)
+
+    @staticmethod
+    def __decode_batch(batch: list):
+        # 複数の観測のデータ行を連結して一括でデコードし，観測毎のSondeDataに分割
+        if len(batch) <= 0:
+            return
+        table  = decode_levels(np.concatenate([header['lines'] for header in batch]))
+        offset = np.cumsum([0] + [header['numlev'] for header in batch])
+        for i, header in enumerate(batch):
+            part = table[offset[i]:offset[i + 1]]
+            part = part[~np.isnan(part[:, pyema_parser.COL_PRES]) & ~np.isnan(part[:, pyema_parser.COL_TEMP])]
+            yield SondeData(format_title(header['station'], header['id'], header['time']), part)
+
+    def load(self, obs_time: datetime):
+        """
+        @brief:
+          1つの観測を読み出します
+        @return: SondeData (ファイルにない場合はNone)
+        """
+        return next(self.iter_sonde(obs_time, obs_time), None)
+
+
+def find_igra2_file(directory: str, station: str):
+    """
+    @brief:
+      ディレクトリから観測地点の観測データファイルを探します
+    @param station: 観測地点番号(WMO; 例: 47646) または IGRA2の観測地点ID (例: JAM00047646)
+    @return: 観測データファイル (ない場合はNone)
+    """
+    for pattern in (station + IGRA2_SUFFIX, '??M' + station.zfill(8) + IGRA2_SUFFIX):
+        found = sorted(glob.glob(os.path.join(directory, pattern)))
+        if len(found) > 0:
+            return found[0]
+    return None
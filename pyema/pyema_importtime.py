@@ -0,0 +1,74 @@
+import os
+import subprocess
+import sys
+
+# 計測するモジュールと，import時に読み込んではならない重いライブラリ
+IMPORT_CHECK = {
+    'pyema_util'   : ('matplotlib', 'requests', 'PyQt5'),
+    'pyema_parser' : ('matplotlib', 'requests', 'PyQt5'),
+    'pyema_sonde'  : ('matplotlib', 'requests', 'PyQt5'),
+    'pyema_archive': ('matplotlib', 'requests', 'PyQt5'),
+    'pyema_index'  : ('matplotlib', 'requests', 'PyQt5'),
+    'pyema_regrid' : ('matplotlib', 'requests', 'PyQt5'),
+    'pyema_climate': ('matplotlib', 'requests', 'PyQt5'),
+    'pyema_section': ('matplotlib', 'requests', 'PyQt5'),
+    'pyema_trace'  : ('matplotlib', 'requests', 'PyQt5'),
+    'pyema_igra2'  : ('matplotlib', 'requests', 'PyQt5'),
+    'pyema_source' : ('matplotlib', 'requests', 'PyQt5'),
+    'pyema_fetch'  : ('matplotlib', 'PyQt5'),
+    'pyema'        : ('matplotlib', 'requests', 'PyQt5'),
+    'pyema_gui'    : ('matplotlib', 'requests'),
+    'pyema_plot'   : ()
+}
+# 計測の繰り返し回数 (最小値を採用)
+N_REPEAT = 5
+
+
+def measure_import(module: str) -> tuple:
+    """
+    @brief:
+      新しいインタプリタでモジュールをimportし，所要時間と読み込まれたモジュールを求めます
+      (python -X importtime の累積時間; ファイルキャッシュの影響を避けるため最小値を採用)
+    @param module: モジュール名
+    @return: (import時間 [s], 読み込まれたモジュール名の集合)
+    """
+    code = 'import sys; import ' + module + '; print("\\n".join(sys.modules))'
+    env  = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+
+    best = None
+    for _ in range(N_REPEAT):
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], env=env, capture_output=True,
+                              text=True, check=True)
+
+        # 書式: "import time: self [us] | cumulative | imported package" (最上位は字下げなし)
+        for line in proc.stderr.splitlines():
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].strip() == module:
+                elapsed = int(fields[1]) * 1.0e-6
+                best = elapsed if best is None else min(best, elapsed)
+
+    return best, set(proc.stdout.split())
+
+
+def check_import_time(verbose: bool = True) -> bool:
+    """
+    @brief:
+      IMPORT_CHECKの全モジュールのimport時間を計測し，重いライブラリを読み込んでいないか確認します
+    @return: 全て問題なければTrue
+    """
+    ok = True
+    for module, forbidden in IMPORT_CHECK.items():
+        elapsed, loaded = measure_import(module)
+        heavy = [name for name in forbidden if name in loaded]
+        ok &= len(heavy) <= 0
+
+        # エコー
+        if verbose:
+            print('[Import     ] ' + module.ljust(14) + ': ' + '{:8.1f}'.format(elapsed * 1000.0) + ' ms'
+                  + ('' if len(heavy) <= 0 else '  NG (loaded: ' + ', '.join(heavy) + ')'))
+
+    return ok
+
+
+if __name__ == '__main__':
+    sys.exit(0 if check_import_time() else 1)
@@ -0,0 +1,291 @@
+import contextlib
+import os
+import sqlite3
+from datetime import datetime, timezone
+import numpy as np
+from pyema_archive import SondeArchive, to_datetime64
+
+# 索引ファイルの既定パス
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser('~'), '.pyema', 'sonde_index.sqlite3')
+# 定時観測の観測時(UTC) (索引にない観測の判定に使用)
+OBS_HOURS = (0, 12)
+
+
+class SondeIndex:
+    """
+    @brief:
+      ローカルに保存したラジオゾンデ観測データの索引(SQLite)
+      (観測地点番号, 観測時刻) => (アーカイブのディレクトリ, アーカイブ内の観測の番号) を保持し，
+      観測地点・期間・観測時(UTC)による範囲検索を行います
+      同じ観測地点・観測時刻の観測は後から登録したアーカイブのものを参照します
+    """
+    def __init__(self, path: str = DEFAULT_INDEX_PATH):
+        """
+        @param path: 索引ファイルのパス (初回の登録時に作成; 参照だけの場合は作成しません)
+        """
+        self.path      = path
+        self.__created = False
+
+    @contextlib.contextmanager
+    def __connect(self):
+        # スレッド・プロセス間で共有できるよう操作毎に接続します
+        conn = sqlite3.connect(self.path, timeout=30.0)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def __create(self) -> None:
+        # 索引ファイル・テーブルを作成 (初回の登録時)
+        if self.__created:
+            return
+
+        dir_name = os.path.dirname(self.path)
+        if len(dir_name) > 0:
+            os.makedirs(dir_name, exist_ok=True)
+
+        with self.__connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS sonde ('
+                         ' station TEXT NOT NULL,'
+                         ' time    INTEGER NOT NULL,'
+                         ' hour    INTEGER NOT NULL,'
+                         ' archive TEXT NOT NULL,'
+                         ' row     INTEGER NOT NULL,'
+                         ' n_level INTEGER NOT NULL,'
+                         ' PRIMARY KEY (station, time))')
+            conn.execute('CREATE INDEX IF NOT EXISTS sonde_time ON sonde (time)')
+            conn.execute('CREATE INDEX IF NOT EXISTS sonde_archive ON sonde (archive)')
+        self.__created = True
+
+    def __exists(self) -> bool:
+        # 参照できる索引ファイルがあるか (ない場合は作成しない)
+        if not self.__created and os.path.isfile(self.path):
+            self.__create()
+        return self.__created
+
+    @staticmethod
+    def __epoch(dt: datetime) -> int:
+        # datetime => UNIX時刻 [s] (タイムゾーンなしはUTCとみなします)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return int(dt.timestamp())
+
+    def add_archive(self, archive_path: str) -> int:
+        """
+        @brief:
+          アーカイブの観測を索引に登録します (同じアーカイブの登録済みの観測は置き換えます)
+        @param archive_path: アーカイブのディレクトリ
+        @return: 登録した観測数
+        """
+        archive_path = os.path.abspath(archive_path)
+        archive      = SondeArchive(archive_path)
+
+        # 置き換えられていない観測だけを登録 (datetime64[s] => UNIX時刻 [s])
+        live    = archive.select()
+        epoch   = archive.time[live].astype(np.int64)
+        hour    = (epoch // 3600) % 24
+        n_level = archive.offset[live + 1] - archive.offset[live]
+
+        rows = zip(archive.station[live].tolist(), epoch.tolist(), hour.tolist(), [archive_path] * live.size,
+                   live.tolist(), n_level.tolist())
+
+        self.__create()
+        with self.__connect() as conn:
+            conn.execute('DELETE FROM sonde WHERE archive = ?', (archive_path,))
+            conn.executemany('INSERT OR REPLACE INTO sonde (station, time, hour, archive, row, n_level)'
+                             ' VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+        return len(archive)
+
+    def remove_archive(self, archive_path: str) -> None:
+        """
+        @brief:
+          アーカイブの観測を索引から削除します
+        """
+        if not self.__exists():
+            return
+        with self.__connect() as conn:
+            conn.execute('DELETE FROM sonde WHERE archive = ?', (os.path.abspath(archive_path),))
+
+    def query(self, station: str = None, time_from: datetime = None, time_to: datetime = None,
+              hours: tuple = None) -> list:
+        """
+        @brief:
+          条件に合う観測を検索します (例: 観測地点47646の2019年の12Zの観測)
+        @param station: 観測地点番号 (Noneの場合は全地点)
+        @param time_from: 観測時刻の開始 (この時刻を含む; Noneの場合は制限なし)
+        @param time_to: 観測時刻の終了 (この時刻を含む; Noneの場合は制限なし)
+        @param hours: 観測時(UTC)の組 (例: (0, 12); Noneの場合は全て)
+        @return: [(観測地点番号, 観測時刻, アーカイブのディレクトリ, アーカイブ内の観測の番号), ...]
+                 (観測地点・観測時刻順)
+        """
+        where  = []
+        values = []
+        if station is not None:
+            where.append('station = ?')
+            values.append(station)
+        if time_from is not None:
+            where.append('time >= ?')
+            values.append(self.__epoch(time_from))
+        if time_to is not None:
+            where.append('time <= ?')
+            values.append(self.__epoch(time_to))
+        if hours is not None:
+            where.append('hour IN (' + ', '.join('?' * len(hours)) + ')')
+            values.extend(int(hour) for hour in hours)
+
+        sql = 'SELECT station, time, archive, row FROM sonde'
+        if len(where) > 0:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY station, time'
+
+        if not self.__exists():
+            return []
+        with self.__connect() as conn:
+            rows = conn.execute(sql, values).fetchall()
+
+        # 索引と食い違うアーカイブ(索引の登録後に置き換えられたものなど)は登録し直して1回だけ検索し直す
+        rows, stale = self.__check_rows(rows)
+        if len(stale) > 0:
+            for archive_path in stale:
+                self.add_archive(archive_path)
+            with self.__connect() as conn:
+                rows, _ = self.__check_rows(conn.execute(sql, values).fetchall())
+
+        return [(station_, datetime.fromtimestamp(time_, timezone.utc), archive, row)
+                for station_, time_, archive, row in rows]
+
+    @staticmethod
+    def __check_rows(rows: list) -> tuple:
+        # 索引の観測の番号が指す観測の観測地点番号・観測時刻が索引と一致するか，アーカイブ毎にまとめて確認
+        # rows: [(観測地点番号, UNIX時刻 [s], アーカイブのディレクトリ, アーカイブ内の観測の番号), ...]
+        # 戻り値: (一致した行 (削除・移動されたアーカイブの行は除く), 一致しない行があったアーカイブの集合)
+        by_archive = {}
+        for i, (_, _, archive_path, _) in enumerate(rows):
+            by_archive.setdefault(archive_path, []).append(i)
+
+        valid = np.zeros(len(rows), dtype=bool)
+        stale = set()
+        for archive_path, i_rows in by_archive.items():
+            try:
+                archive = SondeArchive(archive_path)
+            except (OSError, ValueError):
+                continue
+
+            row     = np.array([rows[i][3] for i in i_rows], dtype=np.int64)
+            station = np.array([rows[i][0] for i in i_rows], dtype=np.str_)
+            epoch   = np.array([rows[i][1] for i in i_rows], dtype=np.int64)
+
+            # 範囲外の番号は比較しない
+            match = (row >= 0) & (row < len(archive))
+            found = row[match]
+            match[match] = (archive.station[found] == station[match]) & \
+                           (archive.time[found].astype(np.int64) == epoch[match])
+
+            valid[i_rows] = match
+            if not np.all(match):
+                stale.add(archive_path)
+
+        return [row for row, ok in zip(rows, valid) if ok], stale
+
+    def missing_periods(self, station: str, time_from: datetime, time_to: datetime, hours: tuple = OBS_HOURS,
+                        entries: list = None) -> list:
+        """
+        @brief:
+          期間の定時観測のうち索引にないものを，月毎に最初から最後までの期間にまとめて求めます
+          (Wyoming大学からは月内の期間を1回のリクエストで取得できるため; 期間内の索引にある観測も含みます)
+        @param station: 観測地点番号
+        @param time_from: 観測時刻の開始 (UTC; この時刻を含む)
+        @param time_to: 観測時刻の終了 (UTC; この時刻を含む)
+        @param hours: 定時観測の観測時(UTC)の組
+        @param entries: 期間のqueryの戻り値 (Noneの場合は検索)
+        @return: [(期間の開始, 期間の終了), ...] (UTC; 両端を含む; 観測時刻順)
+        """
+        if entries is None:
+            entries = self.query(station, time_from, time_to)
+
+        # 期間の定時観測の観測時刻
+        t_from   = to_datetime64(time_from)
+        t_to     = to_datetime64(time_to)
+        days     = np.arange(t_from.astype('datetime64[D]'), t_to.astype('datetime64[D]') + 1)
+        expected = (days[:, np.newaxis] + np.array(hours, dtype='timedelta64[h]')).ravel().astype('datetime64[s]')
+        expected = np.sort(expected[(expected >= t_from) & (expected <= t_to)])
+
+        indexed = np.array([to_datetime64(entry[1]) for entry in entries], dtype='datetime64[s]')
+        missing = ~np.isin(expected, indexed)
+        if not np.any(missing):
+            return []
+
+        # 月毎に最初・最後の観測時刻
+        missing = expected[missing]
+        month   = missing.astype('datetime64[M]')
+        first   = np.flatnonzero(np.concatenate([[True], month[1:] != month[:-1]]))
+        last    = np.concatenate([first[1:], [missing.size]]) - 1
+        periods = zip(missing[first], missing[last])
+
+        return [(self.__to_datetime(begin), self.__to_datetime(end)) for begin, end in periods]
+
+    @staticmethod
+    def __to_datetime(dt64: np.datetime64) -> datetime:
+        return datetime.fromtimestamp(int(dt64.astype(np.int64)), timezone.utc)
+
+    def find(self, station: str, obs_time: datetime):
+        """
+        @brief:
+          1つの観測を検索します
+        @return: (アーカイブのディレクトリ, アーカイブ内の観測の番号) (索引にない場合はNone)
+        """
+        if not self.__exists():
+            return None
+        with self.__connect() as conn:
+            return conn.execute('SELECT archive, row FROM sonde WHERE station = ? AND time = ?',
+                                (station, self.__epoch(obs_time))).fetchone()
+
+    def load(self, station: str, obs_time: datetime):
+        """
+        @brief:
+          1つの観測をアーカイブから読み出します
+          索引とアーカイブが食い違う場合はアーカイブを登録し直して1回だけ検索し直します
+        @return: SondeData (索引にない，またはアーカイブが削除・移動された場合はNone)
+        """
+        epoch = self.__epoch(obs_time)
+        for retry in (False, True):
+            found = self.find(station, obs_time)
+            if found is None:
+                return None
+
+            rows, stale = self.__check_rows([(station, epoch, found[0], found[1])])
+            if len(rows) > 0:
+                return SondeArchive(found[0]).get(found[1])
+            if retry or len(stale) <= 0:
+                return None
+            self.add_archive(found[0])
+
+    def iter_sonde(self, entries: list):
+        """
+        @brief:
+          検索結果の観測をアーカイブから順に読み出します (アーカイブは1回だけ開きます)
+        @param entries: queryの戻り値
+        @return: SondeDataのジェネレータ
+        """
+        archives = {}
+        for _, _, archive_path, row in entries:
+            if archive_path not in archives:
+                archives[archive_path] = SondeArchive(archive_path)
+            yield archives[archive_path].get(row)
+
+
+# 既定の索引(初回参照時に生成)
+__default_index = None
+
+
+def get_default_index() -> SondeIndex:
+    """
+    @brief:
+      既定の索引を取得します
+    """
+    global __default_index
+    if __default_index is None:
+        __default_index = SondeIndex()
+    return __default_index
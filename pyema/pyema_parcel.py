@@ -0,0 +1,314 @@
+import numpy as np
+import pyema_util
+from pyema_sonde import SondeData
+
+# 基準気圧 [hPa]
+P0    = 1000.0
+# rd/cpd
+KAPPA = 0.286
+# 乾燥空気の定圧比熱 [J/kg/K]
+CPD   = 1004.0
+# 乾燥空気の気体定数 [J/kg/K]
+RD    = KAPPA * CPD
+# 蒸発の潜熱 [J/kg]
+LV    = 2.50e6
+# 水の分子量Mv/乾燥大気の平均分子量Md [-]
+EPS   = 0.622
+
+# 湿潤断熱線の反復計算(Newton法)の回数
+N_ITER_MOIST = 20
+# 混合層パーセルの層厚 [hPa]
+ML_DEPTH = 100.0
+# 最不安定パーセルの探索範囲 [hPa]
+MU_DEPTH = 300.0
+
+# パーセルの種別
+PARCEL_TYPE = ('sb', 'ml', 'mu')
+
+
+def calc_lcl(t: np.ndarray, td: np.ndarray, p: np.ndarray) -> tuple:
+    """
+    @brief:
+      絶対温度t[K]，露点温度td[K]，気圧p[hPa]の空気塊の持ち上げ凝結高度(LCL)を求めます
+    @return: (LCLの気圧 [hPa], LCLの絶対温度 [K])
+    @reference: Bolton, MWR, 1980, EQ.15
+    """
+    t_lcl = 1.0 / (1.0/(td - 56.0) + np.log(t/td)/800.0) + 56.0
+    p_lcl = p * np.power(t_lcl/t, 1.0/KAPPA)
+    return p_lcl, t_lcl
+
+
+def calc_td(mixr: np.ndarray, p: np.ndarray) -> np.ndarray:
+    """
+    @brief:
+      混合比mixr[-]と気圧p[hPa]に対応する露点温度td[K]を求めます
+    @reference: Bolton, MWR, 1980, EQ.11
+    """
+    x = np.log(pyema_util.calc_e(mixr, p) / 6.112)
+    return 243.5*x / (17.67 - x) + 273.15
+
+
+def __theta_es(t: np.ndarray, p: np.ndarray) -> np.ndarray:
+    # 飽和相当温位θe*(t,p)[K] (pyema_util.calc_theta_esの水蒸気圧に飽和水蒸気圧を用いたもの)
+    es = pyema_util.calc_es_fast(t)
+    qs = EPS*es / (p - es)
+    return t*np.power(P0/(p - es), KAPPA) * np.exp((LV/CPD)*(qs/t))
+
+
+def calc_moist_adiabat(theta_es: np.ndarray, p: np.ndarray, t_lo: np.ndarray, t_hi: np.ndarray) -> np.ndarray:
+    """
+    @brief:
+      飽和相当温位θe*[K]が保存される湿潤断熱線上で，気圧p[hPa]の絶対温度[K]を求めます
+      全ての高度を同時に，解を挟む区間[t_lo, t_hi]で保護したNewton法で解きます (反復回数は固定)
+    @param theta_es: 飽和相当温位 [K] (pとブロードキャスト可能な形状)
+    @param p: 気圧 [hPa]
+    @param t_lo: 絶対温度の下限 [K] (LCLからの乾燥断熱線など)
+    @param t_hi: 絶対温度の上限 [K] (LCLの気温など)
+    @return: 絶対温度 [K]
+    """
+    dt = 0.01
+    lo = np.minimum(t_lo, t_hi)
+    hi = np.maximum(t_lo, t_hi)
+    t  = 0.5*(lo + hi)
+    for _ in range(N_ITER_MOIST):
+        f  = __theta_es(t, p) - theta_es
+        df = (__theta_es(t + dt, p) - theta_es - f) / dt
+
+        # 解を挟む区間を更新 (θe*は気温について単調増加)
+        lo = np.where(f < 0.0, t, lo)
+        hi = np.where(f > 0.0, t, hi)
+
+        # Newton法の更新値が区間外なら二分法
+        t_new = t - f/df
+        t     = np.where((t_new > lo) & (t_new < hi), t_new, 0.5*(lo + hi))
+    return t
+
+
+def calc_parcel_profile(p: np.ndarray, p0: np.ndarray, t0: np.ndarray, td0: np.ndarray) -> tuple:
+    """
+    @brief:
+      気圧p0[hPa]，絶対温度t0[K]，露点温度td0[K]から持ち上げた空気塊の気温の鉛直分布を求めます
+      LCLまでは乾燥断熱線，LCLより上は湿潤(偽)断熱線に沿って持ち上げます
+    @param p: 気圧 [hPa] (shape=(..., n_level))
+    @param p0: 持ち上げ開始気圧 [hPa] (shape=(...))
+    @param t0: 持ち上げ開始時の絶対温度 [K] (shape=(...))
+    @param td0: 持ち上げ開始時の露点温度 [K] (shape=(...))
+    @return: (空気塊の絶対温度 [K] (p0より下の高度はNaN), LCLの気圧 [hPa], LCLの絶対温度 [K])
+    """
+    p_lcl, t_lcl = calc_lcl(t0, td0, p0)
+
+    # 高度方向へのブロードキャスト用
+    p0_    = np.asarray(p0)[..., np.newaxis]
+    t0_    = np.asarray(t0)[..., np.newaxis]
+    p_lcl_ = np.asarray(p_lcl)[..., np.newaxis]
+    t_lcl_ = np.asarray(t_lcl)[..., np.newaxis]
+
+    # 乾燥断熱線 (LCLより下)
+    with np.errstate(invalid='ignore'):
+        t_dry = t0_ * np.power(p/p0_, KAPPA)
+
+    # 湿潤断熱線 (LCLより上; LCLの飽和相当温位が保存)
+    with np.errstate(invalid='ignore', over='ignore', divide='ignore'):
+        t_moist = calc_moist_adiabat(__theta_es(t_lcl_, p_lcl_), p, t_lcl_ * np.power(p/p_lcl_, KAPPA), t_lcl_)
+
+    with np.errstate(invalid='ignore'):
+        t_parcel = np.where(p >= p_lcl_, t_dry, t_moist)
+        t_parcel = np.where(p <= p0_, t_parcel, np.nan)
+
+    return t_parcel, p_lcl, t_lcl
+
+
+def __interp_zero(p1: np.ndarray, p2: np.ndarray, d1: np.ndarray, d2: np.ndarray) -> np.ndarray:
+    # 浮力d1(p1)，d2(p2)の間で浮力が0になる気圧 [hPa] (対数気圧で線形補間)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        w = d1 / (d1 - d2)
+        return np.exp(np.log(p1) + w*(np.log(p2) - np.log(p1)))
+
+
+def calc_cape_cin(p: np.ndarray, t_env: np.ndarray, t_parcel: np.ndarray, p_lcl: np.ndarray) -> dict:
+    """
+    @brief:
+      空気塊の気温の鉛直分布からLFC, EL, CAPE, CINを求めます
+      浮力は対数気圧について台形則で積分し，符号が変わる層は0になる点で分割します
+    @param p: 気圧 [hPa] (shape=(..., n_level); 降順)
+    @param t_env: 環境場の絶対温度 [K] (shape=(..., n_level))
+    @param t_parcel: 空気塊の絶対温度 [K] (shape=(..., n_level))
+    @param p_lcl: LCLの気圧 [hPa] (shape=(...))
+    @return: {'p_lfc': LFCの気圧 [hPa], 'p_el': ELの気圧 [hPa], 'cape': CAPE [J/kg], 'cin': CIN [J/kg]}
+             (LFCがない場合はp_lfc, p_elはNaN, cape, cinは0)
+    """
+    # 浮力(気温差) [K]
+    d     = t_parcel - t_env
+    n_lev = d.shape[-1]
+    idx   = np.arange(n_lev)
+
+    # 各層(i, i+1)の正・負の面積 [K] (対数気圧)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dlnp   = np.log(p[..., :-1] / p[..., 1:])
+        d1, d2 = d[..., :-1], d[..., 1:]
+        d_abs  = np.abs(d1 - d2)
+        d_max  = np.maximum(d1, d2)
+        d_min  = np.minimum(d1, d2)
+        area_pos = np.where(d_min >= 0.0, 0.5*(d1 + d2), np.where(d_max <= 0.0, 0.0, 0.5*d_max*d_max/d_abs)) * dlnp
+        area_neg = np.where(d_max <= 0.0, 0.5*(d1 + d2), np.where(d_min >= 0.0, 0.0, -0.5*d_min*d_min/d_abs)) * dlnp
+    area_pos = np.nan_to_num(area_pos)
+    area_neg = np.nan_to_num(area_neg)
+
+    # LFC: LCLより上で最初に浮力が正になる高度
+    with np.errstate(invalid='ignore'):
+        above_lcl = p <= np.asarray(p_lcl)[..., np.newaxis]
+        pos       = d > 0.0
+    cand    = pos & above_lcl
+    has_lfc = np.any(cand, axis=-1)
+    i_lfc   = np.argmax(cand, axis=-1)
+
+    # EL: 浮力が正の最も高い高度
+    i_el = n_lev - 1 - np.argmax(pos[..., ::-1], axis=-1)
+
+    def take(a: np.ndarray, i: np.ndarray) -> np.ndarray:
+        return np.take_along_axis(a, np.asarray(i)[..., np.newaxis], axis=-1)[..., 0]
+
+    # LFCの気圧 (下の高度で負なら0になる点を補間，正ならLCL; LCLより下にはしない)
+    i_lfc_below = np.maximum(i_lfc - 1, 0)
+    d_below     = take(d, i_lfc_below)
+    with np.errstate(invalid='ignore'):
+        crossing = (i_lfc > 0) & (d_below <= 0.0)
+    p_lfc = np.where(crossing, __interp_zero(take(p, i_lfc_below), take(p, i_lfc), d_below, take(d, i_lfc)), p_lcl)
+    p_lfc = np.minimum(p_lfc, p_lcl)
+
+    # ELの気圧 (上の高度で負なら0になる点を補間，最上層ならその高度)
+    i_el_above = np.minimum(i_el + 1, n_lev - 1)
+    d_above    = take(d, i_el_above)
+    p_el = np.where(
+        (i_el < n_lev - 1) & (d_above <= 0.0),
+        __interp_zero(take(p, i_el), take(p, i_el_above), take(d, i_el), d_above),
+        take(p, i_el))
+
+    # CAPE: LFCの下の層からELの上の層までの正の面積，CIN: LFCまでの負の面積
+    i_layer = idx[:-1]
+    in_cape = (i_layer >= (i_lfc - 1)[..., np.newaxis]) & (i_layer <= i_el[..., np.newaxis])
+    in_cin  = i_layer < i_lfc[..., np.newaxis]
+    cape = RD * np.sum(np.where(in_cape, area_pos, 0.0), axis=-1)
+    cin  = RD * np.sum(np.where(in_cin , area_neg, 0.0), axis=-1)
+
+    return {
+        'p_lfc': np.where(has_lfc, p_lfc, np.nan),
+        'p_el' : np.where(has_lfc, p_el , np.nan),
+        'cape' : np.where(has_lfc, cape , 0.0),
+        'cin'  : np.where(has_lfc, cin  , 0.0)
+    }
+
+
+def stack_sonde(sonde_list: list) -> tuple:
+    """
+    @brief:
+      複数のラジオゾンデ観測データを(観測数, 高度数)の2次元配列に揃えます (不足する高度はNaN)
+    @param sonde_list: [SondeData, ...]
+    @return: (気圧 [hPa], 絶対温度 [K], 露点温度 [K])
+    """
+    n_level = max([len(sonde_data) for sonde_data in sonde_list] + [0])
+
+    p  = np.full((len(sonde_list), n_level), np.nan)
+    t  = np.full((len(sonde_list), n_level), np.nan)
+    td = np.full((len(sonde_list), n_level), np.nan)
+    for i, sonde_data in enumerate(sonde_list):
+        n = len(sonde_data)
+        p [i, :n] = sonde_data.pres
+        t [i, :n] = sonde_data.temp    + 273.15
+        td[i, :n] = sonde_data.dewtemp + 273.15
+
+    return p, t, td
+
+
+def select_parcel(p: np.ndarray, t: np.ndarray, td: np.ndarray, parcel: str = 'sb',
+                  ml_depth: float = ML_DEPTH, mu_depth: float = MU_DEPTH) -> tuple:
+    """
+    @brief:
+      持ち上げる空気塊の初期状態を求めます
+      sb: 地表(最下層)の空気塊
+      ml: 最下層からml_depth[hPa]の層で温位・混合比を平均した空気塊 (地表から持ち上げ)
+      mu: 最下層からmu_depth[hPa]の層で相当温位が最大の空気塊
+    @param p: 気圧 [hPa] (shape=(..., n_level); 降順)
+    @param t: 絶対温度 [K] (shape=(..., n_level))
+    @param td: 露点温度 [K] (shape=(..., n_level))
+    @param parcel: パーセルの種別 (sb, ml, mu)
+    @return: (気圧 [hPa], 絶対温度 [K], 露点温度 [K]) (shape=(...))
+    """
+    # 最下層 (気温・露点温度が記録されている最初の高度)
+    valid = np.isfinite(p) & np.isfinite(t) & np.isfinite(td)
+    i_sfc = np.argmax(valid, axis=-1)[..., np.newaxis]
+    p_sfc = np.take_along_axis(p, i_sfc, axis=-1)
+
+    if   parcel == 'sb':
+        return tuple(np.take_along_axis(a, i_sfc, axis=-1)[..., 0] for a in (p, t, td))
+
+    elif parcel == 'ml':
+        with np.errstate(invalid='ignore'):
+            layer = valid & (p >= p_sfc - ml_depth)
+            theta = t * np.power(P0/p, KAPPA)
+            mixr  = pyema_util.calc_qs(td, p)
+        n          = np.sum(layer, axis=-1)
+        theta_mean = np.sum(np.where(layer, theta, 0.0), axis=-1) / n
+        mixr_mean  = np.sum(np.where(layer, mixr , 0.0), axis=-1) / n
+
+        p0 = p_sfc[..., 0]
+        return p0, theta_mean * np.power(p0/P0, KAPPA), calc_td(mixr_mean, p0)
+
+    elif parcel == 'mu':
+        with np.errstate(invalid='ignore', divide='ignore'):
+            layer = valid & (p >= p_sfc - mu_depth)
+            p_lcl, t_lcl = calc_lcl(t, td, p)
+            theta_e = np.where(layer, __theta_es(t_lcl, p_lcl), -np.inf)
+        i_mu = np.argmax(theta_e, axis=-1)[..., np.newaxis]
+        return tuple(np.take_along_axis(a, i_mu, axis=-1)[..., 0] for a in (p, t, td))
+
+    else:
+        raise ValueError('invalid parcel type: ' + str(parcel))
+
+
+def analyze_parcel(p: np.ndarray, t: np.ndarray, td: np.ndarray, parcel: str = 'sb',
+                   ml_depth: float = ML_DEPTH, mu_depth: float = MU_DEPTH) -> dict:
+    """
+    @brief:
+      空気塊を持ち上げてLCL, LFC, EL, CAPE, CINを求めます
+      全高度・全観測を配列演算で一括処理します (複数観測は(観測数, 高度数)に揃えて渡します)
+      浮力には仮温度補正をしない気温を用います
+    @param p: 気圧 [hPa] (shape=(..., n_level); 降順)
+    @param t: 絶対温度 [K] (shape=(..., n_level))
+    @param td: 露点温度 [K] (shape=(..., n_level))
+    @param parcel: パーセルの種別 (sb, ml, mu)
+    @return: {'p0', 't0', 'td0': 持ち上げ開始時の状態, 't_parcel': 空気塊の絶対温度 [K],
+              'p_lcl', 't_lcl': LCL, 'p_lfc': LFC, 'p_el': EL, 'cape': CAPE [J/kg], 'cin': CIN [J/kg]}
+    """
+    p  = np.asarray(p , dtype=np.float64)
+    t  = np.asarray(t , dtype=np.float64)
+    td = np.asarray(td, dtype=np.float64)
+
+    # 空気塊の初期状態
+    p0, t0, td0 = select_parcel(p, t, td, parcel, ml_depth, mu_depth)
+
+    # 空気塊の気温の鉛直分布
+    t_parcel, p_lcl, t_lcl = calc_parcel_profile(p, p0, t0, td0)
+
+    result = {
+        'p0'      : p0,
+        't0'      : t0,
+        'td0'     : td0,
+        't_parcel': t_parcel,
+        'p_lcl'   : p_lcl,
+        't_lcl'   : t_lcl
+    }
+    result.update(calc_cape_cin(p, t, t_parcel, p_lcl))
+
+    return result
+
+
+def analyze_sonde(sonde_data, parcel: str = 'sb') -> dict:
+    """
+    @brief:
+      ラジオゾンデ観測データ(SondeDataまたはそのリスト)の空気塊解析を行います
+    """
+    if isinstance(sonde_data, SondeData):
+        return analyze_parcel(sonde_data.pres, sonde_data.temp + 273.15, sonde_data.dewtemp + 273.15, parcel)
+
+    return analyze_parcel(*stack_sonde(sonde_data), parcel)
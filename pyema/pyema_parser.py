@@ -0,0 +1,188 @@
+import re
+from html import unescape
+import numpy as np
+
+# ラジオゾンデ観測データ(Wyoming大学; text形式)の先頭スキップ数
+SKIP_LINE_SONDE_TXT    = 4
+# ラジオゾンデ観測データ(Wyoming大学; text形式)の1行のカラム数
+N_COLUMN_SONDE_TXT     = 11
+# ラジオゾンデ観測データ(Wyoming大学; text形式)の1カラムの文字数
+WORDS_COLUMN_SONDE_TXT = 7
+# ラジオゾンデ観測データ(Wyoming大学; text形式)の1行の文字数
+WORDS_LINE_SONDE_TXT   = N_COLUMN_SONDE_TXT * WORDS_COLUMN_SONDE_TXT
+
+# ラジオゾンデ観測データ(Wyoming大学; text形式)のカラム番号
+COL_PRES    = 0   # 気圧 [hPa]
+COL_HEIGHT  = 1   # ジオポテンシャル高度 [m]
+COL_TEMP    = 2   # 温度 [C]
+COL_DEWTEMP = 3   # 露点温度 [C]
+COL_RELH    = 4   # 相対湿度 [%]
+COL_MIXR    = 5   # 混合比 [g/kg]
+COL_DRCT    = 6   # 風向 [deg]
+COL_SKNT    = 7   # 風速 [knot]
+COL_THETA   = 8   # 温位 [K]
+COL_THETA_E = 9   # 相当温位 [K]
+COL_VTHETA  = 10  # 仮温位 [K]
+
+# 空白1文字(ASCII)
+__BLANK = ord(' ')
+# 数値のセルに使う文字 (これ以外を含む場合は汎用の変換)
+__NUMERIC_CHARS = b' -.0123456789'
+# セルを先頭に空白1文字を足して8バイト(uint64)として扱う
+__CELL_BYTES = 8
+# 各バイトの最下位ビット (バイト毎の0/1の数え上げに使用)
+__BYTE_ONES  = np.uint64(0x0101010101010101)
+# (小数点より前のバイト数 + 符号(負)*8) => 除数 (10^小数部の桁数; 負の場合は符号を反転; 小数点なしは1)
+__FRAC_SCALE = np.concatenate([[1.0], 10.0 ** np.arange(__CELL_BYTES - 2, -1, -1)])
+__FRAC_SCALE = np.concatenate([__FRAC_SCALE, -__FRAC_SCALE])
+# 一括で変換する行数 (一時配列をキャッシュに収めるため分割)
+__DECODE_CHUNK_LINE = 1024
+
+# タイトル(<h2>タグ)・観測データ(<pre>タグ)の正規表現
+__RE_TITLE = re.compile(r'<h2>(.*?)</h2>', re.IGNORECASE | re.DOTALL)
+__RE_DATA  = re.compile(r'<pre>(.*?)</pre>', re.IGNORECASE | re.DOTALL)
+__RE_TITLE_START = re.compile(r'<h2', re.IGNORECASE)
+
+
+def decode_sonde_text(sonde_txt: list, skip_line: int = SKIP_LINE_SONDE_TXT) -> np.ndarray:
+    """
+    @brief:
+      ラジオゾンデ観測データ(text形式; <pre>ブロック)を一括でデコードして2次元配列に変換します
+      空白のセルはNaNになります
+    @param sonde_txt: <pre>ブロックの各行
+    @param skip_line: 先頭スキップ数 (この行番号以下の行はヘッダとして読み飛ばす)
+    @return: 観測データ [行, カラム] (shape=(n_line, N_COLUMN_SONDE_TXT))
+    """
+    lines = sonde_txt[skip_line + 1:]
+
+    # 文字数が異なる場合はエラー (空行は除く)
+    length  = np.fromiter(map(len, lines), dtype=np.int64, count=len(lines))
+    invalid = np.flatnonzero((length > 0) & (length != WORDS_LINE_SONDE_TXT))
+    if invalid.size > 0:
+        s_line = lines[invalid[0]]
+        raise ValueError('invalid line length (' + str(len(s_line)) + '): ' + s_line)
+
+    # 全データ行を1つのバイト列に連結 (空行は連結しても何も加わらない)
+    buf    = ''.join(lines).encode('ascii')
+    n_line = len(buf) // WORDS_LINE_SONDE_TXT
+
+    table = np.empty((n_line, N_COLUMN_SONDE_TXT), dtype=np.float64)
+    for i_line in range(0, n_line, __DECODE_CHUNK_LINE):
+        chunk = buf[i_line * WORDS_LINE_SONDE_TXT:(i_line + __DECODE_CHUNK_LINE) * WORDS_LINE_SONDE_TXT]
+        cells = __decode_cells(chunk)
+        if cells is None:
+            cells = __decode_cells_generic(chunk)
+        table[i_line:i_line + __DECODE_CHUNK_LINE] = cells.reshape(-1, N_COLUMN_SONDE_TXT)
+
+    return table
+
+
+def __decode_cells(buf: bytes):
+    # 固定長セル(右詰めの10進数または空白)をバイト演算で一括変換
+    # 戻り値: セル毎の値 (空白セルはNaN; 想定外の書式のセルを含む場合はNone)
+    if len(buf.translate(None, __NUMERIC_CHARS)) > 0:
+        return None
+
+    # セル毎に先頭に空白1文字を足して8バイトにして，各種文字の位置をバイト毎の0/1のビット列(uint64)で表す
+    chars = np.empty((len(buf) // WORDS_COLUMN_SONDE_TXT, __CELL_BYTES), dtype=np.uint8)
+    chars[:, 0]  = __BLANK
+    chars[:, 1:] = np.frombuffer(buf, dtype=np.uint8).reshape(-1, WORDS_COLUMN_SONDE_TXT)
+    filled = (chars != __BLANK ).view('<u8').ravel()
+    dot    = (chars == ord('.')).view('<u8').ravel()
+    minus  = (chars == ord('-')).view('<u8').ravel()
+
+    # 書式の確認: 右詰め(途中・末尾に空白なし)，符号は先頭のみ，小数点は1つまで，数字を1つ以上含む
+    # (ビット列の下位バイトがセルの先頭側)
+    work   = np.empty_like(filled)
+    before = np.empty_like(filled)
+    np.invert(filled, out=work)                      # 右詰め: 空白でない文字の後ろに空白がない
+    np.left_shift(filled, np.uint64(8), out=before)
+    work &= before
+    bad   = work != 0
+    np.negative(filled, out=work)                    # 符号: 空白でない最初の文字のみ
+    work &= filled
+    bad  |= (minus != 0) & (minus != work)
+    np.subtract(dot, np.uint64(1), out=before)       # 小数点: 1つまで (beforeは小数点より前のバイト)
+    np.bitwise_and(before, dot, out=work)
+    bad  |= work != 0
+    np.bitwise_or(dot, minus, out=work)              # 数字: 空白・符号・小数点以外の文字がある
+    bad  |= (filled != 0) & (filled == work)
+    if np.any(bad):
+        return None
+
+    # 数字以外のバイトを0にして，小数点より前の桁を1バイト後ろにずらして小数点を詰める
+    # (小数点がない場合は全て小数点より後とする)
+    chars -= ord('0')
+    chars *= chars < 10
+    digit  = chars.view('<u8').ravel()
+    before[dot == 0] = 0
+    np.bitwise_and(digit, before, out=work)
+    work  <<= np.uint64(8)
+    digit  &= ~(before | dot)
+    digit  |= work
+
+    # 8桁の数字を隣接する2桁・4桁・8桁の順にまとめて整数にする
+    for shift, scale, mask in ((8, 10, 0x00FF00FF00FF00FF), (16, 100, 0x0000FFFF0000FFFF), (32, 10000, 0xFFFFFFFF)):
+        np.right_shift(digit, np.uint64(shift), out=work)
+        digit *= np.uint64(scale)
+        digit += work
+        digit &= np.uint64(mask)
+
+    # 整数 / ±10^(小数部の桁数) (float()と同じく1回の丸め; 小数点より前のバイト数は各バイトの0/1の和)
+    before &= __BYTE_ONES
+    before *= __BYTE_ONES
+    before >>= np.uint64(56)
+    before += (minus != 0) * np.uint64(__CELL_BYTES)
+    value  = digit.view('<i8').astype(np.float64)
+    value /= np.take(__FRAC_SCALE, before)
+    value[filled == 0] = np.nan
+
+    return value
+
+
+def __decode_cells_generic(buf: bytes) -> np.ndarray:
+    # 固定長セルをnumpyの文字列 => 数値変換で一括変換 (空白セルはNaN; 数値でないセルはValueError)
+    cells = np.frombuffer(buf, dtype='S' + str(WORDS_COLUMN_SONDE_TXT))
+    blank = np.all(np.frombuffer(buf, dtype=np.uint8).reshape(-1, WORDS_COLUMN_SONDE_TXT) == __BLANK, axis=1)
+    if np.any(blank):
+        cells = cells.copy()
+        cells[blank] = b'nan'
+
+    return cells.astype(np.float64)
+
+
+def iter_sonde_blocks(chunks):
+    """
+    @brief:
+      HTMLを先頭から逐次走査して，観測毎の(タイトル, 観測データ)を取り出します
+      DOMツリーは作らず，<h2>タグ(タイトル)と直後の<pre>タグ(観測データ)の組を見つけた時点で返します
+    @param chunks: HTMLの断片(str)を順に返すイテラブル (ストリーミング受信したHTTPレスポンスボディなど)
+    @return: (タイトル, <pre>ブロックの各行) のジェネレータ
+    """
+    buf   = ''
+    title = None
+    for chunk in chunks:
+        buf += chunk
+        pos = 0
+        while True:
+            if title is None:
+                m = __RE_TITLE.search(buf, pos)
+                if m is None:
+                    break
+                title = unescape(m.group(1))
+            else:
+                m = __RE_DATA.search(buf, pos)
+                if m is None:
+                    break
+                yield title, unescape(m.group(1)).splitlines()
+                title = None
+            pos = m.end()
+
+        # 走査済みの部分を破棄 (タイトル待ちの間は<h2タグの開始候補以降のみ残す)
+        if title is None:
+            m = __RE_TITLE_START.search(buf, pos)
+            if m is not None:
+                pos = m.start()
+            else:
+                pos = max(pos, len(buf) - len('<h2'))
+        buf = buf[pos:]
@@ -0,0 +1,275 @@
+import numpy as np
+import japanize_matplotlib
+from matplotlib.axes import Axes
+from matplotlib.collections import LineCollection
+import pyema_background
+import pyema_parcel
+from pyema_sonde import SondeData
+
+# 横軸種別毎の描画設定 (カラム名, 色, 線種, 凡例)
+LINE_STYLE_H = {
+    't' : [('temp'    , 'k', 'solid' , '気温'        ),
+           ('dewtemp' , 'b', 'dashed', '露点温度'    )],
+    'pt': [('theta'   , 'k', 'solid' , '温位'        ),
+           ('theta_e' , 'b', 'dashed', '相当温位'    ),
+           ('theta_es', 'r', 'dotted', '飽和相当温位')]
+}
+# 横軸種別毎の軸ラベル
+LABEL_H = {
+    't' : '気温 [C]',
+    'pt': '温位 [K]'
+}
+# 縦軸種別毎の描画設定 (カラム名, 軸ラベル)
+AXIS_V = {
+    'p': ('pres'  , '気圧 [hPa]'),
+    'z': ('height', '高度 [m]'  )
+}
+# 背景線の描画設定 (背景線名, 色, 線種, 凡例)
+LINE_STYLE_BACKGROUND = [
+    ('dry'  , 'tab:brown' , 'solid' , '乾燥断熱線'    ),
+    ('moist', 'tab:green' , 'dashed', '湿潤断熱線'    ),
+    ('mixr' , 'tab:purple', 'dotted', '等飽和混合比線')
+]
+# 持ち上げ凝結高度(LCL; 地表の空気塊)の描画設定 (色, マーカー, 凡例)
+MARKER_STYLE_LCL = ('tab:red', 'o', 'LCL')
+# 気候値の描画設定 (横軸種別毎; 変数名, 色, 凡例) (平均を線，分位点の幅を帯で描画)
+LINE_STYLE_CLIMATOLOGY = {
+    't' : [('temp'   , 'tab:gray', '気温(気候値)'    ),
+           ('dewtemp', 'tab:cyan', '露点温度(気候値)')],
+    'pt': [('theta'  , 'tab:gray', '温位(気候値)'    ),
+           ('theta_e', 'tab:cyan', '相当温位(気候値)')]
+}
+
+
+class EmagramRenderer:
+    """
+    @brief:
+      エマグラムの描画器
+      座標軸・背景線・線(Line2D)・軸ラベル・凡例は軸種別が変わった時だけ作り直し，
+      観測データや境界値の変更はset_dataと軸範囲の更新だけで再描画します
+      blit=Trueの場合，軸範囲が変わらなければ背景を再利用して線とタイトルだけを描き直します
+      気候値(pyema_climate.Climatology.profileの戻り値)は変更された時だけ描き直します
+      地表の空気塊の持ち上げ凝結高度(LCL)をマーカーで示します (param['lcl']=Falseの場合は非表示)
+    """
+    def __init__(self, ax: Axes, blit: bool = False, background_cache_dir: str = None):
+        """
+        @param ax: 描画先の座標軸
+        @param blit: ブリッティングを使用するか (対話バックエンド用; ファイル出力時はFalse)
+        @param background_cache_dir: 背景線のディスクキャッシュの保存先
+        """
+        self.ax    = ax
+        self.blit  = blit
+        self.lines = []
+        self.lcl   = None  # LCLのマーカー(Line2D)
+
+        self.background_cache_dir = background_cache_dir
+
+        self.__mode       = None  # (横軸種別, 縦軸種別, 背景線の有無)
+        self.__limit      = None  # (横軸境界値, 縦軸境界値)
+        self.__background = None  # ブリッティング用の背景
+        self.__cid_draw   = None  # draw_eventのコールバックID
+
+        self.__climatology         = None  # 描画中の気候値
+        self.__climatology_artists = []    # 気候値の線・帯
+
+        if self.blit:
+            self.__cid_draw = self.ax.figure.canvas.mpl_connect('draw_event', self.__on_draw)
+
+    def __setup(self, mode: tuple) -> None:
+        # 座標軸・背景線・線・軸ラベル・凡例を作成
+        axis_h_type, axis_v_type, background = mode
+        if axis_h_type not in LINE_STYLE_H:
+            raise ValueError('invalid axis_h type: ' + str(axis_h_type))
+        if axis_v_type not in AXIS_V:
+            raise ValueError('invalid axis_v type: ' + str(axis_v_type))
+
+        ax = self.ax
+        ax.clear()
+
+        # 背景線 (軸範囲の自動設定の対象外)
+        if background:
+            self.__draw_background(axis_h_type, axis_v_type)
+
+        self.lines = []
+        for name, color, linestyle, label in LINE_STYLE_H[axis_h_type]:
+            line, = ax.plot([], [], color=color, linestyle=linestyle, linewidth=2, label=label,
+                            animated=self.blit)
+            self.lines.append((name, line))
+
+        color, marker, label = MARKER_STYLE_LCL
+        self.lcl, = ax.plot([], [], color=color, marker=marker, linestyle='none', label=label, zorder=3,
+                            animated=self.blit)
+
+        ax.set_xlabel(LABEL_H[axis_h_type], fontsize=12)
+        ax.set_ylabel(AXIS_V[axis_v_type][1], fontsize=12)
+        ax.title.set_fontsize(12)
+        ax.title.set_animated(self.blit)
+
+        # 気圧軸は上下反転
+        if (axis_v_type == 'p') != ax.yaxis_inverted():
+            ax.invert_yaxis()
+
+        ax.grid(color='gray', ls=':')
+        ax.legend(loc='best')
+
+        self.__mode       = mode
+        self.__limit      = None
+        self.__background = None
+
+        self.__climatology         = None
+        self.__climatology_artists = []
+
+    def __draw_background(self, axis_h_type: str, axis_v_type: str) -> None:
+        # 乾燥断熱線，湿潤断熱線，等飽和混合比線 (計算結果は軸設定毎にキャッシュ)
+        bg = pyema_background.calc_background(axis_h_type, axis_v_type, cache_dir=self.background_cache_dir)
+        for name, color, linestyle, label in LINE_STYLE_BACKGROUND:
+            x        = bg[name]
+            y        = np.broadcast_to(bg['y'], x.shape)
+            segments = np.stack([x, y], axis=-1)
+            self.ax.add_collection(LineCollection(segments, colors=color, linestyles=linestyle, linewidths=0.5,
+                                                  alpha=0.6, zorder=1, label=label), autolim=False)
+
+    def __draw_climatology(self, clim) -> None:
+        # 気候値の平均(線)と分位点の幅(帯)を描き直し
+        for artist in self.__climatology_artists:
+            artist.remove()
+        self.__climatology_artists = []
+
+        if clim is not None:
+            axis_h_type, axis_v_type, _ = self.__mode
+            y = clim['pres'] if axis_v_type == 'p' else clim['height']
+            for name, color, label in LINE_STYLE_CLIMATOLOGY[axis_h_type]:
+                band  = self.ax.fill_betweenx(y, clim['lower'][name], clim['upper'][name], color=color, alpha=0.2,
+                                              linewidth=0, zorder=1.5)
+                line, = self.ax.plot(clim['mean'][name], y, color=color, linestyle='dashdot', linewidth=1,
+                                     label=label, zorder=1.5)
+                self.__climatology_artists += [band, line]
+
+        self.ax.legend(loc='best')
+
+        self.__climatology = clim
+        self.__limit       = None
+        self.__background  = None
+
+    def update(self, sonde_data: SondeData, param: dict) -> None:
+        """
+        @brief:
+          観測データ・軸設定を更新して再描画します
+        """
+        mode = (param['axis_h']['type'], param['axis_v']['type'], param.get('background', True))
+        if mode != self.__mode:
+            self.__setup(mode)
+
+        # 気候値 (param['climatology']; 変更された時だけ描き直し)
+        clim = param.get('climatology')
+        if clim is not self.__climatology:
+            self.__draw_climatology(clim)
+
+        # 線のデータ更新 (飽和相当温位などの派生量はSondeDataが初回参照時に求めてキャッシュ)
+        y = getattr(sonde_data, AXIS_V[mode[1]][0])
+        for name, line in self.lines:
+            line.set_data(getattr(sonde_data, name), y)
+
+        # 持ち上げ凝結高度
+        self.lcl.set_data(*calc_lcl_point(sonde_data, mode[0], mode[1]))
+        self.lcl.set_visible(param.get('lcl', True))
+
+        self.ax.set_title(sonde_data.title)
+
+        # 軸範囲更新 (境界値が未指定ならデータ毎に自動設定するので背景も描き直し)
+        limit = (param['axis_h']['limit'], param['axis_v']['limit'])
+        fixed = limit[0] is not None and limit[1] is not None
+        if not fixed or limit != self.__limit:
+            self.__set_limit(limit)
+            self.__limit      = limit
+            self.__background = None
+
+        self.__redraw()
+
+    def __set_limit(self, limit: tuple) -> None:
+        ax = self.ax
+        ax.relim()
+        ax.autoscale(enable=limit[0] is None, axis='x')
+        ax.autoscale(enable=limit[1] is None, axis='y')
+        ax.autoscale_view()
+        if limit[0] is not None:
+            ax.set_xlim(limit[0])
+        if limit[1] is not None:
+            # 気圧軸は上下反転
+            if self.__mode[1] == 'p':
+                ax.set_ylim(max(limit[1]), min(limit[1]))
+            else:
+                ax.set_ylim(limit[1])
+
+    def __redraw(self) -> None:
+        canvas = self.ax.figure.canvas
+        if not self.blit:
+            canvas.draw_idle()
+            return
+
+        if self.__background is None:
+            # 背景から描き直し (draw_eventで背景を保存して線・タイトルを描画)
+            canvas.draw()
+        else:
+            # 背景を復元して線とタイトルだけを描画
+            canvas.restore_region(self.__background)
+            self.__draw_animated()
+        canvas.blit(self.ax.figure.bbox)
+        canvas.flush_events()
+
+    def __draw_animated(self) -> None:
+        for name, line in self.lines:
+            self.ax.draw_artist(line)
+        # 初回のupdateより前の描画ではLCLのマーカーは未作成
+        if self.lcl is not None:
+            self.ax.draw_artist(self.lcl)
+        self.ax.draw_artist(self.ax.title)
+
+    def __on_draw(self, event) -> None:
+        # 全体描画の度に背景(線・タイトル以外)を保存
+        canvas = self.ax.figure.canvas
+        self.__background = canvas.copy_from_bbox(self.ax.figure.bbox)
+        self.__draw_animated()
+
+    def close(self) -> None:
+        """
+        @brief:
+          コールバックを解除します
+        """
+        if self.__cid_draw is not None:
+            self.ax.figure.canvas.mpl_disconnect(self.__cid_draw)
+            self.__cid_draw = None
+
+
+def calc_lcl_point(sonde_data: SondeData, axis_h_type: str, axis_v_type: str) -> tuple:
+    """
+    @brief:
+      地表(最下層)の空気塊の持ち上げ凝結高度(LCL)のエマグラム上の位置を求めます
+      横軸が温位の場合は地表の温位(LCLまでの乾燥断熱線上で一定)，縦軸が高度の場合は観測の高度を対数気圧で補間します
+    @return: ([横軸の値], [縦軸の値]) (気温・露点温度が記録された高度がない場合は空のリスト)
+    """
+    p, t, td = sonde_data.pres, sonde_data.temp + 273.15, sonde_data.dewtemp + 273.15
+    if not np.any(np.isfinite(td)):
+        return [], []
+
+    p0, t0, td0  = pyema_parcel.select_parcel(p, t, td, 'sb')
+    p_lcl, t_lcl = pyema_parcel.calc_lcl(t0, td0, p0)
+
+    x = t_lcl - 273.15 if axis_h_type == 't' else t_lcl * np.power(pyema_parcel.P0 / p_lcl, pyema_parcel.KAPPA)
+    if axis_v_type == 'p':
+        y = p_lcl
+    else:
+        # 気圧は降順なので反転して補間
+        y = np.interp(-np.log(p_lcl), -np.log(p), sonde_data.height)
+
+    return [float(x)], [float(y)]
+
+
+def draw_emagram(ax: Axes, sonde_data: SondeData, param: dict) -> EmagramRenderer:
+    """
+    @brief:
+      ラジオゾンデ観測データ(ndarray形式)からエマグラムを指定の座標軸に描画します
+    """
+    renderer = EmagramRenderer(ax)
+    renderer.update(sonde_data, param)
+    return renderer
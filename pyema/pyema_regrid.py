@@ -0,0 +1,158 @@
+import numpy as np
+from pyema_archive import COLUMN_NAME, SondeArchive
+from pyema_sonde import SondeData
+
+# 縦軸種別毎の座標のカラム名
+AXIS_V_COLUMN = {
+    'p': 'pres',
+    'z': 'height'
+}
+# 指定気圧面 [hPa]
+STANDARD_LEVEL_P = np.array([1000.0, 925.0, 850.0, 700.0, 500.0, 400.0, 300.0, 250.0, 200.0, 150.0, 100.0])
+# 縦軸種別毎の既定の格子 (気圧 [hPa] または 高度 [m])
+LEVEL_DEFAULT = {
+    'p': np.arange(1000.0, 99.0, -10.0),
+    'z': np.arange(0.0, 16001.0, 100.0)
+}
+
+
+def interp_csr(x: np.ndarray, columns: dict, offset: np.ndarray, grid: np.ndarray) -> dict:
+    """
+    @brief:
+      高度数の異なる複数の観測(全観測を連結した1次元配列と観測毎の開始位置)を，
+      共通の格子に一括で線形補間します (観測の範囲外はNaN)
+      観測番号で底上げした座標を1回の二分探索で検索し，補間の重みを全ての変数で共有します
+    @param x: 補間の座標 (連結した1次元配列; 観測毎に任意の順序)
+    @param columns: {変数名: 値 (xと同じ形状)}
+    @param offset: 観測毎の開始位置 (shape=(n_sonde+1,))
+    @param grid: 格子の座標 (shape=(n_grid,))
+    @return: {変数名: 補間値 (shape=(n_sonde, n_grid))}
+    """
+    n_sonde = offset.size - 1
+    i_sonde = np.arange(n_sonde)
+    seg     = np.repeat(i_sonde, np.diff(offset))
+
+    # 座標が欠測の高度を除き，観測毎に座標の昇順に並べ替え
+    order = np.flatnonzero(np.isfinite(x))
+    order = order[np.lexsort((x[order], seg[order]))]
+
+    # 座標が重複する高度は先頭だけ残す
+    xs   = x[order]
+    seg  = seg[order]
+    keep = np.ones(xs.size, dtype=bool)
+    keep[1:] = (xs[1:] != xs[:-1]) | (seg[1:] != seg[:-1])
+    order, xs, seg = order[keep], xs[keep], seg[keep]
+
+    if xs.size < 2:
+        return {name: np.full((n_sonde, grid.size), np.nan) for name in columns}
+
+    # 観測番号で底上げして全観測を1つの昇順の配列にする
+    lo    = min(xs.min(), grid.min())
+    width = max(xs.max(), grid.max()) - lo + 1.0
+    key   = (xs - lo) + seg*width
+    tkey  = (grid[np.newaxis, :] - lo) + (i_sonde*width)[:, np.newaxis]
+
+    # 観測毎の範囲 [start, end) (高度が2未満の観測は補間しない)
+    start  = np.searchsorted(seg, i_sonde, side='left' )[:, np.newaxis]
+    end    = np.searchsorted(seg, i_sonde, side='right')[:, np.newaxis]
+    usable = end - start >= 2
+    start  = np.where(usable, start, 0)
+    end    = np.where(usable, end  , 2)
+
+    # 格子点を挟む2高度と重み
+    i1     = np.clip(np.searchsorted(key, tkey), start + 1, end - 1)
+    i0     = i1 - 1
+    inside = usable & (tkey >= key[start]) & (tkey <= key[end - 1])
+    w      = (tkey - key[i0]) / (key[i1] - key[i0])
+
+    results = {}
+    for name, y in columns.items():
+        y  = y[order]
+        y0 = y[i0]
+        results[name] = np.where(inside, y0 + w*(y[i1] - y0), np.nan)
+
+    return results
+
+
+def concat_sonde(sonde_list: list) -> tuple:
+    """
+    @brief:
+      複数のラジオゾンデ観測データの高度を連結します (アーカイブのカラムと同じ形式)
+    @param sonde_list: [SondeData, ...]
+    @return: ({カラム名: 連結したカラムの値}, 観測毎の開始位置 (shape=(n_sonde+1,)))
+    """
+    n_level = [len(sonde_data) for sonde_data in sonde_list]
+    offset  = np.concatenate([[0], np.cumsum(n_level)]).astype(np.int64)
+    if len(sonde_list) > 0:
+        data = np.concatenate([sonde_data.data for sonde_data in sonde_list], axis=1)
+    else:
+        data = np.empty((len(COLUMN_NAME), 0))
+
+    return {name: data[i_col] for i_col, name in enumerate(COLUMN_NAME)}, offset
+
+
+def regrid_columns(columns: dict, offset: np.ndarray, levels: np.ndarray = None, axis_v_type: str = 'p',
+                   names: tuple = ('temp',)) -> dict:
+    """
+    @brief:
+      連結したカラムを固定の気圧面または高度に一括で補間します
+      気圧は対数で補間し，観測の範囲外はNaNになります
+    @param columns: {カラム名: 連結したカラムの値} (縦軸のカラムを含むこと)
+    @param offset: 観測毎の開始位置 (shape=(n_sonde+1,))
+    @param levels: 格子 (気圧 [hPa] または 高度 [m]; Noneの場合はLEVEL_DEFAULT)
+    @param axis_v_type: 縦軸種別 (p: 気圧, z: 高度)
+    @param names: 補間するカラム名
+    @return: {カラム名: 補間値 (shape=(n_sonde, n_level))}
+    """
+    if axis_v_type not in AXIS_V_COLUMN:
+        raise ValueError('invalid axis_v type: ' + str(axis_v_type))
+    if levels is None:
+        levels = LEVEL_DEFAULT[axis_v_type]
+    levels = np.asarray(levels, dtype=np.float64)
+
+    x = columns[AXIS_V_COLUMN[axis_v_type]]
+    if axis_v_type == 'p':
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x = -np.log(x)
+        grid = -np.log(levels)
+    else:
+        grid = levels
+
+    return interp_csr(x, {name: columns[name] for name in names}, offset, grid)
+
+
+def regrid(sonde_list, levels: np.ndarray = None, axis_v_type: str = 'p', names: tuple = ('temp',)) -> dict:
+    """
+    @brief:
+      1つまたは複数のラジオゾンデ観測データを固定の気圧面または高度に一括で補間します
+      (例: regrid(sonde_list, STANDARD_LEVEL_P, 'p', ('temp', 'dewtemp')))
+    @param sonde_list: SondeData または [SondeData, ...]
+    @param levels: 格子 (気圧 [hPa] または 高度 [m]; Noneの場合はLEVEL_DEFAULT)
+    @param axis_v_type: 縦軸種別 (p: 気圧, z: 高度)
+    @param names: 補間するカラム名 (COLUMN_NAME)
+    @return: {カラム名: 補間値 (shape=(n_sonde, n_level))}
+    """
+    if isinstance(sonde_list, SondeData):
+        sonde_list = [sonde_list]
+
+    columns, offset = concat_sonde(sonde_list)
+
+    return regrid_columns(columns, offset, levels, axis_v_type, names)
+
+
+def regrid_archive(archive: SondeArchive, indices: np.ndarray, levels: np.ndarray = None, axis_v_type: str = 'p',
+                   names: tuple = ('temp',)) -> dict:
+    """
+    @brief:
+      アーカイブから必要なカラムだけを読み出して固定の気圧面または高度に一括で補間します (SondeDataは作りません)
+    @param archive: アーカイブ
+    @param indices: 観測の番号 (SondeArchive.selectの戻り値など)
+    @return: regridと同じ
+    """
+    columns = {}
+    offset  = None
+    for name in (AXIS_V_COLUMN[axis_v_type],) + tuple(names):
+        if name not in columns:
+            columns[name], offset = archive.read_column(name, indices)
+
+    return regrid_columns(columns, offset, levels, axis_v_type, names)
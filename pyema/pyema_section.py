@@ -0,0 +1,171 @@
+from datetime import datetime
+import numpy as np
+import pyema_regrid
+import pyema_source
+from pyema_archive import SondeArchive, to_datetime64
+from pyema_sonde import parse_title
+
+# 時間高度断面図の変数毎の描画設定 (カラーバーのラベル, カラーマップ)
+SECTION_VAR = {
+    'temp'   : ('気温 [C]'     , 'RdBu_r' ),
+    'theta'  : ('温位 [K]'     , 'viridis'),
+    'theta_e': ('相当温位 [K]' , 'plasma' ),
+    'mixr'   : ('混合比 [g/kg]', 'YlGnBu' )
+}
+# 縦軸種別毎の設定 (カラム名, 軸ラベル)
+AXIS_V = {
+    'p': ('pres'  , '気圧 [hPa]'),
+    'z': ('height', '高度 [m]'  )
+}
+# 時間高度断面図の描画方法
+SECTION_KIND = ('pcolormesh', 'contourf')
+
+
+def __make_section(time: np.ndarray, values: dict, levels: np.ndarray, axis_v_type: str) -> dict:
+    # 時間高度断面 {'time', 'levels', 'axis_v', 変数名}
+    section = dict(values)
+    section['time']   = time
+    section['levels'] = pyema_regrid.LEVEL_DEFAULT[axis_v_type] if levels is None else np.asarray(levels)
+    section['axis_v'] = axis_v_type
+    return section
+
+
+def __check_variables(variables: tuple) -> None:
+    for var in variables:
+        if var not in SECTION_VAR:
+            raise ValueError('invalid section variable: ' + str(var))
+
+
+def calc_section(sonde_list: list, axis_v_type: str = 'p', levels: np.ndarray = None,
+                 variables: tuple = tuple(SECTION_VAR)) -> dict:
+    """
+    @brief:
+      複数のラジオゾンデ観測データを共通の気圧(対数)または高度の格子に一括で補間して時間高度断面を求めます
+    @param sonde_list: [SondeData, ...] (観測時刻はタイトルから取得)
+    @param axis_v_type: 縦軸種別 (p: 気圧, z: 高度)
+    @param levels: 格子 (気圧 [hPa] または 高度 [m]; Noneの場合はpyema_regrid.LEVEL_DEFAULT)
+    @param variables: 変数名 (SECTION_VAR)
+    @return: {'time': 観測時刻 (shape=(n_time,)), 'levels': 格子, 'axis_v': 縦軸種別,
+              変数名: 補間値 (shape=(n_time, n_level))}
+    """
+    __check_variables(variables)
+
+    time = np.array([to_datetime64(parse_title(sonde_data.title)[1]) for sonde_data in sonde_list],
+                    dtype='datetime64[s]')
+    values = pyema_regrid.regrid(sonde_list, levels, axis_v_type, variables)
+
+    return __make_section(time, values, levels, axis_v_type)
+
+
+def calc_section_archive(archive: SondeArchive, indices: np.ndarray, axis_v_type: str = 'p',
+                         levels: np.ndarray = None, variables: tuple = tuple(SECTION_VAR)) -> dict:
+    """
+    @brief:
+      アーカイブから必要なカラムだけを読み出して時間高度断面を求めます (SondeDataは作りません)
+    @param archive: アーカイブ
+    @param indices: 観測の番号 (SondeArchive.selectの戻り値など)
+    @return: calc_sectionと同じ
+    """
+    __check_variables(variables)
+
+    values = pyema_regrid.regrid_archive(archive, indices, levels, axis_v_type, variables)
+
+    return __make_section(np.asarray(archive.time[indices]), values, levels, axis_v_type)
+
+
+def load_section(station: str, time_from: datetime, time_to: datetime, axis_v_type: str = 'p',
+                 levels: np.ndarray = None, variables: tuple = tuple(SECTION_VAR), index=None, source=None,
+                 verbose: bool = True) -> dict:
+    """
+    @brief:
+      観測地点・期間の時間高度断面を求めます
+      索引(pyema_index.SondeIndex)にある観測はアーカイブから読み出し，索引にない定時観測(00Z・12Z)の期間だけを
+      取得元から読み出して補います
+    @param station: 観測地点番号
+    @param time_from: 観測時刻の開始 (UTC; この時刻を含む)
+    @param time_to: 観測時刻の終了 (UTC; この時刻を含む)
+    @param index: ローカルのアーカイブの索引 (Noneの場合は常に取得元から)
+    @param source: 取得元(pyema_source.SondeSource; Noneの場合はWyoming大学から月毎に一括取得)
+    @return: calc_sectionと同じ
+    """
+    if index is None:
+        entries, periods = [], [(time_from, time_to)]
+    else:
+        entries = index.query(station, time_from, time_to)
+        periods = index.missing_periods(station, time_from, time_to, entries=entries)
+
+    # アーカイブ毎に必要なカラムだけを読み出す
+    parts = []
+    for archive_path in sorted(set(entry[2] for entry in entries)):
+        indices = np.array([entry[3] for entry in entries if entry[2] == archive_path], dtype=np.int64)
+        parts.append(calc_section_archive(SondeArchive(archive_path), np.sort(indices), axis_v_type, levels,
+                                          variables))
+
+    # 索引にない期間は取得元から (索引にある観測は除く)
+    n_fetch = 0
+    if len(periods) > 0:
+        sonde_list = list(pyema_source.iter_sonde_periods(station, periods, source,
+                                                          [entry[1] for entry in entries], verbose))
+        n_fetch    = len(sonde_list)
+        if n_fetch > 0 or len(parts) <= 0:
+            parts.append(calc_section(sonde_list, axis_v_type, levels, variables))
+
+    # エコー
+    if verbose and index is not None:
+        print('[Archive    ] ' + station + ': ' + str(len(entries)) + ' soundings in archive, '
+              + str(n_fetch) + ' fetched (' + str(len(periods)) + ' missing periods)')
+
+    if len(parts) == 1:
+        return parts[0]
+
+    # 観測時刻順に連結
+    order   = np.argsort(np.concatenate([part['time'] for part in parts]), kind='stable')
+    section = {name: np.concatenate([part[name] for part in parts])[order] for name in ('time',) + tuple(variables)}
+    section['levels'] = parts[0]['levels']
+    section['axis_v'] = axis_v_type
+
+    return section
+
+
+def draw_section(ax, section: dict, var: str, kind: str = 'pcolormesh', contour: bool = True):
+    """
+    @brief:
+      時間高度断面を指定の座標軸に描画します (横軸: 観測時刻, 縦軸: 気圧または高度)
+    @param ax: 描画先の座標軸
+    @param section: calc_sectionの戻り値
+    @param var: 変数名 (SECTION_VAR)
+    @param kind: 描画方法 (pcolormesh, contourf)
+    @param contour: 等値線を重ねるか
+    @return: カラーバーの対象(QuadMesh または QuadContourSet)
+    """
+    if var not in SECTION_VAR:
+        raise ValueError('invalid section variable: ' + str(var))
+    if kind not in SECTION_KIND:
+        raise ValueError('invalid section kind: ' + str(kind))
+
+    label, cmap = SECTION_VAR[var]
+    time   = section['time']
+    levels = section['levels']
+    value  = section[var].T  # [格子, 観測時刻]
+
+    if kind == 'pcolormesh':
+        mappable = ax.pcolormesh(time, levels, value, cmap=cmap, shading='nearest')
+    else:
+        mappable = ax.contourf(time, levels, np.ma.masked_invalid(value), levels=20, cmap=cmap)
+
+    if contour and np.any(np.isfinite(value)):
+        cs = ax.contour(time, levels, np.ma.masked_invalid(value), levels=10, colors='k', linewidths=0.5)
+        ax.clabel(cs, fontsize=8, fmt='%.0f')
+
+    ax.figure.colorbar(mappable, ax=ax, label=label)
+
+    ax.set_xlabel('観測時刻 [UTC]', fontsize=12)
+    ax.set_ylabel(AXIS_V[section['axis_v']][1], fontsize=12)
+
+    # 気圧軸は上下反転
+    if (section['axis_v'] == 'p') != ax.yaxis_inverted():
+        ax.invert_yaxis()
+
+    ax.figure.autofmt_xdate()
+
+    return mappable
@@ -0,0 +1,234 @@
+import re
+from datetime import datetime, timezone
+import numpy as np
+import pyema_parser
+import pyema_util
+
+# タイトルの正規表現 (例: 47646 Tateno Observations at 00Z 01 Feb 2020; 観測地点番号はIGRA2の観測地点ID(英数字)も可)
+__RE_TITLE = re.compile(r'^\s*(\w+)\s.*Observations at (\d{2})Z (\d{1,2}) (\w{3}) (\d{4})')
+# 月の略称 (ロケールに依存しないよう自前で変換)
+__MONTH_ABBR = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+class SondeData:
+    """
+    @brief:
+      ラジオゾンデ観測データの構造体(カラム指向の2次元ndarray)
+      全カラムは同じ高度(行)で揃っており，欠測値はNaNです
+      data[カラム, 高度] はC連続なので，各カラムは連続メモリのビューになります
+      派生量(水蒸気圧・飽和混合比・飽和相当温位など)は初回参照時に求めてキャッシュします
+      キャッシュと観測データが食い違わないよう，dataは読み取り専用です
+      (変更はdataへの代入またはset_columnで行い，その際にキャッシュを破棄します)
+    """
+    __slots__ = ('title', '__data', '__cache')
+
+    def __init__(self, title: str, table: np.ndarray):
+        """
+        @param title: タイトル
+        @param table: 観測データ [高度, カラム] (shape=(n_level, N_COLUMN_SONDE_TXT))
+        """
+        if table.ndim != 2 or table.shape[1] != pyema_parser.N_COLUMN_SONDE_TXT:
+            raise ValueError('invalid table shape: ' + str(table.shape))
+
+        self.title = title
+        self.data  = table.T
+
+    def __len__(self) -> int:
+        return self.__data.shape[1]
+
+    @property
+    def data(self) -> np.ndarray:
+        """
+        @brief:
+          観測データ [カラム, 高度] (C連続; 読み取り専用)
+        """
+        return self.__data
+
+    @data.setter
+    def data(self, data: np.ndarray) -> None:
+        # 呼び出し側の配列を読み取り専用にしないよう，共有する場合は複製
+        arr = np.ascontiguousarray(data, dtype=np.float64)
+        if np.may_share_memory(arr, data):
+            arr = arr.copy()
+        arr.setflags(write=False)
+
+        self.__data  = arr
+        self.__cache = {}
+
+    def set_column(self, col: int, values: np.ndarray) -> None:
+        """
+        @brief:
+          1カラムの値を置き換えます (派生量のキャッシュは破棄します)
+        @param col: カラム番号 (pyema_parser.COL_*)
+        @param values: 値 (shape=(n_level,))
+        """
+        data = self.__data.copy()
+        data[col] = values
+        self.data = data
+
+    def is_cached(self, name: str) -> bool:
+        """
+        @brief:
+          派生量が計算済みか
+        @param name: 派生量の名前 (e, es, qs, rh, vtemp, theta_es)
+        """
+        return name in self.__cache
+
+    def __derived(self, name: str, func) -> np.ndarray:
+        # 派生量を初回だけ求めてキャッシュ (読み取り専用)
+        value = self.__cache.get(name)
+        if value is None:
+            value = func()
+            value.setflags(write=False)
+            self.__cache[name] = value
+        return value
+
+    @property
+    def table(self) -> np.ndarray:
+        """
+        @brief:
+          観測データ [高度, カラム] (dataの転置ビュー)
+        """
+        return self.__data.T
+
+    @property
+    def pres(self) -> np.ndarray:
+        # 気圧 [hPa]
+        return self.__data[pyema_parser.COL_PRES]
+
+    @property
+    def height(self) -> np.ndarray:
+        # ジオポテンシャル高度 [m]
+        return self.__data[pyema_parser.COL_HEIGHT]
+
+    @property
+    def temp(self) -> np.ndarray:
+        # 温度 [C]
+        return self.__data[pyema_parser.COL_TEMP]
+
+    @property
+    def dewtemp(self) -> np.ndarray:
+        # 露点温度 [C]
+        return self.__data[pyema_parser.COL_DEWTEMP]
+
+    @property
+    def relh(self) -> np.ndarray:
+        # 相対湿度 [%]
+        return self.__data[pyema_parser.COL_RELH]
+
+    @property
+    def mixr(self) -> np.ndarray:
+        # 混合比 [g/kg]
+        return self.__data[pyema_parser.COL_MIXR]
+
+    @property
+    def drct(self) -> np.ndarray:
+        # 風向 [deg]
+        return self.__data[pyema_parser.COL_DRCT]
+
+    @property
+    def sknt(self) -> np.ndarray:
+        # 風速 [knot]
+        return self.__data[pyema_parser.COL_SKNT]
+
+    @property
+    def theta(self) -> np.ndarray:
+        # 温位 [K]
+        return self.__data[pyema_parser.COL_THETA]
+
+    @property
+    def theta_e(self) -> np.ndarray:
+        # 相当温位 [K]
+        return self.__data[pyema_parser.COL_THETA_E]
+
+    @property
+    def vtheta(self) -> np.ndarray:
+        # 仮温位 [K]
+        return self.__data[pyema_parser.COL_VTHETA]
+
+    @property
+    def e(self) -> np.ndarray:
+        # 水蒸気圧 [hPa] (混合比・気圧から)
+        return self.__derived('e', lambda: pyema_util.calc_e(self.mixr / 1000.0, self.pres))
+
+    @property
+    def es(self) -> np.ndarray:
+        # 飽和水蒸気圧 [hPa] (気温から)
+        return self.__derived('es', lambda: pyema_util.calc_es_fast(self.temp + 273.15))
+
+    @property
+    def qs(self) -> np.ndarray:
+        # 飽和混合比 [g/kg] (mixrと同じ単位; pyema_util.calc_qs [kg/kg]の1000倍; 飽和水蒸気圧は共有)
+        return self.__derived('qs', lambda: 622.0 * self.es / (self.pres - self.es))
+
+    @property
+    def rh(self) -> np.ndarray:
+        # 相対湿度 [%] (水蒸気圧・飽和水蒸気圧から; 観測値はrelh)
+        return self.__derived('rh', lambda: 100.0 * self.e / self.es)
+
+    @property
+    def vtemp(self) -> np.ndarray:
+        # 仮温度 [C]
+        def calc() -> np.ndarray:
+            mixr = self.mixr / 1000.0  # 単位換算 [g/kg] -> [kg/kg]
+            return (self.temp + 273.15) * (1.0 + mixr / 0.622) / (1.0 + mixr) - 273.15
+        return self.__derived('vtemp', calc)
+
+    @property
+    def theta_es(self) -> np.ndarray:
+        # 飽和相当温位 [K]
+        return self.__derived('theta_es', lambda: pyema_util.calc_theta_es_fast(self.temp + 273.15, self.pres, self.e))
+
+
+def parse_sonde(title: str, sonde_txt: list) -> SondeData:
+    """
+    @brief:
+      ラジオゾンデ観測データ(text形式)をパースしてSondeData形式で返します
+    @param title: タイトル
+    @param sonde_txt: <pre>ブロックの各行
+    @return: ラジオゾンデ観測データ
+    """
+    # 一括デコード [高度, カラム] (空白セルはNaN)
+    table = pyema_parser.decode_sonde_text(sonde_txt)
+
+    # 気温が記録されていない高度はスキップ
+    table = table[~np.isnan(table[:, pyema_parser.COL_TEMP])]
+
+    return SondeData(title.strip(), table)
+
+
+def parse_title(title: str) -> tuple:
+    """
+    @brief:
+      タイトルから観測地点番号と観測時刻(UTC)を取り出します
+    @param title: タイトル (例: 47646 Tateno Observations at 00Z 01 Feb 2020)
+    @return: (観測地点番号 (WMOの番号 または IGRA2の観測地点ID), 観測時刻)
+    """
+    m = __RE_TITLE.match(title)
+    if m is None or m.group(4) not in __MONTH_ABBR:
+        raise ValueError('invalid title: ' + title)
+
+    station, hour, day, month, year = m.groups()
+
+    return station, datetime(int(year), __MONTH_ABBR.index(month) + 1, int(day), int(hour), tzinfo=timezone.utc)
+
+
+def format_title(station: str, name: str, obs_time: datetime) -> str:
+    """
+    @brief:
+      parse_titleで読み取れる形式のタイトルを作成します
+    @param station: 観測地点番号
+    @param name: 観測地点名
+    @param obs_time: 観測時刻 (UTC)
+    @return: タイトル (例: 47646 Tateno Observations at 00Z 01 Feb 2020)
+    """
+    return '%s %s Observations at %02dZ %02d %s %04d' % (station, name, obs_time.hour, obs_time.day,
+                                                         __MONTH_ABBR[obs_time.month - 1], obs_time.year)
+
+
+def calc_theta_es(sonde_data: SondeData) -> np.ndarray:
+    """
+    @brief:
+      飽和相当温位θe*(t,p)[K]を求めます (SondeData.theta_esと同じ; 計算済みの場合はキャッシュを返します)
+    """
+    return sonde_data.theta_es
@@ -0,0 +1,138 @@
+import abc
+from datetime import datetime
+from pyema_igra2 import Igra2Reader, find_igra2_file
+
+
+class SondeSource(abc.ABC):
+    """
+    @brief:
+      ラジオゾンデ観測データの取得元の基底クラス
+      取得元は観測地点・観測時刻を指定してSondeDataを返します (pyema.load_sonde, pyema_section.load_section,
+      pyema_climate.build_climatologyで使用; 期間の観測はpyema_archive.write_archiveでアーカイブにも保存できます)
+    """
+    @abc.abstractmethod
+    def load(self, station: str, obs_time: datetime):
+        """
+        @brief:
+          1つの観測を読み出します
+        @param station: 観測地点番号
+        @param obs_time: 観測時刻 (UTC)
+        @return: SondeData (観測がない場合はNone)
+        """
+
+    @abc.abstractmethod
+    def iter_sonde(self, station: str, time_from: datetime, time_to: datetime):
+        """
+        @brief:
+          期間の観測を観測時刻順に読み出します
+        @param station: 観測地点番号
+        @param time_from: 観測時刻の開始 (UTC; この時刻を含む)
+        @param time_to: 観測時刻の終了 (UTC; この時刻を含む)
+        @return: SondeDataのジェネレータ
+        """
+
+
+class WyomingSource(SondeSource):
+    """
+    @brief:
+      Wyoming大学のWebサイト(text形式)から取得します (pyema_fetch)
+    """
+    def __init__(self, cache=None, session=None, timeout=None, verbose: bool = True):
+        """
+        @param cache: ラジオゾンデ観測データのキャッシュ(pyema_cache.SondeCache)
+        @param session: セッション
+        @param timeout: タイムアウト [s]
+        @param verbose: エコーの有無
+        """
+        self.cache   = cache
+        self.session = session
+        self.timeout = timeout
+        self.verbose = verbose
+
+    def load(self, station: str, obs_time: datetime):
+        import pyema_fetch
+        from pyema_sonde import parse_sonde
+
+        ddhh = '%02d%02d' % (obs_time.day, obs_time.hour)
+        html = pyema_fetch.fetch_emagram_html(station, {'year': str(obs_time.year), 'month': str(obs_time.month),
+                                                        'time': ddhh},
+                                              self.cache, self.session, self.timeout, self.verbose)
+        blocks = pyema_fetch.split_emagram_html(html)
+        return parse_sonde(*blocks[0]) if len(blocks) > 0 else None
+
+    def iter_sonde(self, station: str, time_from: datetime, time_to: datetime):
+        import pyema_fetch
+
+        return pyema_fetch.iter_sonde_period(station, time_from, time_to, self.session, self.timeout, self.verbose)
+
+
+class ArchiveSource(SondeSource):
+    """
+    @brief:
+      ローカルのアーカイブから読み出します (pyema_index)
+    """
+    def __init__(self, index=None):
+        """
+        @param index: アーカイブの索引(pyema_index.SondeIndex; Noneの場合は既定の索引)
+        """
+        if index is None:
+            from pyema_index import get_default_index
+            index = get_default_index()
+        self.index = index
+
+    def load(self, station: str, obs_time: datetime):
+        return self.index.load(station, obs_time)
+
+    def iter_sonde(self, station: str, time_from: datetime, time_to: datetime):
+        return self.index.iter_sonde(self.index.query(station, time_from, time_to))
+
+
+class Igra2Source(SondeSource):
+    """
+    @brief:
+      ローカルのIGRA2の観測地点毎の観測データファイルから読み出します (pyema_igra2; ネットワークは使用しません)
+    """
+    def __init__(self, directory: str):
+        """
+        @param directory: 観測データファイル(例: JAM00047646-data.txt)のディレクトリ
+        """
+        self.directory = directory
+
+    def __reader(self, station: str) -> Igra2Reader:
+        path = find_igra2_file(self.directory, station)
+        if path is None:
+            raise FileNotFoundError('IGRA2 data file not found: ' + station)
+        return Igra2Reader(path)
+
+    def load(self, station: str, obs_time: datetime):
+        return self.__reader(station).load(obs_time)
+
+    def iter_sonde(self, station: str, time_from: datetime, time_to: datetime):
+        return self.__reader(station).iter_sonde(time_from, time_to)
+
+
+def iter_sonde_periods(station: str, periods: list, source: SondeSource = None, exclude=(), verbose: bool = True):
+    """
+    @brief:
+      複数の期間の観測を取得元から順に読み出します (索引にない観測だけを補う場合などに使用)
+    @param station: 観測地点番号
+    @param periods: [(期間の開始, 期間の終了), ...] (UTC; 両端を含む; pyema_index.SondeIndex.missing_periodsの戻り値など)
+    @param source: 取得元 (Noneの場合はWyoming大学から月毎に一括取得)
+    @param exclude: 除外する観測時刻(UTC)の集合 (索引にある観測など)
+    @param verbose: エコーの有無
+    @return: SondeDataのジェネレータ
+    """
+    from pyema_archive import to_datetime64
+    from pyema_sonde import parse_title
+
+    exclude = set(to_datetime64(obs_time) for obs_time in exclude)
+    for time_from, time_to in periods:
+        if source is None:
+            import pyema_fetch
+            sonde_iter = pyema_fetch.iter_sonde_period(station, time_from, time_to, verbose=verbose)
+        else:
+            sonde_iter = source.iter_sonde(station, time_from, time_to)
+
+        for sonde_data in sonde_iter:
+            if to_datetime64(parse_title(sonde_data.title)[1]) not in exclude:
+                yield sonde_data
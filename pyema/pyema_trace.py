@@ -0,0 +1,160 @@
+import contextlib
+import json
+import os
+import threading
+import time
+import uuid
+
+# 処理段階の名前 (run_pyemaの処理順)
+STAGE_NAME = (
+    'source',   # 指定した取得元(pyema_source.SondeSource)からの読み出し
+    'archive',  # ローカルのアーカイブの検索
+    'cache',    # キャッシュの参照
+    'http',     # HTTPリクエスト (latency: 応答ヘッダまでの時間 [s], bytes: 受信バイト数)
+    'extract',  # <h2>・<pre>タグの抽出
+    'parse',    # 観測データのパース (rows: 行数, rows_per_s: 1秒あたりの行数)
+    'derive',   # 派生量(飽和相当温位・気候値の鉛直分布)の算出
+    'render'    # エマグラムの描画 (表示の待ち時間は含みません)
+)
+
+
+class PipelineTrace:
+    """
+    @brief:
+      処理段階毎の所要時間・データ量を記録します
+      段階の終了毎に記録(dict)をフック関数に渡し，JSON Lines形式のログにも1行ずつ書き込みます
+      記録: {'run': 実行ID, 'stage': 段階名, 'start': 開始時刻 (UNIX時刻 [s]), 'time': 所要時間 [s], 段階毎の情報}
+      profile_pathを指定した場合は，段階の実行中だけcProfileで計測して終了時に保存します (表示の待ち時間は含みません)
+    """
+    def __init__(self, hooks=(), log_path: str = None, profile_path: str = None):
+        """
+        @param hooks: フック関数 hook(記録) のイテラブル
+        @param log_path: ログ(JSON Lines)の出力先 (追記; Noneの場合は出力しない)
+        @param profile_path: cProfileの統計の出力先 (pstatsで読み込めます; Noneの場合は計測しない)
+        """
+        self.run_id       = uuid.uuid4().hex
+        self.records      = []
+        self.hooks        = list(hooks)
+        self.log_path     = log_path
+        self.profile_path = profile_path
+
+        self.__lock     = threading.Lock()
+        self.__depth    = 0
+        self.__profiler = None
+        if profile_path is not None:
+            import cProfile
+            self.__profiler = cProfile.Profile()
+
+    def add_hook(self, hook) -> None:
+        """
+        @brief:
+          フック関数を追加します
+        @param hook: hook(記録)
+        """
+        self.hooks.append(hook)
+
+    @contextlib.contextmanager
+    def stage(self, name: str, **info):
+        """
+        @brief:
+          withブロックを1つの処理段階として計測します
+          ブロック内で戻り値のdictに段階毎の情報(bytes, rowsなど)を追加できます (rowsがあればrows_per_sも記録)
+        @param name: 段階名 (STAGE_NAME)
+        @param info: 段階毎の情報
+        @return: 段階毎の情報(dict)
+        """
+        self.__enable_profile()
+        start = time.time()
+        begin = time.perf_counter()
+        try:
+            yield info
+        finally:
+            elapsed = time.perf_counter() - begin
+            self.__disable_profile()
+
+            record = dict({'run': self.run_id, 'stage': name, 'start': start, 'time': elapsed}, **info)
+            if 'rows' in info and elapsed > 0.0:
+                record['rows_per_s'] = info['rows'] / elapsed
+            self.emit(record)
+
+    def emit(self, record: dict) -> None:
+        """
+        @brief:
+          記録を保存してフック関数・ログに渡します
+        """
+        with self.__lock:
+            self.records.append(record)
+            if self.log_path is not None:
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+
+        for hook in self.hooks:
+            hook(record)
+
+    def __enable_profile(self) -> None:
+        # 入れ子の段階は外側の段階でまとめて計測
+        if self.__profiler is None:
+            return
+        with self.__lock:
+            self.__depth += 1
+            if self.__depth == 1:
+                self.__profiler.enable()
+
+    def __disable_profile(self) -> None:
+        if self.__profiler is None:
+            return
+        with self.__lock:
+            self.__depth -= 1
+            if self.__depth == 0:
+                self.__profiler.disable()
+
+    def summary(self) -> dict:
+        """
+        @brief:
+          段階毎の所要時間の合計 [s]
+        """
+        total = {}
+        for record in self.records:
+            total[record['stage']] = total.get(record['stage'], 0.0) + record['time']
+        return total
+
+    def close(self) -> None:
+        """
+        @brief:
+          cProfileの統計を保存します
+        """
+        if self.__profiler is not None:
+            dir_name = os.path.dirname(self.profile_path)
+            if len(dir_name) > 0:
+                os.makedirs(dir_name, exist_ok=True)
+            self.__profiler.dump_stats(self.profile_path)
+
+
+def trace_stage(trace: PipelineTrace, name: str, **info):
+    """
+    @brief:
+      traceがNoneの場合も使えるPipelineTrace.stage (Noneの場合は計測しません)
+    @return: withブロックで段階毎の情報(dict)を返すコンテキストマネージャ
+    """
+    if trace is None:
+        return contextlib.nullcontext(info)
+    return trace.stage(name, **info)
+
+
+def create_trace(param: dict):
+    """
+    @brief:
+      run_pyemaのparamから計測を作成します
+        - param['trace']: フック関数 または そのリスト
+        - param['trace_log']: ログ(JSON Lines)の出力先
+        - param['profile']: cProfileの統計の出力先
+    @return: PipelineTrace (いずれも指定がない場合はNone)
+    """
+    hooks = param.get('trace')
+    if callable(hooks):
+        hooks = [hooks]
+
+    if hooks is None and param.get('trace_log') is None and param.get('profile') is None:
+        return None
+
+    return PipelineTrace(hooks or (), param.get('trace_log'), param.get('profile'))
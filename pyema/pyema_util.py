@@ -1,5 +1,16 @@
+import importlib.util
 import numpy as np
 
+# Bolton(1980)の飽和水蒸気圧の係数
+__G0 = -2.9912729e3
+__G1 = -6.0170128e3
+__G2 =  1.887643854e1
+__G3 = -2.8354721e-2
+__G4 =  1.7838301e-5
+__G5 = -8.4150417e-10
+__G6 =  4.4412543e-13
+__G7 =  2.858487e0
+
 
 def calc_e(mixr: np.ndarray, p: np.ndarray) -> np.ndarray:
     """
@@ -75,3 +86,275 @@ def calc_theta_es(t: np.ndarray, p: np.ndarray, e: np.ndarray) -> np.ndarray:
     cpd   = 1004.0  # 乾燥空気の定圧比熱 [J/kg/K]
     lv    = 2.50e6  # 蒸発の潜熱 [J/kg]
     return t*np.power(p0/(p-e), kappa) * np.exp((lv/cpd)*(calc_qs(t, p)/t))
+
+
+# ----------------------------------------------------------------------------
+# 高速版 (calc_es, calc_qs, calc_theta_esと同じ式; 上記の関数を参照実装とします)
+#   - 多項式はHorner法で評価し，np.powerによる一時配列を作りません
+#   - 飽和水蒸気圧は1回だけ計算して共有します
+#   - out=で出力先の配列を指定すると，その配列に結果を書き込みます (入力と同じ配列も指定できます)
+#   - jit=Trueでnumbaがあればufunc(JITコンパイル)で計算します
+#     numbaのexp/logはnumpyのSIMD版より遅く，通常は配列演算版(jit=False)の方が速いので既定では使いません
+#     (pyema_bench.bench_kernelで比較できます; 実測でcalc_theta_es_fastは配列演算版の約0.7〜0.9倍)
+# ----------------------------------------------------------------------------
+def __es_scalar(t: float) -> float:
+    # 飽和水蒸気圧es(t)[hPa] (スカラー版; JIT用)
+    inv = 1.0 / t
+    poly = (((__G6*t + __G5)*t + __G4)*t + __G3)*t + __G2 + (__G0*inv + __G1)*inv + __G7*np.log(t)
+    return np.exp(poly) / 100.0
+
+
+def __qs_scalar(t: float, p: float) -> float:
+    # 飽和混合比qs(t,p)[-] (スカラー版; JIT用)
+    es = __es_scalar(t)
+    return 0.622*es / (p - es)
+
+
+def __theta_es_scalar(t: float, p: float, e: float) -> float:
+    # 飽和相当温位θe*(t,p-e)[K] (スカラー版; JIT用)
+    return t*((1000.0/(p - e))**0.286) * np.exp((2.50e6/1004.0)*(__qs_scalar(t, p)/t))
+
+
+# JIT版が使用可能か (numbaは初回使用時にimportします)
+HAS_JIT = importlib.util.find_spec('numba') is not None
+
+# JIT版のufunc (初回使用時にコンパイル)
+__jit_kernel = {}
+
+
+def __get_jit_kernel(name: str):
+    # JIT版のufuncを取得します
+    if len(__jit_kernel) <= 0:
+        import numba
+
+        # ufunc内から呼び出すスカラー関数もJITコンパイル
+        g = globals()
+        for func_name in ('__es_scalar', '__qs_scalar', '__theta_es_scalar'):
+            g[func_name] = numba.njit(cache=True)(g[func_name])
+
+        __jit_kernel['es']       = numba.vectorize(['float64(float64)'], cache=True)(g['__es_scalar'])
+        __jit_kernel['qs']       = numba.vectorize(['float64(float64, float64)'], cache=True)(g['__qs_scalar'])
+        __jit_kernel['theta_es'] = numba.vectorize(['float64(float64, float64, float64)'],
+                                                   cache=True)(g['__theta_es_scalar'])
+
+    return __jit_kernel[name]
+
+
+def calc_es_fast(t: np.ndarray, out: np.ndarray = None, jit: bool = False, table: bool = False) -> np.ndarray:
+    """
+    絶対温度t[K]に対応する飽和水蒸気圧es(t)[hPa]を求めます (calc_esの高速版)
+    @param t: 絶対温度 [K]
+    @param out: 出力先 (Noneの場合は新たに確保)
+    @param jit: JIT版を使用するか (numbaがない場合は無視; 通常は配列演算版より遅い)
+    @param table: 数表版(calc_es_table)を使用するか
+    @return es: 飽和水蒸気圧 [hPa]
+    @reference: Bolton, MWR, 1980, EQ.9
+    """
+    if table:
+        return calc_es_table(t, out=out)
+
+    if jit and HAS_JIT:
+        kernel = __get_jit_kernel('es')
+        return kernel(t, out=out) if out is not None else kernel(t)
+
+    t = np.asarray(t, dtype=np.float64)
+    if t.ndim == 0 and out is None:
+        return calc_es_fast(t.reshape(1))[0]
+
+    # 出力先が入力と重なる場合は，書き込みで壊れないよう入力を複製
+    if out is not None and np.may_share_memory(out, t):
+        t = t.copy()
+
+    # g6*t^4 + g5*t^3 + g4*t^2 + g3*t + g2 (Horner法)
+    out = np.multiply(t, __G6, out=out)
+    out += __G5
+    out *= t
+    out += __G4
+    out *= t
+    out += __G3
+    out *= t
+    out += __G2
+
+    # g0*t^-2 + g1*t^-1 = (g0/t + g1)/t
+    inv = np.reciprocal(t)
+    buf = np.multiply(inv, __G0)
+    buf += __G1
+    buf *= inv
+    out += buf
+
+    # g7*log(t)
+    np.log(t, out=buf)
+    buf *= __G7
+    out += buf
+
+    np.exp(out, out=out)
+    out /= 100.0
+
+    return out
+
+
+def calc_qs_fast(t: np.ndarray, p: np.ndarray, out: np.ndarray = None, jit: bool = False,
+                 table: bool = False) -> np.ndarray:
+    """
+    絶対温度t[K]と気圧p[hPa]に対応する飽和混合比qs(t,p)[-]を求めます (calc_qsの高速版)
+    @param t: 絶対温度 [K]
+    @param p: 気圧 [hPa]
+    @param out: 出力先 (Noneの場合は新たに確保)
+    @param jit: JIT版を使用するか (numbaがない場合は無視; 通常は配列演算版より遅い)
+    @param table: 飽和水蒸気圧に数表版(calc_es_table)を使用するか
+    @return qs: 飽和混合比 [-]
+    @reference: 吉崎・加藤, 豪雨・豪雪の気象学, p.30, EQ.3.10
+    """
+    if jit and HAS_JIT and not table:
+        kernel = __get_jit_kernel('qs')
+        return kernel(t, p, out=out) if out is not None else kernel(t, p)
+
+    if np.ndim(t) == 0 and np.ndim(p) == 0 and out is None:
+        return calc_qs_fast(np.reshape(t, 1), np.reshape(p, 1), table=table)[0]
+
+    eps = 0.622  # 水の分子量Mv/乾燥大気の平均分子量Md [-]
+
+    if out is None:
+        out = np.empty(np.broadcast(t, p).shape)
+
+    # 飽和水蒸気圧は1回だけ計算
+    es  = calc_es_fast(t, table=table)
+    np.subtract(p, es, out=out)
+    np.divide(es, out, out=out)
+    out *= eps
+
+    return out
+
+
+def calc_theta_es_fast(t: np.ndarray, p: np.ndarray, e: np.ndarray, out: np.ndarray = None,
+                       jit: bool = False, table: bool = False) -> np.ndarray:
+    """
+    絶対温度t[K]，気圧p[hPa]，水蒸気圧e[hPa]に対応する飽和相当温位θe*(t,p-e)[K]を求めます (calc_theta_esの高速版)
+    @param t: 絶対温度 [K]
+    @param p: 気圧 [hPa]
+    @param e: 水蒸気圧 [hPa]
+    @param out: 出力先 (Noneの場合は新たに確保)
+    @param jit: JIT版を使用するか (numbaがない場合は無視; 通常は配列演算版より遅い)
+    @param table: 飽和水蒸気圧に数表版(calc_es_table)を使用するか
+    @return θe*: 飽和相当温位 [K]
+    @reference:吉崎・加藤, 豪雨・豪雪の気象学, p.34, EQ.3.22
+    """
+    if jit and HAS_JIT and not table:
+        kernel = __get_jit_kernel('theta_es')
+        return kernel(t, p, e, out=out) if out is not None else kernel(t, p, e)
+
+    if np.ndim(t) == 0 and np.ndim(p) == 0 and np.ndim(e) == 0 and out is None:
+        return calc_theta_es_fast(np.reshape(t, 1), np.reshape(p, 1), np.reshape(e, 1), table=table)[0]
+
+    p0    = 1000.0  # 基準気圧 [hPa]
+    kappa = 0.286   # rd/cpd
+    cpd   = 1004.0  # 乾燥空気の定圧比熱 [J/kg/K]
+    lv    = 2.50e6  # 蒸発の潜熱 [J/kg]
+
+    # t*exp((lv/cpd)*qs/t) (tはoutへの書き込み前に使い終える; outが入力と同じ配列でもよい)
+    buf = calc_qs_fast(t, p, table=table)
+    buf /= t
+    buf *= lv/cpd
+    np.exp(buf, out=buf)
+    buf *= t
+
+    if out is None:
+        out = np.empty(np.broadcast(t, p, e).shape)
+
+    # (p0/(p-e))^kappa
+    np.subtract(p, e, out=out)
+    np.divide(p0, out, out=out)
+    np.power(out, kappa, out=out)
+    out *= buf
+
+    return out
+
+
+# ----------------------------------------------------------------------------
+# 数表版 (飽和水蒸気圧es(t)を細かい温度格子で1回だけ計算し，線形補間で求めます)
+#   - 格子は温度0Kから等間隔(ES_TABLE_STEP)なので，格子番号はfloor(t/ES_TABLE_STEP)の直接計算で求まります
+#     (np.interpのような二分探索は行いません)
+#   - 格子毎に直線 es = a[i] + b[i]*(t/ES_TABLE_STEP) の係数を持ち，乗算1回・加算1回で補間します
+#   - 大きな配列はES_TABLE_BLOCK要素毎に処理して，一時配列をCPUキャッシュに収めます
+#   - 格子間隔0.01Kでcalc_esに対する相対誤差は最大ES_TABLE_MAX_ERROR以下です
+#     (線形補間の誤差は h^2/8*|es''| で，低温側ほど相対誤差が大きくなります)
+#   - 数表の範囲外(NaNを含む)の温度はcalc_es_fastで厳密に計算します
+# ----------------------------------------------------------------------------
+# 数表の温度範囲 [K] と格子間隔 [K] (背景線の湿潤断熱線(100hPaで約120K)まで含む範囲)
+ES_TABLE_T_MIN = 113.15
+ES_TABLE_T_MAX = 333.15
+ES_TABLE_STEP  = 0.01
+# 数表の相対誤差の上限 [-] (実測の最大値は低温端で約2.7e-6)
+ES_TABLE_MAX_ERROR = 3.0e-6
+# 一度に補間する要素数 (一時配列がL1/L2キャッシュに収まる大きさ)
+ES_TABLE_BLOCK = 4096
+
+# 数表 {'a': 切片, 'b': 傾き, 'i_min': 先頭の格子番号, 'n': 格子数} (初回使用時に作成)
+__es_table = {}
+
+
+def __get_es_table() -> dict:
+    # 飽和水蒸気圧の数表を取得します (数表のj番目は格子番号i_min+j = 温度(i_min+j)*ES_TABLE_STEP [K])
+    if len(__es_table) <= 0:
+        i_min = int(np.floor(ES_TABLE_T_MIN / ES_TABLE_STEP))
+        i_max = int(np.ceil (ES_TABLE_T_MAX / ES_TABLE_STEP))
+        index = np.arange(i_min, i_max + 2, dtype=np.float64)
+        es    = calc_es_fast(index * ES_TABLE_STEP)
+        b     = np.diff(es)
+
+        __es_table['a']     = es[:-1] - index[:-1] * b
+        __es_table['b']     = b
+        __es_table['i_min'] = i_min
+        __es_table['n']     = b.size
+    return __es_table
+
+
+def __lerp_es_table(t: np.ndarray, out: np.ndarray) -> None:
+    # 数表の線形補間 (1ブロック分; 範囲外の温度はcalc_es_fastで上書き)
+    table = __es_table
+    x = np.multiply(t, 1.0 / ES_TABLE_STEP)
+    with np.errstate(invalid='ignore'):
+        i = x.astype(np.intp)  # 切り捨て (NaNは範囲外の値になる)
+    i -= table['i_min']
+
+    # 範囲外(NaNを含む)は符号なしとみなすと格子数以上になるので，最大値1回で判定
+    outside = None
+    if i.size > 0 and i.view(np.uintp).max() >= table['n']:
+        outside  = i.view(np.uintp) >= table['n']
+        es_exact = calc_es_fast(t[outside])  # 出力先が入力と同じ配列でもよいよう書き込み前に計算
+        i[outside] = 0
+
+    np.multiply(table['b'][i], x, out=out)
+    out += table['a'][i]
+
+    if outside is not None:
+        out[outside] = es_exact
+
+
+def calc_es_table(t: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """
+    絶対温度t[K]に対応する飽和水蒸気圧es(t)[hPa]を数表の線形補間で求めます (calc_esの近似版)
+    相対誤差はES_TABLE_MAX_ERROR以下です (10^4要素以上の配列ではcalc_es_fastより速くなります)
+    @param t: 絶対温度 [K]
+    @param out: 出力先 (Noneの場合は新たに確保; 入力と同じ配列も指定できます)
+    @return es: 飽和水蒸気圧 [hPa]
+    """
+    t = np.asarray(t, dtype=np.float64)
+    if t.ndim == 0 and out is None:
+        return calc_es_table(t.reshape(1))[0]
+
+    __get_es_table()
+    if out is None:
+        out = np.empty(t.shape, dtype=np.float64)
+
+    # ES_TABLE_BLOCK毎に補間 (出力先が連続でなければ作業用の配列に求めてから書き込み)
+    t_flat     = t.reshape(-1)
+    contiguous = out.flags['C_CONTIGUOUS']
+    out_flat   = out.reshape(-1) if contiguous else np.empty(t_flat.size, dtype=np.float64)
+    for begin in range(0, t_flat.size, ES_TABLE_BLOCK):
+        __lerp_es_table(t_flat[begin:begin + ES_TABLE_BLOCK], out_flat[begin:begin + ES_TABLE_BLOCK])
+
+    if not contiguous:
+        out[...] = out_flat.reshape(out.shape)
+
+    return out
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# pyemaの各モジュールはpyemaディレクトリからの相対importなので，パスに追加します
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pyema'))
@@ -0,0 +1,159 @@
+import json
+import os
+import shutil
+from datetime import datetime
+import numpy as np
+import pytest
+import pyema_archive
+import pyema_parser
+from pyema_archive import SondeArchive, compact_archive, write_archive
+from pyema_index import SondeIndex
+from pyema_sonde import SondeData, format_title
+
+
+def make_sonde(station: str, obs_time: datetime, n_level: int = 3, value: float = 0.0) -> SondeData:
+    table = np.full((n_level, pyema_parser.N_COLUMN_SONDE_TXT), value, dtype=np.float64)
+    table[:, 0] = np.linspace(1000.0, 500.0, n_level)
+    return SondeData(format_title(station, 'Tateno', obs_time), table)
+
+
+def test_round_trip(tmp_path):
+    path  = str(tmp_path / 'archive')
+    sonde = [make_sonde('47646', datetime(2020, 2, day, 0), n_level=day) for day in (3, 1, 2)]
+
+    assert write_archive(path, sonde) == 3
+    archive = SondeArchive(path)
+    assert len(archive) == 3
+    assert [str(t) for t in archive.time] == ['2020-02-01T00:00:00', '2020-02-02T00:00:00', '2020-02-03T00:00:00']
+    assert len(archive.get(2)) == 3
+    assert archive.get(0).title == sonde[1].title
+
+
+def test_append_keeps_rows(tmp_path):
+    path = str(tmp_path / 'archive')
+    write_archive(path, [make_sonde('47646', datetime(2020, 2, day, 0), value=day) for day in (1, 2)])
+    segments = json.load(open(os.path.join(path, pyema_archive.META_FILE)))['segments']
+
+    write_archive(path, [make_sonde('47646', datetime(2020, 1, 31, 12), value=31.0)])
+    meta = json.load(open(os.path.join(path, pyema_archive.META_FILE)))
+
+    # 既存のセグメントは書き換えず，観測の番号も変わらない
+    assert meta['segments'][:-1] == segments
+    archive = SondeArchive(path)
+    assert len(archive) == 3
+    assert archive.get(0).data[1, 0] == 1.0
+    assert archive.get(2).data[1, 0] == 31.0
+
+    values, offset = archive.read_column('height', archive.select(time_to=datetime(2020, 2, 1)))
+    assert list(offset) == [0, 3, 6]
+    assert list(values) == [1.0] * 3 + [31.0] * 3
+
+
+def test_later_segment_replaces_observation(tmp_path):
+    path  = str(tmp_path / 'archive')
+    index = SondeIndex(str(tmp_path / 'index.sqlite3'))
+    write_archive(path, [make_sonde('47646', datetime(2020, 2, day, 0), value=day) for day in (1, 2)], index=index)
+    write_archive(path, [make_sonde('47646', datetime(2020, 2, 1, 0), value=99.0)], index=index)
+
+    archive = SondeArchive(path)
+    assert len(archive) == 3
+    assert list(archive.select()) == [1, 2]
+    assert [sonde_data.data[1, 0] for sonde_data in archive.iter_sonde()] == [2.0, 99.0]
+
+    # 索引は保存時に登録し直される
+    assert index.load('47646', datetime(2020, 2, 1, 0)).data[1, 0] == 99.0
+    assert len(index.query('47646')) == 2
+
+
+def test_compact_archive(tmp_path):
+    path = str(tmp_path / 'archive')
+    write_archive(path, [make_sonde('47646', datetime(2020, 2, 1, 0), value=1.0)])
+    write_archive(path, [make_sonde('47646', datetime(2020, 2, 1, 0), value=2.0),
+                         make_sonde('47646', datetime(2020, 2, 2, 0), value=3.0)])
+
+    assert compact_archive(path) == 2
+    meta = json.load(open(os.path.join(path, pyema_archive.META_FILE)))
+    assert len(meta['segments']) == 1
+    assert sorted(os.listdir(path)) == sorted([pyema_archive.META_FILE] + meta['segments'])
+
+    archive = SondeArchive(path)
+    assert [sonde_data.data[1, 0] for sonde_data in archive.iter_sonde()] == [2.0, 3.0]
+
+
+def test_interrupted_write_keeps_old_archive(tmp_path, monkeypatch):
+    path = str(tmp_path / 'archive')
+    write_archive(path, [make_sonde('47646', datetime(2020, 2, 1, 0))])
+
+    # セグメントを書き終えた後，meta.jsonの置き換え前に中断
+    def fail(*args):
+        raise OSError('interrupted')
+    monkeypatch.setattr(pyema_archive.os, 'replace', fail)
+    with pytest.raises(OSError):
+        write_archive(path, [make_sonde('47646', datetime(2020, 2, 2, 0))])
+    monkeypatch.undo()
+
+    archive = SondeArchive(path)
+    assert len(archive) == 1
+    assert archive.get(0).title == format_title('47646', 'Tateno', datetime(2020, 2, 1, 0))
+
+
+def test_read_version1_layout(tmp_path):
+    path = str(tmp_path / 'archive')
+    write_archive(path, [make_sonde('47646', datetime(2020, 2, day, 0), value=day) for day in (1, 2)])
+
+    # バージョン1: ディレクトリ直下に1組のファイル
+    meta    = json.load(open(os.path.join(path, pyema_archive.META_FILE)))
+    segment = os.path.join(path, meta['segments'][0])
+    for name in os.listdir(segment):
+        os.replace(os.path.join(segment, name), os.path.join(path, name))
+    os.rmdir(segment)
+    with open(os.path.join(path, pyema_archive.META_FILE), 'w') as f:
+        json.dump({'version': 1, 'columns': meta['columns'], 'n_sonde': 2, 'n_level': 6}, f)
+
+    assert [sonde_data.data[1, 0] for sonde_data in SondeArchive(path).iter_sonde()] == [1.0, 2.0]
+
+    # 追加すると2つ目のセグメントになり，置き換えるとディレクトリ直下のファイルは削除
+    write_archive(path, [make_sonde('47646', datetime(2020, 2, 3, 0), value=3.0)])
+    assert len(SondeArchive(path)) == 3
+    compact_archive(path)
+    assert not os.path.exists(os.path.join(path, 'station.npy'))
+    assert len(SondeArchive(path)) == 3
+
+
+def test_index_created_on_first_add(tmp_path):
+    path  = str(tmp_path / 'pyema' / 'index.sqlite3')
+    index = SondeIndex(path)
+
+    assert index.query('47646') == []
+    assert index.load('47646', datetime(2020, 2, 1, 0)) is None
+    assert not os.path.exists(os.path.dirname(path))
+
+    write_archive(str(tmp_path / 'archive'), [make_sonde('47646', datetime(2020, 2, 1, 0))], index=index)
+    assert os.path.isfile(path)
+    assert len(SondeIndex(path).query('47646')) == 1
+
+
+def test_index_detects_rewritten_archive(tmp_path):
+    path  = str(tmp_path / 'archive')
+    index = SondeIndex(str(tmp_path / 'index.sqlite3'))
+    write_archive(path, [make_sonde('47646', datetime(2020, 2, day, 0), value=day) for day in (1, 2, 3)], index=index)
+
+    # 索引を登録し直さずに置き換え (観測の番号がずれる)
+    write_archive(path, [make_sonde('47646', datetime(2020, 2, day, 0), value=day) for day in (2, 3)], append=False)
+
+    assert index.load('47646', datetime(2020, 2, 3, 0)).data[1, 0] == 3.0
+    assert index.load('47646', datetime(2020, 2, 1, 0)) is None
+
+    entries = index.query('47646')
+    assert [entry[1].day for entry in entries] == [2, 3]
+    assert [sonde_data.data[1, 0] for sonde_data in index.iter_sonde(entries)] == [2.0, 3.0]
+
+
+def test_index_skips_removed_archive(tmp_path):
+    path  = str(tmp_path / 'archive')
+    index = SondeIndex(str(tmp_path / 'index.sqlite3'))
+    write_archive(path, [make_sonde('47646', datetime(2020, 2, 1, 0))], index=index)
+
+    shutil.rmtree(path)
+    assert index.load('47646', datetime(2020, 2, 1, 0)) is None
+    assert index.query('47646') == []
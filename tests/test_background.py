@@ -0,0 +1,31 @@
+import os
+import numpy as np
+import pyema_background
+
+
+def test_disk_cache_round_trip(tmp_path):
+    lines = pyema_background.calc_background('t', 'p', cache_dir=str(tmp_path))
+
+    # 一時ファイルは残らない
+    files = os.listdir(str(tmp_path))
+    assert len(files) == 1 and files[0].endswith('.npz')
+
+    expected = pyema_background.calc_background('t', 'p')
+    for name in ('dry', 'moist', 'mixr', 'y'):
+        np.testing.assert_array_equal(lines[name], expected[name])
+        assert not lines[name].flags.writeable
+
+
+def test_broken_disk_cache_is_rebuilt(tmp_path):
+    pyema_background.calc_background('pt', 'z', cache_dir=str(tmp_path / 'a'))
+    name = os.listdir(str(tmp_path / 'a'))[0]
+
+    # 書き込み途中で中断したファイル
+    os.makedirs(str(tmp_path / 'b'))
+    with open(str(tmp_path / 'b' / name), 'wb') as f:
+        f.write(b'PK\x03\x04broken')
+
+    lines = pyema_background.calc_background('pt', 'z', cache_dir=str(tmp_path / 'b'))
+    np.testing.assert_array_equal(lines['moist'], pyema_background.calc_background('pt', 'z')['moist'])
+    with np.load(str(tmp_path / 'b' / name)) as npz:
+        assert sorted(npz.files) == ['dry', 'mixr', 'moist', 'y']
@@ -0,0 +1,23 @@
+import os
+from datetime import datetime
+import pyema_batch
+from test_section import FakeSource
+
+
+def test_render_uses_load_sonde(tmp_path):
+    getattr(pyema_batch, '__init_worker')(50.0, False)
+
+    records = []
+    param   = {'axis_h': {'type': 't', 'limit': None}, 'axis_v': {'type': 'p', 'limit': None},
+               'background': False, 'source': FakeSource(), 'trace': records.append}
+    base = getattr(pyema_batch, '__render')(('47646', '2020021712', param, str(tmp_path), ['png']))
+
+    assert os.path.isfile(base + '.png')
+    # 取得元の指定・計測はpyema.load_sondeと同じ
+    assert [record['stage'] for record in records] == ['source', 'render']
+
+
+def test_worker_session_has_retries():
+    getattr(pyema_batch, '__init_worker')(50.0, False)
+    session = getattr(pyema_batch, '__worker')['session']
+    assert session.get_adapter('http://example.com').max_retries.total > 0
@@ -0,0 +1,38 @@
+import locale
+import urllib.request
+from datetime import datetime, timezone
+import pytest
+import pyema_bench
+import pyema_fetch
+import pyema_parser
+from pyema_sonde import parse_title
+
+
+def test_make_title_round_trip():
+    obs_time = datetime(2020, 2, 1, 12, tzinfo=timezone.utc)
+    assert parse_title(pyema_bench.make_title('47646', obs_time)) == ('47646', obs_time)
+
+
+def test_make_title_ignores_locale():
+    obs_time = datetime(2020, 5, 1, 0, tzinfo=timezone.utc)
+    saved    = locale.setlocale(locale.LC_TIME)
+    try:
+        locale.setlocale(locale.LC_TIME, 'de_DE.UTF-8')
+    except locale.Error:
+        pytest.skip('de_DE locale not available')
+    try:
+        assert pyema_bench.make_title('47646', obs_time).endswith('00Z 01 May 2020')
+    finally:
+        locale.setlocale(locale.LC_TIME, saved)
+
+
+def test_replay_server_unpadded_day():
+    blocks = pyema_bench.make_month_blocks('47646', 2020, 2, 5)
+    with pyema_bench.ReplayServer(blocks):
+        url = pyema_fetch.URL_SONDE_TXT + '?STNM=47646&YEAR=2020&MONTH=2&FROM=100&TO=312'
+        with urllib.request.urlopen(url) as response:
+            html = response.read().decode('utf-8')
+
+    titles = [parse_title(title)[1] for title, _ in pyema_parser.iter_sonde_blocks([html])]
+    assert [(obs_time.day, obs_time.hour) for obs_time in titles] == [(1, 0), (1, 12), (2, 0), (2, 12),
+                                                                      (3, 0), (3, 12)]
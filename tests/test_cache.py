@@ -0,0 +1,64 @@
+import os
+import time
+import zlib
+from pyema_cache import SondeCache
+
+# 観測データ(<pre>タグ)を含むHTML
+HTML = '<h2>47646 Tateno Observations at 00Z 17 Feb 2020</h2><pre>\n' + 'x' * 1000 + '\n</pre>'
+
+
+def test_no_file_until_first_put(tmp_path):
+    path  = str(tmp_path / 'cache' / 'sonde_cache.sqlite3')
+    cache = SondeCache(path)
+
+    assert cache.get(('47646', '2020', '2', '1700')) is None
+    cache.clear()
+    assert not os.path.exists(os.path.dirname(path))
+
+    cache.put(('47646', '2020', '2', '1700'), HTML)
+    assert os.path.isfile(path)
+    assert SondeCache(path).get(('47646', '2020', '2', '1700')) == HTML
+
+
+def test_key_is_normalized(tmp_path):
+    cache = SondeCache(str(tmp_path / 'sonde_cache.sqlite3'))
+    cache.put(('47646', '2020', '2', '1700'), HTML)
+
+    assert cache.get(('47646', '2020', '02', '1700')) == HTML
+    assert cache.get(('47646', '2020', '2', '0117')) is None
+
+
+def test_latest_observation_expires(tmp_path):
+    cache = SondeCache(str(tmp_path / 'sonde_cache.sqlite3'), ttl_latest=0.0)
+    now   = time.gmtime()
+    key   = ('47646', str(now.tm_year), str(now.tm_mon), '%02d%02d' % (now.tm_mday, now.tm_hour))
+
+    cache.put(key, HTML)
+    time.sleep(0.01)
+    assert cache.get(key) is None
+
+
+def test_lru_eviction(tmp_path):
+    # 2件分の容量
+    size  = len(zlib.compress(HTML.encode('utf-8')))
+    cache = SondeCache(str(tmp_path / 'sonde_cache.sqlite3'), max_bytes=2 * size + size // 2)
+
+    cache.put(('47646', '2020', '2', '1700'), HTML)
+    time.sleep(0.01)
+    cache.put(('47646', '2020', '2', '1712'), HTML)
+    time.sleep(0.01)
+    assert cache.get(('47646', '2020', '2', '1700')) == HTML
+    time.sleep(0.01)
+    cache.put(('47646', '2020', '2', '1800'), HTML)
+
+    # 最終参照時刻が最も古いものから削除
+    assert cache.get(('47646', '2020', '2', '1712')) is None
+    assert cache.get(('47646', '2020', '2', '1700')) == HTML
+    assert cache.get(('47646', '2020', '2', '1800')) == HTML
+
+
+def test_skip_response_without_data(tmp_path):
+    cache = SondeCache(str(tmp_path / 'sonde_cache.sqlite3'))
+    cache.put(('47646', '2020', '2', '1700'), '<html>Can\'t get 47646 Tateno Observations</html>')
+
+    assert cache.get(('47646', '2020', '2', '1700')) is None
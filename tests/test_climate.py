@@ -0,0 +1,23 @@
+from datetime import datetime
+import numpy as np
+from pyema_archive import write_archive
+from pyema_climate import build_climatology
+from pyema_index import SondeIndex
+from test_archive import make_sonde
+from test_section import FakeSource
+
+
+def test_build_climatology_fetches_only_missing(tmp_path):
+    index = SondeIndex(str(tmp_path / 'index.sqlite3'))
+    write_archive(str(tmp_path / 'archive'),
+                  [make_sonde('47646', datetime(2020, 2, day, hour), value=1.0) for day in (1, 2) for hour in (0, 12)],
+                  index=index)
+
+    source = FakeSource()
+    clim   = build_climatology('47646', datetime(2020, 1, 31), datetime(2020, 2, 3, 12), levels=np.array([850.0]),
+                               index=index, source=source, verbose=False)
+
+    assert [(begin.month, begin.day, end.day) for begin, end in source.periods] == [(1, 31, 31), (2, 3, 3)]
+    assert clim.count['temp'][0, 0] == 2
+    assert clim.count['temp'][1, 0] == 6
+    assert np.isclose(clim.mean['temp'][1, 0], (4 * 1.0 - 2 * 1.0) / 6)
@@ -0,0 +1,49 @@
+import pyema_fetch
+
+
+def test_day_and_month_cover_all_hours(monkeypatch):
+    calls = []
+    monkeypatch.setattr(pyema_fetch, 'fetch_sonde_range',
+                        lambda station, year, month, time_from, time_to, **kwargs: calls.append((time_from, time_to)))
+
+    pyema_fetch.fetch_sonde_day('47646', '2020', '2', '1')
+    pyema_fetch.fetch_sonde_month('47646', '2020', '2')
+
+    # 最終日の18Zの観測も含む (iter_sonde_periodと同じ)
+    assert calls == [('0100', '0123'), ('0100', '2923')]
+
+
+def test_fetch_stations_errors(monkeypatch, capsys):
+    def fetch_emagram_html(station, *args, **kwargs):
+        if station == '47401':
+            raise ValueError('not published yet')
+        return '<h2>' + station + ' Observations at 00Z 17 Feb 2020</h2><pre></pre>'
+    monkeypatch.setattr(pyema_fetch, 'fetch_emagram_html', fetch_emagram_html)
+
+    errors  = {}
+    results = pyema_fetch.fetch_stations(['47401', '47646'], {'year': '2020', 'month': '2', 'time': '1700'},
+                                         verbose=False, errors=errors)
+
+    # 失敗した地点は結果に含めず，例外を返す (verbose=Falseでは何も出力しない)
+    assert list(results) == ['47646']
+    assert list(errors) == ['47401'] and isinstance(errors['47401'], ValueError)
+    assert capsys.readouterr().out == ''
+
+
+def test_load_sonde_sets_timeout(monkeypatch):
+    import pyema
+
+    calls = []
+    def fetch_emagram_html(station, obs_time, cache=None, session=None, timeout=None, verbose=True, trace=None):
+        calls.append((session, timeout))
+        return '<h2>' + station + ' Observations at 00Z 17 Feb 2020</h2><pre></pre>'
+    monkeypatch.setattr(pyema_fetch, 'fetch_emagram_html', fetch_emagram_html)
+
+    param = {'station': '47646', 'obs_time': {'year': '2020', 'month': '2', 'time': '1700'},
+             'archive': False, 'cache': False, 'verbose': False}
+    pyema.load_sonde(param)
+    pyema.load_sonde(dict(param, timeout=5.0))
+
+    # 既定ではタイムアウトとリトライ付きの共有セッションを使う
+    assert calls[0] == (pyema_fetch.get_default_session(), pyema_fetch.DEFAULT_TIMEOUT)
+    assert calls[1] == (pyema_fetch.get_default_session(), 5.0)
@@ -0,0 +1,55 @@
+from datetime import datetime, timezone
+import pytest
+from pyema_igra2 import Igra2Reader
+from pyema_source import Igra2Source, SondeSource
+from pyema_sonde import parse_title
+
+# データ行 (気圧 [Pa], 高度 [m], 気温 [0.1 C], 相対湿度 [0.1 %], 湿数 [0.1 C], 風向 [deg], 風速 [0.1 m/s])
+LEVELS = ((100000, 110, 150, 800, 20, 90, 50), (85000, 1500, 50, 700, 30, 180, 100),
+          (50000, 5800, -200, 500, 100, 270, 200))
+
+
+def write_igra2(path, igra_id: str, headers: list) -> None:
+    # headers: [(年, 月, 日, 観測時, 放球時刻), ...]
+    with open(path, 'w') as f:
+        for year, month, day, hour, reltime in headers:
+            f.write('#%s %4d %02d %02d %02d %04d %4d ncdc-gts ncdc-gts  361000 1401000\n'
+                    % (igra_id, year, month, day, hour, reltime, len(LEVELS)))
+            for press, gph, temp, rh, dpdp, wdir, wspd in LEVELS:
+                f.write('20 %5d %6dB%5dB%5dB%5d %5d %5d %5d\n' % (-8888, press, gph, temp, rh, dpdp, wdir, wspd))
+
+
+def test_missing_hour_and_release_time_is_skipped(tmp_path):
+    path = str(tmp_path / 'JAM00047646-data.txt')
+    write_igra2(path, 'JAM00047646', [(2020, 2, 1, 0, 9999), (2020, 2, 1, 99, 1130), (2020, 2, 2, 99, 9999),
+                                      (2020, 2, 3, 0, 9999)])
+
+    titles = [parse_title(sonde_data.title) for sonde_data in Igra2Reader(path).iter_sonde()]
+    assert [obs_time.strftime('%d%H') for _, obs_time in titles] == ['0100', '0111', '0300']
+    assert Igra2Reader(path).load(datetime(2020, 2, 2, 0)) is None
+
+
+def test_non_wmo_station_title_round_trip(tmp_path):
+    write_igra2(str(tmp_path / 'USW00014918-data.txt'), 'USW00014918', [(2020, 2, 1, 12, 9999)])
+
+    sonde_data = Igra2Source(str(tmp_path)).load('USW00014918', datetime(2020, 2, 1, 12))
+    assert parse_title(sonde_data.title) == ('USW00014918', datetime(2020, 2, 1, 12, tzinfo=timezone.utc))
+
+
+def test_sonde_source_is_abstract():
+    with pytest.raises(TypeError):
+        SondeSource()
+
+
+def test_header_without_levels(tmp_path):
+    path = str(tmp_path / 'JAM00047646-data.txt')
+    write_igra2(path, 'JAM00047646', [(2020, 2, 1, 0, 9999)])
+    with open(path) as f:
+        body = f.read()
+    with open(path, 'w') as f:
+        f.write('#JAM00047646 2020 01 31 12 9999    0 ncdc-gts ncdc-gts  361000 1401000\n' + body)
+
+    headers = list(Igra2Reader(path).iter_header(read_levels=True))
+    assert [header['numlev'] for header in headers] == [0, len(LEVELS)]
+    assert headers[0]['lines'].shape[0] == 0
+    assert [parse_title(sonde_data.title)[1].day for sonde_data in Igra2Reader(path).iter_sonde()] == [1]
@@ -0,0 +1,91 @@
+import numpy as np
+import pyema_parcel
+import pyema_parser
+from pyema_parcel import analyze_parcel, analyze_sonde, calc_parcel_profile, calc_td, select_parcel
+from pyema_sonde import SondeData
+
+P = np.array([1000.0, 950.0, 900.0, 850.0, 800.0, 700.0, 500.0, 300.0, 250.0, 200.0, 150.0, 100.0])
+# 浮力(空気塊 - 環境場) [K] (対数気圧について区分線形; 台形則の積分が厳密になる)
+BUOYANCY = np.array([0.0, -1.0, -1.0, 1.0, 2.0, 2.0, 2.0, 2.0, 2.0, 2.0, -1.0, -3.0])
+
+
+def unstable_profile() -> tuple:
+    # 地表(1000 hPa, 300 K, 露点295 K)の空気塊との気温差がBUOYANCYになる環境場
+    t_parcel, _, _ = calc_parcel_profile(P, 1000.0, 300.0, 295.0)
+    t  = t_parcel - BUOYANCY
+    td = t - 10.0
+    td[0] = 295.0
+    return P, t, td
+
+
+def stable_profile() -> tuple:
+    # 等温の環境場 (持ち上げた空気塊は常に環境場より低温)
+    t = np.full(P.shape, 300.0)
+    return P, t, t - 20.0
+
+
+def make_sonde_data(p: np.ndarray, t: np.ndarray, td: np.ndarray) -> SondeData:
+    table = np.full((p.size, pyema_parser.N_COLUMN_SONDE_TXT), np.nan)
+    table[:, pyema_parser.COL_PRES   ] = p
+    table[:, pyema_parser.COL_TEMP   ] = t - 273.15
+    table[:, pyema_parser.COL_DEWTEMP] = td - 273.15
+    return SondeData('47646 Tateno Observations at 00Z 17 Feb 2020', table)
+
+
+def test_stable_sounding():
+    result = analyze_parcel(*stable_profile())
+
+    assert result['cape'] == 0.0 and result['cin'] == 0.0
+    assert np.isnan(result['p_lfc']) and np.isnan(result['p_el'])
+
+
+def test_unstable_sounding_known_values():
+    result = analyze_parcel(*unstable_profile())
+    ln = np.log
+
+    # LFC: 900-850 hPaの間で浮力が-1 => +1 (中点), EL: 200-150 hPaの間で+2 => -1 (2/3の点)
+    p_lfc = np.sqrt(900.0 * 850.0)
+    p_el  = np.exp(ln(200.0) + 2.0/3.0 * (ln(150.0) - ln(200.0)))
+    cape  = pyema_parcel.RD * (0.25 * ln(900.0/850.0) + 1.5 * ln(850.0/800.0) + 2.0 * ln(800.0/200.0)
+                               + 2.0/3.0 * ln(200.0/150.0))
+    cin   = -pyema_parcel.RD * (0.5 * ln(1000.0/950.0) + ln(950.0/900.0) + 0.25 * ln(900.0/850.0))
+
+    assert result['p_lcl'] > 900.0
+    assert np.isclose(result['p_lfc'], p_lfc)
+    assert np.isclose(result['p_el'], p_el)
+    assert np.isclose(result['cape'], cape, rtol=1e-6)
+    assert np.isclose(result['cin'], cin, rtol=1e-6)
+
+
+def test_select_parcel():
+    p     = np.array([1000.0, 950.0, 900.0, 850.0, 700.0])
+    theta = np.array([300.0, 302.0, 304.0, 310.0, 320.0])
+    t     = theta * np.power(p / pyema_parcel.P0, pyema_parcel.KAPPA)
+    td    = calc_td(np.full(p.shape, 0.010), p)
+
+    # sb: 最下層
+    assert np.allclose(select_parcel(p, t, td, 'sb'), (1000.0, t[0], td[0]))
+
+    # ml: 最下層から100 hPaの層(1000-900 hPa)の平均温位・平均混合比で地表から
+    p0, t0, td0 = select_parcel(p, t, td, 'ml')
+    assert p0 == 1000.0
+    assert np.isclose(t0, 302.0)
+    assert np.isclose(td0, td[0], atol=0.05)  # calc_tdはcalc_esと異なる近似式の逆関数
+
+    # mu: 300 hPaの層で相当温位が最大の高度 (950 hPaだけを湿らせる)
+    td_mu = td.copy()
+    td_mu[1] = t[1] - 0.5
+    assert np.allclose(select_parcel(p, t, td_mu, 'mu'), (950.0, t[1], td_mu[1]))
+
+
+def test_batched_matches_single():
+    unstable = unstable_profile()
+    stable   = tuple(a[:7] for a in stable_profile())  # 高度数の違う観測 (NaNで埋める)
+    sonde    = [make_sonde_data(*unstable), make_sonde_data(*stable)]
+
+    for parcel in pyema_parcel.PARCEL_TYPE:
+        batch = analyze_sonde(sonde, parcel)
+        for i, sonde_data in enumerate(sonde):
+            single = analyze_sonde(sonde_data, parcel)
+            for name in ('p0', 't0', 'td0', 'p_lcl', 't_lcl', 'p_lfc', 'p_el', 'cape', 'cin'):
+                assert np.allclose(batch[name][i], single[name], equal_nan=True), (parcel, i, name)
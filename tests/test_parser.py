@@ -0,0 +1,89 @@
+from datetime import datetime, timezone
+import numpy as np
+import pytest
+import pyema_parser
+from pyema_sonde import format_title, parse_sonde, parse_title
+
+# <pre>ブロックの先頭(ヘッダ)
+HEADER = [
+    '',
+    '-' * pyema_parser.WORDS_LINE_SONDE_TXT,
+    '   PRES   HGHT   TEMP   DWPT   RELH   MIXR   DRCT   SKNT   THTA   THTE   THTV',
+    '    hPa     m      C      C      %    g/kg    deg   knot     K      K      K ',
+    '-' * pyema_parser.WORDS_LINE_SONDE_TXT
+]
+# データ行 (2行目は露点温度などが空白, 3行目は気温が空白)
+ROWS = [''.join(cell.rjust(pyema_parser.WORDS_COLUMN_SONDE_TXT) for cell in cells) for cells in (
+    ('1000.0', '31', '12.4', '8.1', '75', '6.82', '340', '5', '285.4', '304.6', '286.6'),
+    ('925.0', '705', '8.2', '', '', '', '', '', '290.0', '', ''),
+    ('900.0', '943', '', '', '', '', '', '', '', '', ''),
+    ('850.0', '1442', '2.6', '-5.4', '56', '3.28', '300', '25', '289.1', '299.0', '289.7')
+)]
+
+
+def test_decode_sonde_text_blank_cells():
+    table = pyema_parser.decode_sonde_text(HEADER + ROWS)
+
+    assert table.shape == (4, pyema_parser.N_COLUMN_SONDE_TXT)
+    assert table[0, pyema_parser.COL_PRES] == 1000.0
+    assert table[3, pyema_parser.COL_THETA_E] == 299.0
+    assert np.isnan(table[1, pyema_parser.COL_DEWTEMP])
+    assert table[1, pyema_parser.COL_THETA] == 290.0
+    assert np.isnan(table[2, pyema_parser.COL_TEMP])
+
+
+def test_decode_sonde_text_invalid_line():
+    with pytest.raises(ValueError):
+        pyema_parser.decode_sonde_text(HEADER + [ROWS[0] + ' '])
+
+
+def test_decode_sonde_text_matches_float():
+    # 符号・小数点の位置・桁数の異なるセル (2行目は右詰めでない・符号付きなどで汎用の変換になるセルを含む)
+    cells = [('0', '-0.0', '1013.2', '-54.3', '6.82', '.5', '-.5', '5.', '9999999', '-999999', '0.0001'),
+             ('1 ', '+5', '1e3', ' -7.25 ', '1.5', '', '-1', '', '', '', '')]
+    rows  = [''.join(cell.rjust(pyema_parser.WORDS_COLUMN_SONDE_TXT) for cell in row) for row in cells]
+
+    # 複数に分割して変換される行数
+    table    = pyema_parser.decode_sonde_text(HEADER + rows * 1500)
+    expected = np.array([[float(cell) if len(cell) > 0 else np.nan for cell in row] for row in cells])
+    np.testing.assert_array_equal(table, np.tile(expected, (1500, 1)))
+    assert np.signbit(table[0, 1])
+
+
+def test_decode_sonde_text_invalid_cell():
+    for cell in ('1.2.3', '1 2', '12-3', '-', '.', 'abc'):
+        row = cell.rjust(pyema_parser.WORDS_COLUMN_SONDE_TXT) + ROWS[0][pyema_parser.WORDS_COLUMN_SONDE_TXT:]
+        with pytest.raises(ValueError):
+            pyema_parser.decode_sonde_text(HEADER + [row])
+
+
+def test_parse_sonde_skips_missing_temp():
+    sonde_data = parse_sonde(' 47646 Tateno Observations at 00Z 17 Feb 2020 ', HEADER + ROWS)
+
+    assert sonde_data.title == '47646 Tateno Observations at 00Z 17 Feb 2020'
+    assert len(sonde_data) == 3
+    np.testing.assert_array_equal(sonde_data.pres, [1000.0, 925.0, 850.0])
+    assert sonde_data.data.flags['C_CONTIGUOUS']
+
+
+def test_iter_sonde_blocks_chunked():
+    html = ''.join('<H2>' + title + '</H2>\n<PRE>' + '\n'.join(HEADER + ROWS) + '\n</PRE><h3>info</h3>'
+                   for title in ('47646 Tateno Observations at 00Z 17 Feb 2020',
+                                 '47646 Tateno Observations at 12Z 17 Feb 2020'))
+
+    # 1文字ずつ渡しても同じ結果になる
+    expected = list(pyema_parser.iter_sonde_blocks([html]))
+    assert [title for title, _ in expected] == ['47646 Tateno Observations at 00Z 17 Feb 2020',
+                                                '47646 Tateno Observations at 12Z 17 Feb 2020']
+    assert expected[0][1][1:] == HEADER[1:] + ROWS
+    assert list(pyema_parser.iter_sonde_blocks(iter(html))) == expected
+
+
+def test_title_round_trip():
+    obs_time = datetime(2020, 2, 1, 12, tzinfo=timezone.utc)
+    title    = format_title('47646', 'Tateno', obs_time)
+
+    assert title == '47646 Tateno Observations at 12Z 01 Feb 2020'
+    assert parse_title(title) == ('47646', obs_time)
+    with pytest.raises(ValueError):
+        parse_title('47646 Tateno Observations at 12Z 01 Foo 2020')
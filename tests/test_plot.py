@@ -0,0 +1,30 @@
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import pyema_parcel
+import pyema_plot
+from test_parser import HEADER, ROWS
+from pyema_sonde import parse_sonde
+
+
+def test_lcl_marker():
+    sonde_data = parse_sonde('47646 Tateno Observations at 00Z 17 Feb 2020', HEADER + ROWS)
+    p_lcl, t_lcl = pyema_parcel.calc_lcl(12.4 + 273.15, 8.1 + 273.15, 1000.0)
+
+    fig, ax  = plt.subplots()
+    renderer = pyema_plot.EmagramRenderer(ax)
+    param    = {'axis_h': {'type': 't', 'limit': None}, 'axis_v': {'type': 'p', 'limit': None}}
+    renderer.update(sonde_data, param)
+    np.testing.assert_allclose(np.ravel(renderer.lcl.get_data()), [t_lcl - 273.15, p_lcl])
+    assert renderer.lcl.get_visible()
+
+    # 温位: LCLまでは地表の温位のまま
+    renderer.update(sonde_data, dict(param, axis_h={'type': 'pt', 'limit': None}, lcl=False))
+    np.testing.assert_allclose(renderer.lcl.get_xdata(), [(12.4 + 273.15) * np.power(1000.0 / 1000.0, 0.286)])
+    assert not renderer.lcl.get_visible()
+
+    # 高度: 観測の高度を対数気圧で補間
+    x, y = pyema_plot.calc_lcl_point(sonde_data, 't', 'z')
+    assert 31.0 < y[0] < 1442.0
+    plt.close(fig)
@@ -0,0 +1,62 @@
+import numpy as np
+import pyema_parser
+from pyema_regrid import STANDARD_LEVEL_P, concat_sonde, interp_csr, regrid
+from pyema_sonde import SondeData
+
+
+def make_sonde_data(pres: np.ndarray, temp: np.ndarray) -> SondeData:
+    table = np.full((pres.size, pyema_parser.N_COLUMN_SONDE_TXT), np.nan, dtype=np.float64)
+    table[:, pyema_parser.COL_PRES] = pres
+    table[:, pyema_parser.COL_TEMP] = temp
+    return SondeData('47646 Tateno Observations at 00Z 01 Feb 2020', table)
+
+
+def interp_log_p(pres: np.ndarray, values: np.ndarray, levels: np.ndarray) -> np.ndarray:
+    # 観測毎にnp.interpで対数気圧の線形補間 (観測の範囲外はNaN)
+    if pres.size < 2:
+        return np.full(levels.size, np.nan)
+    order = np.argsort(-np.log(pres))
+    return np.interp(-np.log(levels), -np.log(pres[order]), values[order], left=np.nan, right=np.nan)
+
+
+def test_regrid_matches_np_interp():
+    rng        = np.random.default_rng(0)
+    levels     = np.concatenate([[1050.0], STANDARD_LEVEL_P, [50.0]])
+    n_levels   = [0, 1, 2, 5, 30, 80]
+    sonde_list = []
+    for n_level in n_levels:
+        # 観測毎に範囲の異なる気圧 (地上気圧・最上層の気圧がばらつく)
+        top  = rng.uniform(80.0, 600.0)
+        pres = np.sort(rng.uniform(top, rng.uniform(900.0, 1020.0), n_level))[::-1]
+        sonde_list.append(make_sonde_data(pres, rng.normal(0.0, 20.0, n_level)))
+
+    result = regrid(sonde_list, levels, 'p', ('temp',))['temp']
+    assert result.shape == (len(n_levels), levels.size)
+
+    for i, sonde_data in enumerate(sonde_list):
+        expected = interp_log_p(sonde_data.pres, sonde_data.temp, levels)
+        assert np.array_equal(np.isnan(result[i]), np.isnan(expected))
+        assert np.allclose(result[i], expected, equal_nan=True)
+
+    # 高度が2未満の観測は全てNaN，範囲外はNaN
+    assert np.all(np.isnan(result[:2]))
+    assert np.all(np.isnan(result[:, 0])) and np.all(np.isnan(result[:, -1]))
+
+
+def test_interp_csr_unsorted_and_missing():
+    # 観測毎に任意の順序・座標の欠測を含む
+    x      = np.array([3.0, 1.0, np.nan, 2.0, 10.0, 0.0, 20.0])
+    y      = np.array([30.0, 10.0, 99.0, 20.0, 1.0, 0.0, 2.0])
+    offset = np.array([0, 4, 4, 7])
+    grid   = np.array([0.5, 1.5, 2.5, 15.0])
+
+    result = interp_csr(x, {'y': y}, offset, grid)['y']
+    assert np.allclose(result[0], [np.nan, 15.0, 25.0, np.nan], equal_nan=True)
+    assert np.all(np.isnan(result[1]))
+    assert np.allclose(result[2], [0.05, 0.15, 0.25, 1.5])
+
+
+def test_regrid_empty_list():
+    _, offset = concat_sonde([])
+    assert list(offset) == [0]
+    assert regrid([], STANDARD_LEVEL_P)['temp'].shape == (0, STANDARD_LEVEL_P.size)
@@ -0,0 +1,58 @@
+from datetime import datetime
+import numpy as np
+from pyema_archive import write_archive
+from pyema_index import SondeIndex
+from pyema_section import load_section
+from pyema_source import SondeSource
+from test_archive import make_sonde
+
+
+class FakeSource(SondeSource):
+    # 期間内の00Z・12Zの観測を返し，要求された期間を記録
+    def __init__(self):
+        self.periods = []
+
+    def load(self, station, obs_time):
+        return make_sonde(station, obs_time, value=-1.0)
+
+    def iter_sonde(self, station, time_from, time_to):
+        self.periods.append((time_from, time_to))
+        for obs_time in np.arange(np.datetime64(time_from.replace(tzinfo=None), 'h'),
+                                  np.datetime64(time_to.replace(tzinfo=None), 'h') + 1):
+            obs_time = obs_time.astype(datetime)
+            if obs_time.hour in (0, 12):
+                yield make_sonde(station, obs_time, value=-1.0)
+
+
+def test_load_section_fetches_only_missing(tmp_path):
+    index = SondeIndex(str(tmp_path / 'index.sqlite3'))
+    write_archive(str(tmp_path / 'archive'),
+                  [make_sonde('47646', datetime(2020, 1, 31, hour), value=1.0) for hour in (0, 12)]
+                  + [make_sonde('47646', datetime(2020, 2, day, hour), value=1.0) for day in (1, 2) for hour in (0, 12)],
+                  index=index)
+
+    source  = FakeSource()
+    section = load_section('47646', datetime(2020, 1, 30), datetime(2020, 2, 3, 12), levels=np.array([850.0]),
+                           variables=('temp',), index=index, source=source, verbose=False)
+
+    # 月毎の索引にない期間だけを取得
+    assert [(begin.day, begin.hour, end.day, end.hour) for begin, end in source.periods] == [(30, 0, 30, 12),
+                                                                                          (3, 0, 3, 12)]
+    assert list(section['time'].astype('datetime64[h]').astype(datetime)) == \
+        [datetime(2020, 1, 30, 0), datetime(2020, 1, 30, 12), datetime(2020, 1, 31, 0), datetime(2020, 1, 31, 12),
+         datetime(2020, 2, 1, 0), datetime(2020, 2, 1, 12), datetime(2020, 2, 2, 0), datetime(2020, 2, 2, 12),
+         datetime(2020, 2, 3, 0), datetime(2020, 2, 3, 12)]
+    assert list(section['temp'][:, 0]) == [-1.0] * 2 + [1.0] * 6 + [-1.0] * 2
+
+
+def test_load_section_fully_indexed(tmp_path):
+    index = SondeIndex(str(tmp_path / 'index.sqlite3'))
+    write_archive(str(tmp_path / 'archive'),
+                  [make_sonde('47646', datetime(2020, 2, 1, hour), value=1.0) for hour in (0, 12)], index=index)
+
+    source  = FakeSource()
+    section = load_section('47646', datetime(2020, 2, 1), datetime(2020, 2, 1, 12), levels=np.array([850.0]),
+                           variables=('temp',), index=index, source=source, verbose=False)
+
+    assert source.periods == []
+    assert list(section['temp'][:, 0]) == [1.0, 1.0]
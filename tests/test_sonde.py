@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+import pyema_parser
+import pyema_util
+from pyema_sonde import SondeData
+
+
+def make_sonde_data() -> SondeData:
+    table = np.zeros((3, pyema_parser.N_COLUMN_SONDE_TXT), dtype=np.float64)
+    table[:, pyema_parser.COL_PRES] = [1000.0, 850.0, 500.0]
+    table[:, pyema_parser.COL_TEMP] = [20.0, 10.0, -10.0]
+    table[:, pyema_parser.COL_MIXR] = [10.0, 5.0, 1.0]
+    return SondeData('47646 Tateno Observations at 00Z 01 Feb 2020', table)
+
+
+def test_qs_units():
+    sonde_data = make_sonde_data()
+    qs = pyema_util.calc_qs(sonde_data.temp + 273.15, sonde_data.pres)
+
+    # [g/kg] (calc_qsは[kg/kg])
+    assert np.allclose(sonde_data.qs, 1000.0 * qs, rtol=1e-4)
+
+
+def test_derived_is_cached():
+    sonde_data = make_sonde_data()
+    assert not sonde_data.is_cached('qs')
+    assert not sonde_data.is_cached('es')
+
+    qs = sonde_data.qs
+    assert sonde_data.is_cached('qs')
+    assert sonde_data.is_cached('es')
+    assert not sonde_data.is_cached('rh')
+    assert sonde_data.qs is qs
+    with pytest.raises(ValueError):
+        qs[0] = 0.0
+
+
+def test_set_column_clears_cache():
+    sonde_data = make_sonde_data()
+    es = sonde_data.es
+    rh = sonde_data.rh
+
+    sonde_data.set_column(pyema_parser.COL_TEMP, [25.0, 15.0, -5.0])
+    assert not sonde_data.is_cached('es')
+    assert not sonde_data.is_cached('rh')
+    assert np.all(sonde_data.es > es)
+    assert np.all(sonde_data.rh < rh)
+
+
+def test_assign_data_clears_cache():
+    sonde_data = make_sonde_data()
+    e = sonde_data.e
+
+    data = sonde_data.data.copy()
+    data[pyema_parser.COL_MIXR] *= 2.0
+    sonde_data.data = data
+    assert not sonde_data.is_cached('e')
+    assert np.allclose(sonde_data.e, 2.0 * e, rtol=0.02)
+
+    # 代入元の配列は読み取り専用にしない
+    assert data.flags.writeable
+    data[pyema_parser.COL_MIXR] = 0.0
+    assert np.all(sonde_data.mixr > 0.0)
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+import pyema_util
+
+
+@pytest.fixture
+def inputs():
+    rng = np.random.RandomState(0)
+    t   = rng.uniform(200.0, 310.0, 1000)
+    p   = rng.uniform(100.0, 1050.0, 1000)
+    e   = pyema_util.calc_es(t) * rng.uniform(0.1, 1.0, 1000)
+    return t, p, e
+
+
+@pytest.mark.parametrize('jit', [False, True])
+def test_fast_kernels_match_reference(inputs, jit):
+    t, p, e = inputs
+    np.testing.assert_allclose(pyema_util.calc_es_fast(t, jit=jit), pyema_util.calc_es(t), rtol=1e-12)
+    np.testing.assert_allclose(pyema_util.calc_qs_fast(t, p, jit=jit), pyema_util.calc_qs(t, p), rtol=1e-12)
+    np.testing.assert_allclose(pyema_util.calc_theta_es_fast(t, p, e, jit=jit), pyema_util.calc_theta_es(t, p, e),
+                               rtol=1e-12)
+
+
+@pytest.mark.parametrize('jit', [False, True])
+def test_out_aliased_to_input(inputs, jit):
+    t, p, e = inputs
+
+    # 出力先に入力と同じ配列を指定しても結果は変わらない
+    out = t.copy()
+    np.testing.assert_allclose(pyema_util.calc_es_fast(out, out=out, jit=jit), pyema_util.calc_es(t), rtol=1e-12)
+
+    for i_alias in range(2):
+        args = [t.copy(), p.copy()]
+        np.testing.assert_allclose(pyema_util.calc_qs_fast(*args, out=args[i_alias], jit=jit),
+                                   pyema_util.calc_qs(t, p), rtol=1e-12)
+
+    for i_alias in range(3):
+        args = [t.copy(), p.copy(), e.copy()]
+        np.testing.assert_allclose(pyema_util.calc_theta_es_fast(*args, out=args[i_alias], jit=jit),
+                                   pyema_util.calc_theta_es(t, p, e), rtol=1e-12)
+
+
+def test_scalar_input():
+    assert pyema_util.calc_es_fast(273.15) == pytest.approx(pyema_util.calc_es(273.15), rel=1e-12)
+    assert pyema_util.calc_theta_es_fast(273.15, 850.0, 2.0) == \
+        pytest.approx(pyema_util.calc_theta_es(273.15, 850.0, 2.0), rel=1e-12)
+
+
+def test_es_table_error_bound():
+    # 数表の範囲全体(格子間の点を含む)で相対誤差はES_TABLE_MAX_ERROR以下
+    t = np.linspace(pyema_util.ES_TABLE_T_MIN, pyema_util.ES_TABLE_T_MAX, 3 * 10**6 + 7)
+    error = np.abs(pyema_util.calc_es_table(t) / pyema_util.calc_es(t) - 1.0)
+    assert np.max(error) <= pyema_util.ES_TABLE_MAX_ERROR
+
+
+def test_es_table_outside_and_out():
+    t = np.array([100.0, np.nan, pyema_util.ES_TABLE_T_MIN, 250.0, pyema_util.ES_TABLE_T_MAX, 400.0] * 1000)
+    expected = pyema_util.calc_es(t)
+
+    # 範囲外は厳密に計算，NaNはNaN (ES_TABLE_BLOCKをまたぐ大きさ)
+    np.testing.assert_allclose(pyema_util.calc_es_table(t), expected, rtol=pyema_util.ES_TABLE_MAX_ERROR)
+    assert np.isnan(pyema_util.calc_es_table(t)[1])
+
+    # 入力と同じ配列・連続でない配列への出力
+    out = t.copy()
+    np.testing.assert_allclose(pyema_util.calc_es_table(out, out=out), expected, rtol=pyema_util.ES_TABLE_MAX_ERROR)
+    out = np.empty((t.size, 2))[:, 0]
+    pyema_util.calc_es_table(t, out=out)
+    np.testing.assert_allclose(out, expected, rtol=pyema_util.ES_TABLE_MAX_ERROR)
+
+    assert pyema_util.calc_es_table(273.15) == pytest.approx(6.112, rel=1e-3)
+
+
+def test_background_table():
+    import pyema_background
+
+    lines = pyema_background.calc_background('t', 'p', table=True)
+    np.testing.assert_allclose(lines['moist'], pyema_background.calc_background('t', 'p')['moist'], atol=1e-4)